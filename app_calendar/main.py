@@ -1,6 +1,16 @@
+import os
 import sys
-from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QListWidgetItem
-from PyQt6.QtCore import QDate
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QListWidgetItem, QInputDialog
+from PyQt6.QtCore import QDate, Qt
+
+try:
+    import diagnostics
+except ImportError:
+    # Started directly from the app folder, the shared modules live one level up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import diagnostics
+from diagnostics_panel import install_diagnostics_shortcut
+import takeout_archive
 
 try:
     # Case 1: Running directly
@@ -24,16 +34,41 @@ class CalendarApp(CalendarViewerUI):
         # NEW: Connect the bottom "Recent" list to jump to date
         self.recent_list.itemClicked.connect(self.on_recent_item_clicked)
 
+        # F12 opens the diagnostics panel when GTA_DIAGNOSTICS is set
+        install_diagnostics_shortcut(self)
+
         # Auto-load
         self.load_file_dialog()
 
     def load_file_dialog(self):
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Open Google Calendar ICS", "", "ICS Files (*.ics);;All Files (*)"
+            self, "Open Google Calendar ICS", "",
+            "ICS Files (*.ics);;Takeout archives (*.zip *.tgz *.tar.gz);;All Files (*)"
         )
+        if file_path and takeout_archive.is_archive(file_path):
+            file_path = self.choose_archive_member(file_path)
         if file_path:
             self.load_calendar(file_path)
 
+    def choose_archive_member(self, archive):
+        """Member path of the .ics file to open from a Takeout archive (asks if there are several)."""
+        try:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            names = takeout_archive.list_members(archive, (".ics",))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Could not read the archive: {e}")
+            return None
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if not names:
+            QMessageBox.warning(self, "Error", "No .ics files found in this archive.")
+            return None
+        if len(names) == 1:
+            return takeout_archive.member_path(archive, names[0])
+        name, ok = QInputDialog.getItem(self, "Open calendar", "Calendar:", names, 0, False)
+        return takeout_archive.member_path(archive, name) if ok else None
+
     def load_calendar(self, path):
         self.setWindowTitle("Calendar Viewer - Loading...")
         QApplication.processEvents()
@@ -66,8 +101,8 @@ class CalendarApp(CalendarViewerUI):
         for day_events in self.events_data.values():
             all_events.extend(day_events)
 
-        # 2. Sort by start date
-        all_events.sort(key=lambda x: x['start_dt'])
+        # 2. Sort by start date (all-day and timed events mixed are handled there)
+        all_events = CalendarParser.sorted_by_start(all_events)
 
         # 3. Add to list widget
         for evt in all_events:
@@ -1,9 +1,29 @@
 import vobject
 from datetime import datetime, date
 
+import diagnostics
+import takeout_archive
+
 
 class CalendarParser:
     @staticmethod
+    def iter_events(file_path):
+        """
+        Yields one event dictionary per VEVENT, in file order.
+        Streams the file, so memory use does not grow with the calendar size.
+        """
+        # file_path may also be a member of a Takeout archive, streamed from it
+        with takeout_archive.open_text(file_path, encoding='utf-8') as f:
+            # vobject.readComponents is a generator that yields top-level components
+            # We need to iterate through VCALENDAR then VEVENT
+            for calendar in vobject.readComponents(f):
+                for component in calendar.components():
+                    if component.name == 'VEVENT':
+                        yield CalendarParser._extract_event_data(component)
+
+    @staticmethod
+    @diagnostics.timed("calendar.parse_ics", items=lambda args, days: sum(map(len, days.values())),
+                       nbytes=lambda args, days: takeout_archive.path_size(args[0]))
     def parse_ics(file_path):
         """
         Parses ICS file and returns a dictionary:
@@ -15,24 +35,17 @@ class CalendarParser:
         events_by_date = {}
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                # vobject.readComponents is a generator that yields top-level components
-                # We need to iterate through VCALENDAR then VEVENT
-                for calendar in vobject.readComponents(f):
-                    for component in calendar.components():
-                        if component.name == 'VEVENT':
-                            event_data = CalendarParser._extract_event_data(component)
-
-                            # Group by Start Date (YYYY-MM-DD string) for easy lookup
-                            start_key = event_data['start_dt'].strftime('%Y-%m-%d')
+            for event_data in CalendarParser.iter_events(file_path):
+                # Group by Start Date (YYYY-MM-DD string) for easy lookup
+                start_key = event_data['start_dt'].strftime('%Y-%m-%d')
 
-                            if start_key not in events_by_date:
-                                events_by_date[start_key] = []
-                            events_by_date[start_key].append(event_data)
+                if start_key not in events_by_date:
+                    events_by_date[start_key] = []
+                events_by_date[start_key].append(event_data)
 
             # Sort events within each day by time
-            for date_key in events_by_date:
-                events_by_date[date_key].sort(key=lambda x: x['start_dt'])
+            for date_key, day_events in events_by_date.items():
+                events_by_date[date_key] = CalendarParser.sorted_by_start(day_events)
 
             return events_by_date
 
@@ -40,6 +53,25 @@ class CalendarParser:
             print(f"Error parsing ICS: {e}")
             return {}
 
+    @staticmethod
+    def sorted_by_start(events):
+        """
+        Events ordered by their start. A day that mixes all-day dates with timed events,
+        or floating with zoned times, cannot be compared that way (it used to fail the
+        whole calendar): it is ordered by day, all-day first, then by the instant of the start.
+        """
+        try:
+            return sorted(events, key=lambda x: x['start_dt'])
+        except TypeError:
+            return sorted(events, key=CalendarParser._start_sort_key)
+
+    @staticmethod
+    def _start_sort_key(event):
+        start = event['start_dt']
+        if not isinstance(start, datetime):
+            return (start, 0, 0.0)
+        return (start.date(), 1, start.timestamp())
+
     @staticmethod
     def _extract_event_data(component):
         """Helper to extract safe values from a VEVENT component"""
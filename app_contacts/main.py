@@ -1,6 +1,16 @@
 import sys
 import os
-from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QListWidgetItem
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QListWidgetItem, QInputDialog
+from PyQt6.QtCore import Qt
+
+try:
+    import diagnostics
+except ImportError:
+    # Started directly from the app folder, the shared modules live one level up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import diagnostics
+from diagnostics_panel import install_diagnostics_shortcut
+import takeout_archive
 
 try:
     # Case 1: Running this file directly (python app_contacts/main.py)
@@ -22,6 +32,9 @@ class ContactApp(ContactViewerUI):
         # Connect Signals
         self.contact_list.itemClicked.connect(self.on_contact_selected)
 
+        # F12 opens the diagnostics panel when GTA_DIAGNOSTICS is set
+        install_diagnostics_shortcut(self)
+
         # Auto-load file on startup
         self.load_file_dialog()
 
@@ -30,9 +43,12 @@ class ContactApp(ContactViewerUI):
             self,
             "Open Google Contacts VCF",
             "",
-            "VCF Files (*.vcf);;All Files (*)"
+            "VCF Files (*.vcf);;Takeout archives (*.zip *.tgz *.tar.gz);;All Files (*)"
         )
 
+        if file_path and takeout_archive.is_archive(file_path):
+            file_path = self.choose_archive_member(file_path)
+
         if file_path:
             self.load_contacts(file_path)
         else:
@@ -40,6 +56,25 @@ class ContactApp(ContactViewerUI):
             # For now, we just stay open.
             pass
 
+    def choose_archive_member(self, archive):
+        """Member path of the .vcf file to open from a Takeout archive (asks if there are several)."""
+        try:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            names = takeout_archive.list_members(archive, (".vcf",))
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Could not read the archive: {e}")
+            return None
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        if not names:
+            QMessageBox.warning(self, "Error", "No .vcf files found in this archive.")
+            return None
+        if len(names) == 1:
+            return takeout_archive.member_path(archive, names[0])
+        name, ok = QInputDialog.getItem(self, "Open contacts", "Contacts:", names, 0, False)
+        return takeout_archive.member_path(archive, name) if ok else None
+
     def load_contacts(self, path):
         self.contacts_data = ContactParser.parse_vcf(path)
 
@@ -0,0 +1,58 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class RenderedBodyCache:
+    """
+    LRU cache of rendered message HTML, bounded by memory (bytes) rather
+    than item count, so a few huge newsletters cannot push out hundreds of
+    short notes or blow up memory. Shared by the GUI and the prefetch thread.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Bumped by clear(), so a render started for the previous mailbox is not stored
+        self.generation = 0
+        self._items = OrderedDict()  # key -> (html, size)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, html, generation=None):
+        item_size = sys.getsizeof(html)
+        # Bigger than the whole budget: caching it would only evict everything else
+        if item_size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            self._items[key] = (html, item_size)
+            self.size += item_size
+
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+            self.generation += 1
@@ -0,0 +1,89 @@
+import re
+from array import array
+
+# Message-IDs are written as <local@domain>, several may share one header
+_MSGID_RE = re.compile(r"<([^<>\s]+)>")
+
+
+def parse_message_ids(value):
+    """All Message-IDs in a header value, without the angle brackets."""
+    if not value: return ()
+    return tuple(_MSGID_RE.findall(str(value)))
+
+
+def thread_headers(msg):
+    """
+    (message_id, references) of a parsed header block. references holds the
+    References chain followed by In-Reply-To, duplicates removed, oldest first.
+    """
+    own = parse_message_ids(msg.get('Message-ID'))
+    message_id = own[0] if own else ""
+
+    refs = []
+    for ref in parse_message_ids(msg.get('References')) + parse_message_ids(msg.get('In-Reply-To')):
+        if ref != message_id and ref not in refs:
+            refs.append(ref)
+    return message_id, tuple(refs)
+
+
+class ConversationIndex:
+    """
+    Groups messages into conversations with a union-find over Message-IDs.
+    Every message is joined with each ID it references, so the cost is one
+    dict lookup and a near constant union per reference, no pairwise matching.
+    A referenced message that is missing from the mailbox still links its replies.
+    Messages are added in row order; a row's thread is the root of its node.
+    """
+
+    def __init__(self):
+        self._node_by_id = {}
+        self._parent = array('I')  # node -> parent node (roots point to themselves)
+        self.row_nodes = array('I')  # row index -> node of its Message-ID
+        self._row_threads = None  # Cached roots per row, rebuilt after new rows
+
+    def __len__(self):
+        return len(self.row_nodes)
+
+    def _new_node(self):
+        node = len(self._parent)
+        self._parent.append(node)
+        return node
+
+    def _node(self, message_id):
+        node = self._node_by_id.get(message_id)
+        if node is None:
+            node = self._node_by_id[message_id] = self._new_node()
+        return node
+
+    def _find(self, node):
+        parent = self._parent
+        while parent[node] != node:
+            # Path halving keeps the trees flat without recursion
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a = self._find(a)
+        b = self._find(b)
+        if a != b:
+            # The older node stays the root, so root ids are stable while loading
+            if a < b:
+                self._parent[b] = a
+            else:
+                self._parent[a] = b
+
+    def add(self, message_id, references):
+        # A message without an ID is a conversation of its own
+        node = self._node(message_id) if message_id else self._new_node()
+        for ref in references:
+            self._union(node, self._node(ref))
+        self.row_nodes.append(node)
+        self._row_threads = None
+
+    def row_threads(self):
+        """Conversation id (root node) of every row, as an array indexed by row."""
+        if self._row_threads is None:
+            find = self._find
+            self._row_threads = array('I', [find(node) for node in self.row_nodes])
+        return self._row_threads
@@ -0,0 +1,186 @@
+import os
+import re
+import sqlite3
+from html.parser import HTMLParser
+
+import takeout_archive
+
+try:
+    from index_cache import sidecar_paths, file_prefix_fingerprint
+except ImportError:
+    from app_mail.index_cache import sidecar_paths, file_prefix_fingerprint
+
+FULLTEXT_SUFFIX = ".gtafts"
+FULLTEXT_VERSION = "1"
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML body (script/style are dropped)."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style", "head"):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style", "head") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(html)
+        extractor.close()
+    except Exception:
+        pass
+    return " ".join(extractor.parts)
+
+
+def build_match_query(text):
+    """Turns free text into an FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class FullTextIndex:
+    """
+    SQLite FTS5 index of sender, subject and body text, keyed by message key.
+    Lives next to the mbox (or in the user cache folder) and is dropped
+    automatically when the mbox size or mtime no longer match, unless messages
+    were only appended to the mbox (same prefix fingerprint): then indexing
+    simply resumes with the new messages.
+    """
+
+    def __init__(self, mbox_path):
+        self.mbox_path = os.path.abspath(mbox_path)
+        self.conn = self._connect()
+
+    def _signature(self):
+        size, mtime = takeout_archive.file_signature(self.mbox_path)
+        return f"{FULLTEXT_VERSION}:{size}:{mtime}"
+
+    def _connect(self):
+        signature = self._signature()
+        last_error = None
+        for db_path in sidecar_paths(self.mbox_path, FULLTEXT_SUFFIX):
+            try:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                conn = sqlite3.connect(db_path)
+                # WAL lets the GUI search while the indexer thread writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+                row = conn.execute("SELECT value FROM meta WHERE name='signature'").fetchone()
+                if row and row[0] != signature:
+                    if self._only_appended(conn):
+                        conn.execute("DELETE FROM meta WHERE name='complete'")
+                    else:
+                        conn.execute("DROP TABLE IF EXISTS bodies")
+                        conn.execute("DELETE FROM meta")
+
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS bodies USING fts5("
+                    "sender, subject, body, tokenize='unicode61 remove_diacritics 2')"
+                )
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+                size = takeout_archive.path_size(self.mbox_path)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('prefix', ?)",
+                             (f"{size}:{file_prefix_fingerprint(self.mbox_path, size)}",))
+                conn.commit()
+                return conn
+            except (OSError, sqlite3.Error) as e:
+                last_error = e
+        raise last_error
+
+    def _only_appended(self, conn):
+        """True if the mbox is the indexed file with messages appended."""
+        row = conn.execute("SELECT value FROM meta WHERE name='prefix'").fetchone()
+        if not row:
+            return False
+        size, _, fingerprint = row[0].partition(":")
+        return (int(size) < takeout_archive.path_size(self.mbox_path)
+                and file_prefix_fingerprint(self.mbox_path, int(size)) == fingerprint)
+
+    def next_key(self):
+        """Messages are indexed in key order, so this is where indexing resumes."""
+        row = self.conn.execute("SELECT MAX(rowid) FROM bodies").fetchone()
+        return (row[0] + 1) if row and row[0] is not None else 0
+
+    def is_complete(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE name='complete'").fetchone()
+        return bool(row and row[0] == "1")
+
+    def add_many(self, docs):
+        """docs: iterable of (key, sender, subject, body_text)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO bodies (rowid, sender, subject, body) VALUES (?, ?, ?, ?)", docs
+            )
+
+    def mark_complete(self):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+
+    def search(self, text, limit=5000):
+        """Returns message keys ordered by relevance (best first)."""
+        return [key for _, key in self.search_ranked(text, limit)]
+
+    def search_ranked(self, text, limit=5000):
+        """(bm25 rank, key) pairs, best (lowest rank) first."""
+        query = build_match_query(text)
+        if not query:
+            return []
+        try:
+            cursor = self.conn.execute(
+                "SELECT rank, rowid FROM bodies WHERE bodies MATCH ? ORDER BY rank LIMIT ?", (query, limit)
+            )
+            return cursor.fetchall()
+        except sqlite3.Error:
+            return []
+
+    def close(self):
+        self.conn.close()
+
+
+class FullTextIndexSet:
+    """
+    The full-text indexes of the mailboxes of a MailboxSet, one sidecar per file.
+    Keys are offset like the set's keys; results of all files are merged by rank.
+    """
+
+    def __init__(self, paths, bases):
+        self.indexes = []
+        try:
+            for path, base in zip(paths, bases):
+                self.indexes.append((base, FullTextIndex(path)))
+        except Exception:
+            self.close()
+            raise
+
+    def is_complete(self):
+        return all(index.is_complete() for _, index in self.indexes)
+
+    def search(self, text, limit=5000):
+        ranked = [(rank, base + key) for base, index in self.indexes
+                  for rank, key in index.search_ranked(text, limit)]
+        ranked.sort()
+        return [key for _, key in ranked[:limit]]
+
+    def close(self):
+        for _, index in self.indexes:
+            index.close()
+        self.indexes = []
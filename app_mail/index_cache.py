@@ -0,0 +1,258 @@
+import os
+import sys
+import mmap
+import json
+import hashlib
+from array import array
+
+import takeout_archive
+
+try:
+    from mime_parts import AttachmentEntry
+except ImportError:
+    from app_mail.mime_parts import AttachmentEntry
+
+# Bump whenever the layout of the stored rows or offsets changes,
+# old sidecar files are then simply ignored and rebuilt.
+INDEX_VERSION = 8
+INDEX_SUFFIX = ".gtaidx"
+# First line of a sidecar file: JSON header, no longer than this
+MAX_HEADER_BYTES = 64 * 1024
+
+# Prefix fingerprint: evenly spread sample blocks plus the tail of the indexed bytes
+FINGERPRINT_SAMPLES = 64
+FINGERPRINT_BLOCK = 4096
+FINGERPRINT_TAIL = 64 * 1024
+
+
+def user_cache_dir():
+    """Per-user cache folder used when the mbox folder is read-only."""
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "GoogleTakeoutAssistant")
+
+
+def sidecar_paths(mbox_path, suffix):
+    """Sidecar next to the mbox first, then the user cache folder (only that for an archive member)."""
+    mbox_path = os.path.abspath(mbox_path)
+    digest = hashlib.sha1(mbox_path.encode("utf-8", "replace")).hexdigest()
+    cached = os.path.join(user_cache_dir(), digest + suffix)
+    if takeout_archive.split_member_path(mbox_path)[1] is not None:
+        return [cached]
+    return [mbox_path + suffix, cached]
+
+
+def prefix_fingerprint(buf, size):
+    """
+    Fingerprint of buf[:size] (an mmap or bytes) that reads about 320 KB however
+    large the file is: the size, sample blocks spread over the range and its tail,
+    where the last indexed messages are.
+    """
+    digest = hashlib.sha1(str(size).encode("ascii"))
+    if size:
+        for i in range(FINGERPRINT_SAMPLES):
+            offset = i * size // FINGERPRINT_SAMPLES
+            digest.update(buf[offset:min(offset + FINGERPRINT_BLOCK, size)])
+        digest.update(buf[max(0, size - FINGERPRINT_TAIL):size])
+    return digest.hexdigest()
+
+
+def _pack_rows(rows):
+    """
+    Integer columns (key, date, size) as arrays and the text columns as JSON-ready
+    lists. Distinct label lists are stored once, references as one string (Message-IDs
+    have no spaces): a million small lists would make json.loads several times slower.
+    """
+    keys, epochs, sizes = array("q"), array("q"), array("q")
+    label_sets, label_ids = {}, []
+    columns = {"senders": [], "subjects": [], "labels": label_ids, "attachments": [],
+               "message_ids": [], "references": [], "recipients": []}
+    for key, sender, subject, epoch, labels, attachments, thread, recipients, size in rows:
+        keys.append(key)
+        epochs.append(epoch)
+        sizes.append(size)
+        columns["senders"].append(sender)
+        columns["subjects"].append(subject)
+        label_ids.append(label_sets.setdefault(labels, len(label_sets)))
+        columns["attachments"].append(attachments)
+        columns["message_ids"].append(thread[0])
+        columns["references"].append(" ".join(thread[1]))
+        columns["recipients"].append(recipients)
+    columns["label_sets"] = list(label_sets)
+    return (keys, epochs, sizes), columns
+
+
+def _unpack_rows(keys, epochs, sizes, columns):
+    """Rows from _pack_rows' columns, the same tuples that were saved."""
+    label_sets = [tuple(labels) for labels in columns["label_sets"]]
+    labels = [label_sets[i] for i in columns["labels"]]
+    attachments = [None if entries is None else tuple(AttachmentEntry._make(entry) for entry in entries)
+                   for entries in columns["attachments"]]
+    references = [tuple(refs.split()) if refs else () for refs in columns["references"]]
+    threads = list(zip(columns["message_ids"], references))
+    rows = list(zip(keys, columns["senders"], columns["subjects"], epochs, labels, attachments,
+                    threads, columns["recipients"], sizes))
+    if len(rows) != len(keys) or any(len(columns[name]) != len(keys) for name in columns if name != "label_sets"):
+        raise ValueError("column lengths differ")
+    return rows
+
+
+def file_prefix_fingerprint(path, size):
+    """prefix_fingerprint of a file's first `size` bytes, None if the file is shorter or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < size:
+                return None
+            if not size:
+                return prefix_fingerprint(b"", 0)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return prefix_fingerprint(mm, size)
+    except (OSError, ValueError):
+        return None
+
+
+class MboxIndexCache:
+    """
+    On-disk index for one mbox file.
+    Stores the byte range of every message plus the header rows shown in
+    the mail table, so an unchanged mailbox can be reopened without a rescan.
+    The file is a JSON header line, the integer columns as raw arrays and the
+    text columns as JSON: a sidecar can come with the mailbox (e.g. from an
+    archive or a shared folder), so nothing in it is ever executed.
+    The index is fully trusted if path, size and mtime still match. A file
+    that only grew (messages appended, e.g. a newer Takeout) keeps the index
+    of its first bytes, checked with a prefix fingerprint.
+    """
+
+    def __init__(self, mbox_path):
+        self.mbox_path = os.path.abspath(mbox_path)
+
+    def candidate_paths(self):
+        return sidecar_paths(self.mbox_path, INDEX_SUFFIX)
+
+    def _signature(self):
+        size, mtime = takeout_archive.file_signature(self.mbox_path)
+        return {"path": self.mbox_path, "size": size, "mtime": mtime}
+
+    def load(self, require_attachments=False):
+        """
+        Returns (starts, stops, rows, indexed_size) or None if no usable index exists.
+        indexed_size is None when the index covers the whole, unchanged file, otherwise
+        the index only covers the file's first indexed_size bytes (the file has grown).
+        With require_attachments, an index written without the attachment catalogue is ignored.
+        """
+        try:
+            signature = self._signature()
+        except OSError:
+            return None
+
+        for index_path in self.candidate_paths():
+            data = self._read(index_path)
+            if data is None or (require_attachments and not data.get("attachments")):
+                continue
+
+            if data.get("signature") == signature:
+                indexed_size = None
+            else:
+                indexed_size = self._grown_from(data, signature)
+                if indexed_size is None:
+                    continue
+
+            rows = self._read_rows(index_path, data)
+            if rows is None:
+                continue
+            return rows[0], rows[1], rows[2], indexed_size
+        return None
+
+    def _read(self, index_path):
+        """The header of a sidecar file, None if it is not one of this version."""
+        try:
+            with open(index_path, "rb") as f:
+                data = json.loads(f.readline(MAX_HEADER_BYTES))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        return data
+
+    def _read_rows(self, index_path, data):
+        """(starts, stops, rows) stored after the header, None if the file is damaged."""
+        try:
+            with open(index_path, "rb") as f:
+                f.readline(MAX_HEADER_BYTES)
+                starts, stops = array("q"), array("q")
+                starts.fromfile(f, data["messages"])
+                stops.fromfile(f, data["messages"])
+                keys, epochs, sizes = array("q"), array("q"), array("q")
+                for column in (keys, epochs, sizes):
+                    column.fromfile(f, data["rows"])
+                rows = _unpack_rows(keys, epochs, sizes, json.loads(f.read()))
+        except Exception:
+            return None
+        return starts, stops, rows
+
+    def _grown_from(self, data, signature):
+        """Size the index was written for, if the file is that file with bytes appended."""
+        prefix = data.get("prefix")
+        try:
+            if not prefix or data["signature"].get("path") != self.mbox_path:
+                return None
+            size = prefix["size"]
+            if not isinstance(size, int) or not 0 < size < signature["size"]:
+                return None
+            if file_prefix_fingerprint(self.mbox_path, size) != prefix["fingerprint"]:
+                return None
+        except (AttributeError, KeyError, TypeError):
+            return None  # Not a header this code wrote
+        return size
+
+    def save(self, starts, stops, rows, attachments=False, indexed_size=None):
+        """
+        Writes the index atomically. Returns the path used, or None.
+        indexed_size is the file size the boundaries were scanned at (default: the current size).
+        """
+        try:
+            signature = self._signature()
+        except OSError:
+            return None
+
+        if indexed_size is None:
+            indexed_size = signature["size"]
+        elif indexed_size != signature["size"]:
+            # The file grew during the scan: only usable as the index of its first bytes
+            signature = dict(signature, size=indexed_size, mtime=None)
+
+        fingerprint = file_prefix_fingerprint(self.mbox_path, indexed_size)
+        integer_columns, columns = _pack_rows(rows)
+        header = {
+            "version": INDEX_VERSION,
+            "signature": signature,
+            "prefix": {"size": indexed_size, "fingerprint": fingerprint} if fingerprint else None,
+            "attachments": attachments,
+            "messages": len(starts),
+            "rows": len(rows),
+        }
+
+        for index_path in self.candidate_paths():
+            tmp_path = index_path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                with open(tmp_path, "wb") as f:
+                    f.write(json.dumps(header).encode("ascii") + b"\n")
+                    array("q", starts).tofile(f)
+                    array("q", stops).tofile(f)
+                    for column in integer_columns:
+                        column.tofile(f)
+                    f.write(json.dumps(columns, separators=(",", ":")).encode("ascii"))
+                os.replace(tmp_path, index_path)
+                return index_path
+            except OSError:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return None
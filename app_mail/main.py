@@ -1,63 +1,483 @@
+import os
+import re
 import sys
-from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QHeaderView, QAbstractButton
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
+import json
+import html
+import time
+import threading
+import multiprocessing
+from collections import deque
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox, QHeaderView, QAbstractButton, QListWidgetItem
+from PyQt6.QtCore import QThread, QTimer, QUrl, pyqtSignal, Qt
+from PyQt6.QtWebEngineCore import QWebEngineScript, QWebEngineSettings
+
+try:
+    import diagnostics
+except ImportError:
+    # Started directly from the app folder, the shared modules live one level up
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import diagnostics
+from diagnostics_panel import install_diagnostics_shortcut
+import takeout_archive
 
 # Adjust imports based on your folder structure
 try:
-    from parser import MboxParser
-    from ui_layout import MailViewerUI
-    from model import EmailTableModel
+    from parser import message_base_url, STANDARD_FOLDERS
+    from ui_layout import MailViewerUI, AttachmentsDialogUI
+    from model import EmailTableModel, AttachmentTableModel
+    from parallel_scan import iter_source_batches, CHUNK_BYTES
+    from fulltext import FullTextIndex, FullTextIndexSet
+    from sources import MailboxSet, DuplicateFilter, find_mailboxes
+    from body_cache import RenderedBodyCache
+    from url_scheme import MessagePartSchemeHandler, register_url_scheme
+    from query import QueryError, is_structured, parse_query, query_fields
 except ImportError:
-    from app_mail.parser import MboxParser
-    from app_mail.ui_layout import MailViewerUI
-    from app_mail.model import EmailTableModel
+    from app_mail.parser import message_base_url, STANDARD_FOLDERS
+    from app_mail.ui_layout import MailViewerUI, AttachmentsDialogUI
+    from app_mail.model import EmailTableModel, AttachmentTableModel
+    from app_mail.parallel_scan import iter_source_batches, CHUNK_BYTES
+    from app_mail.fulltext import FullTextIndex, FullTextIndexSet
+    from app_mail.sources import MailboxSet, DuplicateFilter, find_mailboxes
+    from app_mail.body_cache import RenderedBodyCache
+    from app_mail.url_scheme import MessagePartSchemeHandler, register_url_scheme
+    from app_mail.query import QueryError, is_structured, parse_query, query_fields
+
+# Quiet time after the last keystroke before a search starts
+SEARCH_DEBOUNCE_MS = 200
+
+# Rows around the selected one rendered in the background
+PREFETCH_AHEAD = 3
+PREFETCH_BEHIND = 2
+
+# Messages larger than this are rendered progressively: the first piece at once,
+# the rest written into the page piece by piece (see BodyStream)
+PROGRESSIVE_BODY_BYTES = 512 * 1024
+# Encoded body bytes decoded per piece
+BODY_CHUNK_BYTES = 256 * 1024
+
+# Header loading: rows in the first batch (quick first paint), then the time
+# rows are collected per batch, and the batches the GUI may have queued
+FIRST_BATCH_ROWS = 50
+BATCH_INTERVAL_S = 0.1
+MAX_QUEUED_BATCHES = 2
 
 
 class HeaderLoaderThread(QThread):
+    """
+    Scans the headers of a MailboxSet and hands rows to the GUI thread in batches.
+    The first batch is small so the table fills at once; after that rows are
+    collected for BATCH_INTERVAL_S, so the GUI is updated at a steady rate
+    however fast the disk is. While the GUI has not yet handled
+    MAX_QUEUED_BATCHES batches, rows keep accumulating instead of queueing
+    more signals. Progress is the share of the files' bytes scanned.
+    With several mailboxes, copies of a message are dropped and their labels
+    reported through labels_merged. A refresh starts at `first_source`, the
+    mailboxes before it are already in the view.
+    """
     batch_loaded = pyqtSignal(list)
+    labels_merged = pyqtSignal(list)
     progress_updated = pyqtSignal(int)
     finished_loading = pyqtSignal(int)
 
-    def __init__(self, parser, total_count):
+    def __init__(self, mailboxes, workers=1, duplicates=None, first_source=0):
         super().__init__()
-        self.parser = parser
-        self.total_count = total_count
+        self.mailboxes = mailboxes
+        self.workers = workers
+        self.first_source = first_source
         self.is_running = True
+        # Passed in when rows are added to an existing view (refresh)
+        if duplicates is None and len(mailboxes.sources) > 1:
+            duplicates = DuplicateFilter(mailboxes)
+        self.duplicates = duplicates
+        # Backpressure: batches emitted by this thread / handled by the GUI (see batch_handled)
+        self.batches_emitted = 0
+        self.batches_handled = 0
+        self.last_emit = 0.0
+        # Emit times of batches not yet handled by the GUI thread (diagnostics only)
+        self.emit_times = deque()
 
     def run(self):
-        batch_size = 50
-        current_batch = []
+        self.last_emit = time.perf_counter()
+        first_source = self.first_source
+        sources = self.mailboxes.sources[first_source:]
+        bases = self.mailboxes.bases[first_source:]
+
+        # A process pool only pays off once there are several byte ranges to hand out
+        if self.workers > 1 and self.mailboxes.size > 2 * CHUNK_BYTES:
+            batches = iter_source_batches(sources, self.workers)
+        else:
+            batches = self._serial_batches(sources)
+
+        pending = []
+        merged = []
         count = 0
+        try:
+            for source, rows in batches:
+                if not self.is_running: break
+
+                base = bases[source]
+                if base:
+                    rows = [(row[0] + base,) + row[1:] for row in rows]
+                if self.duplicates:
+                    rows = self.duplicates.filter(rows, merged)
+
+                count += len(rows)
+                pending.extend(rows)
+                if self.batch_due(len(pending)):
+                    pending, merged = self.emit_batch(pending, merged)
+        finally:
+            # Shuts the process pool down right away if we stopped early
+            batches.close()
+
+        if (pending or merged) and self.is_running:
+            self.emit_batch(pending, merged)
+        self.finished_loading.emit(count)
 
-        for item in self.parser.get_headers_generator():
-            if not self.is_running: break
+    def _serial_batches(self, sources):
+        """Rows of one mailbox after the other, read in this thread."""
+        for source, parser in enumerate(sources):
+            for row in parser.get_headers_generator():
+                yield source, (row,)
+
+    def batch_due(self, pending_rows):
+        """True when the collected rows should go to the GUI now."""
+        if self.batches_emitted - self.batches_handled >= MAX_QUEUED_BATCHES:
+            return False  # GUI is behind, keep collecting
+        if not self.batches_emitted and pending_rows >= FIRST_BATCH_ROWS:
+            return True
+        return time.perf_counter() - self.last_emit >= BATCH_INTERVAL_S
+
+    def emit_batch(self, batch, merged):
+        """Sends the rows, merged labels and byte progress to the GUI. Returns new, empty lists."""
+        self.last_emit = time.perf_counter()
+        if diagnostics.ENABLED:
+            self.emit_times.append(self.last_emit)
+        self.batches_emitted += 1
+        self.batch_loaded.emit(batch)
+        if merged:
+            # After the rows: a copy may belong to a message of this very batch
+            self.labels_merged.emit(merged)
+
+        size = self.mailboxes.size
+        if batch and size:
+            # Rows are in file order, the last one tells how far the scan got
+            self.progress_updated.emit(int(self.mailboxes.scanned_bytes(batch[-1][0]) * 100 / size))
+        return [], []
+
+    def batch_handled(self):
+        """Called by the GUI thread once it has added a batch to the model."""
+        self.batches_handled += 1
 
-            current_batch.append(item)
-            count += 1
+    def stop(self):
+        self.is_running = False
 
-            if len(current_batch) >= batch_size:
-                self.batch_loaded.emit(current_batch)
-                current_batch = []
 
-                if self.total_count > 0:
-                    pct = int((count / self.total_count) * 100)
-                    self.progress_updated.emit(pct)
+class BodyIndexerThread(QThread):
+    """Feeds message bodies into the full-text index of each mailbox after the header scan."""
+    progress_updated = pyqtSignal(int)
+    finished_indexing = pyqtSignal(int)
 
-        if current_batch:
-            self.batch_loaded.emit(current_batch)
+    def __init__(self, mailboxes):
+        super().__init__()
+        self.mailboxes = mailboxes
+        self.is_running = True
 
-        self.finished_loading.emit(count)
+    def run(self):
+        batch_size = 200
+        count = 0
+        total = max(1, len(self.mailboxes))
+
+        for parser, base in zip(self.mailboxes.sources, self.mailboxes.bases):
+            if not self.is_running: break
+            batch = []
+            key_count = len(parser.scanner) if parser.scanner else 0
+
+            # SQLite connections belong to the thread that opened them
+            index = FullTextIndex(parser.filepath)
+            try:
+                for key in range(index.next_key(), key_count):
+                    if not self.is_running: break
+
+                    try:
+                        batch.append((key,) + parser.get_email_document(key))
+                    except Exception:
+                        continue
+                    count += 1
+
+                    if len(batch) >= batch_size:
+                        index.add_many(batch)
+                        batch = []
+                        self.progress_updated.emit(int(((base + key + 1) / total) * 100))
+
+                if batch:
+                    index.add_many(batch)
+                if self.is_running:
+                    index.mark_complete()
+            finally:
+                index.close()
+
+        self.finished_indexing.emit(count)
 
     def stop(self):
         self.is_running = False
 
 
+class SearchThread(QThread):
+    """Runs one search over the message store, off the GUI thread."""
+    results_ready = pyqtSignal(object)
+
+    def __init__(self, store, request):
+        super().__init__()
+        self.store = store
+        # (folder, search, rows, row_limit) from EmailTableModel.prepare_search
+        self.request = request
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        folder, search, rows, row_limit = self.request
+        if rows is None:
+            rows = range(row_limit)
+
+        result = self.store.filter_rows(folder, search, rows, cancelled=self.cancel_event.is_set)
+        if result is not None and not self.cancel_event.is_set():
+            self.results_ready.emit((folder, search, result, row_limit))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class SearchIndexThread(QThread):
+    """Builds the trigram index of senders and subjects after loading (MessageStore.build_search_index)."""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        self.store.build_search_index(cancelled=self.cancel_event.is_set)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class BodyPrefetchThread(QThread):
+    """
+    Renders the neighbours of the selected message into the body cache. A message
+    that cannot be read (mailbox reloaded meanwhile) is counted and skipped, and the
+    queue is dropped once the cache belongs to another mailbox.
+    """
+
+    def __init__(self, parser, cache):
+        super().__init__()
+        self.parser = parser
+        self.cache = cache
+        self.pending = []
+        self.generation = cache.generation  # Cache generation the pending keys belong to
+        self.condition = threading.Condition()
+        self.is_running = True
+
+    def schedule(self, keys):
+        """Replaces the queue, neighbours of an older selection are no longer interesting."""
+        with self.condition:
+            self.pending = list(keys)
+            self.generation = self.cache.generation
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.is_running and not self.pending:
+                    self.condition.wait()
+                if not self.is_running: break
+                if self.generation != self.cache.generation:
+                    # Another mailbox was opened, these keys belong to the old one
+                    self.pending = []
+                    continue
+                key = self.pending.pop(0)
+                generation = self.generation
+
+            try:
+                # Large messages are streamed when shown, rendering them ahead would not be cached anyway
+                if key in self.cache or self.parser.message_size(key) > PROGRESSIVE_BODY_BYTES:
+                    continue
+                self.cache.put(key, self.parser.get_email_body(key), generation)
+            except Exception as e:
+                diagnostics.count("mail.prefetch_errors")
+                print(f"Prefetch of message {key} failed: {e!r}", file=sys.stderr)
+
+    def stop(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify()
+
+
+class BodyStream:
+    """A large message being written into the web view, one piece in flight at a time."""
+
+    def __init__(self, key, pieces):
+        self.key = key
+        self.pieces = pieces
+        self.first = next(pieces, "")
+        self.written = 0  # Characters of HTML written so far
+        self.started = False  # Page loaded and reopened for writing
+        self.pending = None  # Next piece, held back at the body limit
+        self.unlimited = False  # "Load Full Message" lifts the limit
+
+
+def unique_export_path(folder, filename):
+    """Safe file name inside folder that does not overwrite an earlier export."""
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", filename).strip(" .") or "attachment"
+    stem, ext = os.path.splitext(name)
+    path = os.path.join(folder, name)
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(folder, f"{stem} ({counter}){ext}")
+        counter += 1
+    return path
+
+
+class AttachmentExportThread(QThread):
+    """Writes catalogued attachments to a folder, decoding each one in chunks."""
+    progress_updated = pyqtSignal(int)
+    finished_export = pyqtSignal(int, int)
+
+    def __init__(self, parser, entries, folder):
+        super().__init__()
+        self.parser = parser
+        self.entries = entries  # (message key, AttachmentEntry)
+        self.folder = folder
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        files = 0
+        total_bytes = 0
+        for i, (key, entry) in enumerate(self.entries):
+            if self.cancel_event.is_set(): break
+            path = unique_export_path(self.folder, entry.filename)
+            try:
+                written = self.parser.save_attachment(key, entry, path, self.cancel_event.is_set)
+            except OSError:
+                continue
+            if written is None:
+                # Cancelled half way, do not leave a truncated file behind
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                break
+            files += 1
+            total_bytes += written
+            self.progress_updated.emit(int(((i + 1) / len(self.entries)) * 100))
+
+        self.finished_export.emit(files, total_bytes)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class AttachmentsDialog(AttachmentsDialogUI):
+    """Lists the attachments of the messages in the current mail view and exports them."""
+
+    def __init__(self, parser, model, parent=None):
+        super().__init__(parent)
+        self.parser = parser
+        self.export_thread = None
+
+        self.table_model = AttachmentTableModel(model.store, model.get_attachments())
+        self.attachment_table.setModel(self.table_model)
+        self.attachment_table.setColumnWidth(0, 220)
+        self.attachment_table.setColumnWidth(1, 160)
+
+        if not model.store.attachments_catalogued:
+            self.lbl_info.setText("No attachment catalogue for this mailbox. Enable "
+                                  "'Catalogue attachments while scanning' and open the file again.")
+        else:
+            self.lbl_info.setText(f"{len(self.table_model.items)} attachments in the current view.")
+
+        self.btn_export_selected.clicked.connect(self.export_selected)
+        self.btn_export_all.clicked.connect(self.export_all)
+        self.btn_close.clicked.connect(self.close)
+
+    def export_selected(self):
+        rows = sorted({index.row() for index in self.attachment_table.selectionModel().selectedRows()})
+        self.start_export([self.table_model.items[r] for r in rows])
+
+    def export_all(self):
+        self.start_export(self.table_model.items)
+
+    def start_export(self, items):
+        """items: (store row, AttachmentEntry) pairs."""
+        if not items or (self.export_thread and self.export_thread.isRunning()):
+            return
+        folder = QFileDialog.getExistingDirectory(self, "Export attachments to")
+        if not folder:
+            return
+
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.lbl_info.setText(f"Exporting {len(items)} attachments...")
+        keys = self.table_model.store.keys
+        entries = [(keys[row], entry) for row, entry in items]
+        self.export_thread = AttachmentExportThread(self.parser, entries, folder)
+        self.export_thread.progress_updated.connect(self.progress_bar.setValue)
+        self.export_thread.finished_export.connect(self.on_export_finished)
+        self.export_thread.start()
+
+    def on_export_finished(self, files, total_bytes):
+        self.progress_bar.setVisible(False)
+        self.lbl_info.setText(f"Exported {files} attachments ({total_bytes // 1024} KB).")
+
+    def closeEvent(self, event):
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        event.accept()
+
+
 class MailApp(MailViewerUI):
     def __init__(self):
         super().__init__()
-        self.parser = MboxParser()
+        # One mailbox, or every mailbox of a Takeout folder merged into one view
+        self.parser = MailboxSet()
         self.loader_thread = None
         self.loading_notification = None
+        self.mbox_paths = []
+        self.total_messages = 0
+
+        # Full-text search (optional, see chk_fulltext)
+        self.fulltext = None
+        self.indexer_thread = None
+        # Trigram index for substring and fuzzy search of senders and subjects
+        self.search_index_thread = None
+
+        # Inline images and attachments are streamed from the mbox on request
+        self.part_handler = MessagePartSchemeHandler(self.parser, self)
+        self.part_handler.install(self.web_view.page().profile())
+        # Scripts in emails never run; progressive rendering uses its own script world
+        self.web_view.page().settings().setAttribute(QWebEngineSettings.WebAttribute.JavascriptEnabled, False)
+
+        # Rendered bodies of recently viewed and neighbouring messages
+        self.body_cache = RenderedBodyCache()
+        self.prefetcher = BodyPrefetchThread(self.parser, self.body_cache)
+        self.prefetcher.start()
+
+        # Large message currently written into the web view
+        self.body_stream = None
+        self.web_view.loadFinished.connect(self.on_body_page_loaded)
+        self.btn_load_full.clicked.connect(self.load_full_message)
+
+        # Debounced background search, a newer query cancels the running one
+        self.search_thread = None
+        self.finished_searches = []
+        self.query_note = ""
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+
+        # F12 opens the diagnostics panel when GTA_DIAGNOSTICS is set
+        install_diagnostics_shortcut(self)
 
         # References for our custom buttons
         self.btn_exit_app = None
@@ -75,20 +495,69 @@ class MailApp(MailViewerUI):
         self.mail_table.setColumnWidth(0, 200)
         self.mail_table.setColumnWidth(2, 140)
 
-        self.mail_table.clicked.connect(self.on_email_selected)
+        # Fires for mouse clicks and arrow keys alike
+        self.mail_table.selectionModel().currentRowChanged.connect(self.on_email_selected)
         self.search_input.textChanged.connect(self.on_search_changed)
-        self.folder_list.itemClicked.connect(self.on_folder_changed)
+        self.folder_list.itemSelectionChanged.connect(self.on_folder_changed)
+        self.chk_fulltext.toggled.connect(self.on_fulltext_toggled)
+        self.chk_threads.toggled.connect(self.model.set_thread_mode)
+        self.btn_open.clicked.connect(self.load_file_dialog)
+        self.btn_open_folder.clicked.connect(self.load_folder_dialog)
+        self.btn_refresh.clicked.connect(self.refresh_mailbox)
+        self.btn_attachments.clicked.connect(self.show_attachments)
 
         self.load_file_dialog()
 
     def load_file_dialog(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Open MBOX", "", "MBOX (*.mbox);;All (*)")
-        if file_path:
-            self.start_loading(file_path)
-        else:
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Open MBOX", "", "MBOX (*.mbox);;Takeout archives (*.zip *.tgz *.tar.gz);;All (*)")
+        if file_path and takeout_archive.is_archive(file_path):
+            # Every mailbox inside the archive, read without extracting it
+            self.open_mailboxes(file_path)
+        elif file_path:
+            self.start_loading([file_path])
+        elif not self.mbox_paths:
             sys.exit()
 
-    def start_loading(self, path):
+    def load_folder_dialog(self):
+        """Opens every .mbox file below a folder (e.g. an extracted Takeout export) together."""
+        folder = QFileDialog.getExistingDirectory(self, "Open Takeout folder")
+        if folder:
+            self.open_mailboxes(folder)
+
+    def open_mailboxes(self, location):
+        """Loads every .mbox file of a folder or Takeout archive as one merged view."""
+        try:
+            QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+            # Listing a .tgz reads it once (tar has no directory)
+            paths = find_mailboxes(location)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        if not paths:
+            QMessageBox.information(self, "Open folder", "No .mbox files found in this folder or archive.")
+            return
+        self.start_loading(paths)
+
+    def start_loading(self, paths):
+        if self.loader_thread:
+            # Drop the old loader's pending batches, they belong to the previous file
+            for signal in (self.loader_thread.batch_loaded, self.loader_thread.labels_merged,
+                           self.loader_thread.progress_updated, self.loader_thread.finished_loading):
+                signal.disconnect()
+            self.loader_thread.stop()
+            self.loader_thread.wait()
+            self.loader_thread = None
+        self.stop_body_indexing()
+        self.stop_search_index()
+        self.cancel_search()
+        self.prefetcher.schedule([])
+        self.body_cache.clear()
+        self.stop_body_stream()
+        self.mbox_paths = list(paths)
+
         # Reset UI
         self.model.clear()
         self.folder_list.clear()
@@ -121,14 +590,21 @@ class MailApp(MailViewerUI):
         QApplication.processEvents()
 
         try:
-            total = self.parser.load_mbox(path)
-            self.lbl_status.setText(f"Scanning {total} emails...")
+            self.parser.catalogue_attachments = self.chk_catalogue.isChecked()
+            total = self.parser.load(self.mbox_paths)
+            self.total_messages = total
+
+            # Unchanged single mailbox: rows come straight from the sidecar index
+            sources = self.parser.sources
+            if len(sources) == 1 and sources[0].cached_rows is not None:
+                self.model.add_rows(sources[0].cached_rows)
+                self.on_loading_finished(len(sources[0].cached_rows))
+                return
 
-            self.loader_thread = HeaderLoaderThread(self.parser, total)
-            self.loader_thread.batch_loaded.connect(self.on_batch_added)
-            self.loader_thread.progress_updated.connect(self.on_progress)
-            self.loader_thread.finished_loading.connect(self.on_loading_finished)
-            self.loader_thread.start()
+            files = f" in {len(sources)} mailboxes" if len(sources) > 1 else ""
+            self.lbl_status.setText(f"Scanning {total} emails{files}...")
+
+            self.start_loader_thread()
 
         except Exception as e:
             if self.loading_notification:
@@ -136,6 +612,45 @@ class MailApp(MailViewerUI):
             QMessageBox.critical(self, "Error", str(e))
             self.progress_bar.setVisible(False)
 
+    def start_loader_thread(self, duplicates=None, first_source=0):
+        self.loader_thread = HeaderLoaderThread(self.parser, self.workers_spin.value(), duplicates, first_source)
+        self.loader_thread.batch_loaded.connect(self.on_batch_added)
+        self.loader_thread.labels_merged.connect(self.model.merge_labels)
+        self.loader_thread.progress_updated.connect(self.on_progress)
+        self.loader_thread.finished_loading.connect(self.on_loading_finished)
+        self.loader_thread.start()
+
+    def refresh_mailbox(self):
+        """Adds the messages appended to the mailbox since it was opened, e.g. by a newer Takeout."""
+        if not self.mbox_paths or (self.loader_thread and self.loader_thread.isRunning()):
+            return
+        self.stop_body_indexing()
+        self.stop_search_index()
+
+        try:
+            added = self.parser.refresh()
+        except Exception:
+            added = None
+
+        if added is None:
+            # Changed in another way: load again, the sidecar index still covers the unchanged part
+            self.start_loading(self.mbox_paths)
+            return
+        if not added:
+            self.lbl_status.setText("No new messages.")
+            if self.chk_fulltext.isChecked():
+                self.start_body_indexing()
+            return
+
+        # Loaded rows stay in the model, only the new messages are parsed and appended
+        self.total_messages += added
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.lbl_status.setText(f"Loading {added} new emails...")
+        # Only the last mailbox grew, the loader starts there
+        self.start_loader_thread(self.loader_thread.duplicates if self.loader_thread else None,
+                                 len(self.parser.sources) - 1)
+
     def on_popup_action(self, button: QAbstractButton):
         """Handle custom buttons on the loading popup"""
 
@@ -156,7 +671,13 @@ class MailApp(MailViewerUI):
             self.lbl_status.setText("Loading continuing in background...")
 
     def on_batch_added(self, batch):
+        if diagnostics.ENABLED and self.loader_thread and self.loader_thread.emit_times:
+            # Time the batch spent queued between the loader thread and the GUI thread
+            sent = self.loader_thread.emit_times.popleft()
+            diagnostics.record("ui.batch_signal_latency", time.perf_counter() - sent, len(batch))
         self.model.add_rows(batch)
+        if self.loader_thread:
+            self.loader_thread.batch_handled()
 
     def on_progress(self, percent):
         self.progress_bar.setValue(percent)
@@ -166,62 +687,297 @@ class MailApp(MailViewerUI):
 
     def on_loading_finished(self, total_loaded):
         self.progress_bar.setVisible(False)
-        self.lbl_status.setText(f"Done. {total_loaded} emails loaded.")
+        duplicates = self.loader_thread.duplicates if self.loader_thread else None
+        merged = f" ({duplicates.dropped} copies in other mailboxes merged)" if duplicates else ""
+        self.lbl_status.setText(f"Done. {total_loaded} emails loaded{merged}.")
 
         # Close popup if it's still open
         if self.loading_notification:
             self.loading_notification.close()
             self.loading_notification = None
 
+        # Labels of copies in other mailboxes still collected by the store
+        self.model.store.flush_labels()
         self.refresh_folder_list()
+        self.start_search_index()
+
+        if self.chk_fulltext.isChecked():
+            self.start_body_indexing()
+
+    def start_search_index(self):
+        """Indexes the senders and subjects loaded so far, searches use the index as it grows."""
+        self.stop_search_index()
+        self.search_index_thread = SearchIndexThread(self.model.store)
+        self.search_index_thread.start()
+
+    def stop_search_index(self):
+        if self.search_index_thread and self.search_index_thread.isRunning():
+            self.search_index_thread.cancel()
+            self.search_index_thread.wait()
+        self.search_index_thread = None
+
+    def start_body_indexing(self):
+        """Opens the full-text index and fills in whatever is still missing."""
+        if not self.mbox_paths or (self.loader_thread and self.loader_thread.isRunning()):
+            return
+        if self.indexer_thread and self.indexer_thread.isRunning():
+            return
+
+        try:
+            if self.fulltext is None:
+                self.fulltext = FullTextIndexSet(self.parser.paths, self.parser.bases)
+        except Exception as e:
+            QMessageBox.warning(self, "Full-text search", f"Could not open the search index:\n{e}")
+            self.chk_fulltext.setChecked(False)
+            return
+
+        if self.fulltext.is_complete():
+            return
+
+        self.indexer_thread = BodyIndexerThread(self.parser)
+        self.indexer_thread.progress_updated.connect(self.on_indexing_progress)
+        self.indexer_thread.finished_indexing.connect(self.on_indexing_finished)
+        self.indexer_thread.start()
+
+    def stop_body_indexing(self):
+        if self.indexer_thread and self.indexer_thread.isRunning():
+            self.indexer_thread.stop()
+            self.indexer_thread.wait()
+        self.indexer_thread = None
+        if self.fulltext:
+            self.fulltext.close()
+            self.fulltext = None
+
+    def on_indexing_progress(self, percent):
+        self.lbl_status.setText(f"Indexing message bodies... {percent}%")
+
+    def on_indexing_finished(self, indexed):
+        self.lbl_status.setText(f"Full-text index ready ({indexed} new messages indexed).")
+        # Results may have been partial while indexing was running
+        self.run_search()
+
+    def on_fulltext_toggled(self, checked):
+        if checked:
+            self.start_body_indexing()
+        self.run_search()
 
     def refresh_folder_list(self):
+        # Counts are the lengths of the label posting lists, nothing is scanned
         counts = self.model.get_folder_counts()
-        current_item = self.folder_list.currentItem()
-        selected_name = current_item.text().split(" (")[0] if current_item else "Inbox"
+        selected_names = self.selected_labels() or ["Inbox"]
 
+        # One filter update after the rebuild, not one per restored selection
+        self.folder_list.blockSignals(True)
         self.folder_list.clear()
 
-        total_items = sum(counts.values())
-        self.folder_list.addItem(f"All ({total_items})")
-
-        std_folders = ["Inbox", "Sent", "Drafts", "Spam", "Trash", "Archived"]
-        for f in std_folders:
+        self.add_folder_item("All", len(self.model.store))
+        for f in STANDARD_FOLDERS:
             c = counts.get(f, 0)
             if c > 0:
-                self.folder_list.addItem(f"{f} ({c})")
-
-        items = self.folder_list.findItems(selected_name, Qt.MatchFlag.MatchStartsWith)
-        if items:
-            self.folder_list.setCurrentItem(items[0])
-            self.on_folder_changed(items[0])
+                self.add_folder_item(f, c)
+
+        # Custom and system labels (Important, Starred, ...) below the folders
+        for label in sorted((name for name in counts if name not in STANDARD_FOLDERS), key=str.casefold):
+            self.add_folder_item(label, counts[label])
+
+        for i in range(self.folder_list.count()):
+            item = self.folder_list.item(i)
+            if item.data(Qt.ItemDataRole.UserRole) in selected_names:
+                item.setSelected(True)
+        if not self.folder_list.selectedItems():
+            self.folder_list.item(0).setSelected(True)
+        self.folder_list.blockSignals(False)
+
+        self.on_folder_changed()
+
+    def add_folder_item(self, label, count):
+        item = QListWidgetItem(f"{label} ({count})")
+        item.setData(Qt.ItemDataRole.UserRole, label)
+        self.folder_list.addItem(item)
+
+    def selected_labels(self):
+        return [item.data(Qt.ItemDataRole.UserRole) for item in self.folder_list.selectedItems()]
+
+    def show_attachments(self):
+        dialog = AttachmentsDialog(self.parser, self.model, self)
+        dialog.exec()
+
+    def on_folder_changed(self):
+        labels = self.selected_labels()
+        if not labels: return
+        # Several selected labels: messages carrying all of them
+        if "All" in labels:
+            folder = "All"
+        elif len(labels) == 1:
+            folder = labels[0]
         else:
-            self.folder_list.setCurrentRow(0)
-
-    def on_folder_changed(self, item):
-        if not item: return
-        folder_name = item.text().split(" (")[0]
-        self.lbl_status.setText(f"Viewing: {folder_name}")
-        self.model.set_filter(folder=folder_name)
+            folder = tuple(labels)
+        self.cancel_search()
+        self.model.set_filter(folder=folder)
+        name = folder if isinstance(folder, str) else " AND ".join(folder)
+        self.lbl_status.setText(f"Viewing: {name} ({self.model.rowCount()})")
 
     def on_search_changed(self, text):
-        self.model.set_filter(search=text)
+        # Restarting the timer means only the last keystroke of a burst searches
+        self.search_timer.start()
+
+    def run_search(self):
+        self.search_timer.stop()
+        self.cancel_search()
+        text = self.search_input.text()
+
+        # The FTS index answers in milliseconds, no thread needed
+        if self.chk_fulltext.isChecked() and self.fulltext and text.strip():
+            self.model.search_text = text.lower()
+            self.model.set_body_hits(self.fulltext.search(text))
+            return
+
+        self.report_query(text)
+        request = self.model.prepare_search(text)
+        self.search_thread = SearchThread(self.model.store, request)
+        self.search_thread.results_ready.connect(self.on_search_results)
+        self.search_thread.finished.connect(self.on_search_thread_finished)
+        self.search_thread.start()
+
+    def report_query(self, text):
+        """Status bar note when a query cannot be parsed (it is searched as plain text) or needs the catalogue."""
+        note = ""
+        if is_structured(text):
+            try:
+                if "has" in query_fields(parse_query(text)) and not self.model.store.attachments_catalogued:
+                    note = "has:attachment needs 'Catalogue attachments while scanning'"
+            except QueryError as e:
+                note = f"Query not understood ({e}), searching as plain text"
+        # The note of the previous query is cleared, other status text stays
+        if note or self.lbl_status.text() == self.query_note:
+            self.lbl_status.setText(note)
+        self.query_note = note
+
+    def cancel_search(self):
+        if self.search_thread:
+            self.search_thread.cancel()
+            # Keep a reference until the thread has really stopped
+            self.finished_searches.append(self.search_thread)
+            self.search_thread = None
+
+    def on_search_results(self, result):
+        # Results of cancelled or superseded searches are dropped by the model
+        self.model.apply_search_result(*result)
+
+    def on_search_thread_finished(self):
+        self.finished_searches = [t for t in self.finished_searches if t.isRunning()]
 
     def on_email_selected(self, index):
-        key = self.model.get_key_at_row(index.row())
-        if key is not None:
-            html = self.parser.get_email_body(key)
-            self.web_view.setHtml(html)
+        row = index.row()
+        key = self.model.get_key_at_row(row)
+        if key is None: return
+
+        self.stop_body_stream()
+        if self.parser.message_size(key) > PROGRESSIVE_BODY_BYTES:
+            self.show_large_body(key)
+        else:
+            body = self.body_cache.get(key)
+            if body is None:
+                diagnostics.count("mail.body_cache_miss")
+                body = self.parser.get_email_body(key)
+                self.body_cache.put(key, body)
+            else:
+                diagnostics.count("mail.body_cache_hit")
+            # Origin of this message alone, the one its mbox-part:// image URLs belong to
+            self.web_view.setHtml(body, QUrl(message_base_url(key)))
+
+        # Next rows first, that is the usual reading direction
+        neighbours = list(range(row + 1, row + 1 + PREFETCH_AHEAD))
+        neighbours += list(range(row - 1, row - 1 - PREFETCH_BEHIND, -1))
+        keys = [self.model.get_key_at_row(r) for r in neighbours]
+        self.prefetcher.schedule([k for k in keys if k is not None])
+
+    # --- Progressive rendering of large messages ---
+    def show_large_body(self, key):
+        """
+        Shows the first piece of a large message right away. Only its body part is
+        decoded, piece by piece, and the page is never handed one giant string.
+        """
+        diagnostics.count("mail.progressive_bodies")
+        try:
+            self.body_stream = BodyStream(key, self.parser.iter_body_html(key, BODY_CHUNK_BYTES))
+        except Exception as e:
+            self.web_view.setHtml(f"<h3>Error reading email</h3><p>{html.escape(str(e))}</p>")
+            return
+        self.web_view.setHtml(self.body_stream.first, QUrl(message_base_url(key)))
+
+    def on_body_page_loaded(self, ok):
+        stream = self.body_stream
+        if stream is None or stream.started:
+            return
+        stream.started = True
+        # Same first piece, now into an open document that the next pieces are appended to
+        stream.written = len(stream.first)
+        self.write_body_piece(stream, f"document.open(); document.write({json.dumps(stream.first)});")
+
+    def write_body_piece(self, stream, script):
+        # The next piece is sent when this one is in, so scripts never pile up in the page
+        self.web_view.page().runJavaScript(script, QWebEngineScript.ScriptWorldId.ApplicationWorld,
+                                           lambda result: self.pump_body(stream))
+
+    def pump_body(self, stream):
+        if stream is not self.body_stream:
+            return  # Another message was selected meanwhile
+
+        piece = stream.pending
+        stream.pending = None
+        if piece is None:
+            try:
+                piece = next(stream.pieces, None)
+            except Exception:
+                piece = None  # Mailbox closed or replaced meanwhile
+        if piece is None:
+            self.web_view.page().runJavaScript("document.close();", QWebEngineScript.ScriptWorldId.ApplicationWorld)
+            self.body_stream = None
+            return
+
+        limit = self.body_limit_spin.value() * 1024 * 1024
+        if limit and not stream.unlimited and stream.written >= limit:
+            stream.pending = piece
+            self.lbl_body_notice.setText(f"Showing the first {stream.written / (1024 * 1024):.1f} MB "
+                                         f"of this message.")
+            self.body_notice_bar.setVisible(True)
+            return
+
+        stream.written += len(piece)
+        self.write_body_piece(stream, f"document.write({json.dumps(piece)});")
+
+    def load_full_message(self):
+        stream = self.body_stream
+        self.body_notice_bar.setVisible(False)
+        if stream is not None and stream.pending is not None:
+            stream.unlimited = True
+            self.pump_body(stream)
+
+    def stop_body_stream(self):
+        self.body_stream = None
+        self.body_notice_bar.setVisible(False)
 
     def closeEvent(self, event):
         if self.loader_thread and self.loader_thread.isRunning():
             self.lbl_status.setText("Stopping background thread...")
             self.loader_thread.stop()
             self.loader_thread.wait()
+        self.cancel_search()
+        for thread in self.finished_searches:
+            thread.wait()
+        self.stop_body_indexing()
+        self.stop_search_index()
+        self.prefetcher.stop()
+        self.prefetcher.wait()
+        self.parser.close()
         event.accept()
 
 
 if __name__ == "__main__":
+    # Needed for the header scan process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    register_url_scheme()
     app = QApplication(sys.argv)
     window = MailApp()
     window.show()
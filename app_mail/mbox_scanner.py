@@ -0,0 +1,161 @@
+import os
+import mmap
+from array import array
+
+import takeout_archive
+
+FROM_LINE = b"From "
+SEPARATOR = b"\nFrom "
+
+
+class MboxScanner:
+    """
+    Memory-mapped reader for an mbox file.
+    Message boundaries are found with bulk mmap.find() calls instead of
+    reading the file line by line, and messages are handed out as
+    zero-copy memoryview slices of the mapping.
+    A member of a Takeout archive ("archive.tgz!/member") is read through a
+    takeout_archive.MemberBuffer in place of the mapping.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        if takeout_archive.split_member_path(filepath)[1] is not None:
+            self.file = None
+            buf = takeout_archive.open_buffer(filepath)
+            self.size = len(buf)
+            self.mm = buf if self.size else None
+            self.view = _BufferView(buf) if self.size else None
+        else:
+            self.file = open(filepath, 'rb')
+            self.size = os.fstat(self.file.fileno()).st_size
+            # mmap refuses empty files, an empty mailbox simply has no messages
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+            self.view = memoryview(self.mm) if self.mm is not None else None
+
+        # Byte range of every message including its 'From ' line, index = message key
+        self.starts = array('q')
+        self.stops = array('q')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def scan(self):
+        """Finds every 'From ' separator in one pass. Returns the message count."""
+        starts = array('q')
+        stops = array('q')
+        mm = self.mm
+        if mm is None:
+            self.starts, self.stops = starts, stops
+            return 0
+
+        # The first message may not start at byte 0 (leading blank lines)
+        if mm[:len(FROM_LINE)] == FROM_LINE:
+            pos = 0
+        else:
+            pos = mm.find(SEPARATOR)
+            pos = pos + 1 if pos != -1 else -1
+
+        self._scan_from(pos, starts, stops)
+        self.starts, self.stops = starts, stops
+        return len(starts)
+
+    def scan_appended(self, starts, stops, indexed_size):
+        """
+        Reuses the boundaries found by an earlier scan of the file's first `indexed_size`
+        bytes and scans only the bytes appended since. Returns the message count, or
+        None if the file does not continue with a new message exactly there.
+        """
+        mm = self.mm
+        if mm is None or not starts or not 0 < indexed_size < self.size or stops[-1] != indexed_size:
+            return None
+        if mm[indexed_size - 1:indexed_size] != b"\n" or mm[indexed_size:indexed_size + len(FROM_LINE)] != FROM_LINE:
+            return None
+        # Spot check that the old boundaries still point at separators
+        step = max(1, len(starts) // 256)
+        for i in range(0, len(starts), step):
+            if mm[starts[i]:starts[i] + len(FROM_LINE)] != FROM_LINE:
+                return None
+
+        starts = array('q', starts)
+        stops = array('q', stops)
+        # As in scan(), the newline in front of 'From ' belongs to the separator
+        stops[-1] = indexed_size - 1
+        self._scan_from(indexed_size, starts, stops)
+        self.starts, self.stops = starts, stops
+        return len(starts)
+
+    def _scan_from(self, pos, starts, stops):
+        """Appends the range of every message from the one starting at pos to the end of the file."""
+        find = self.mm.find
+        size = self.size
+        while pos != -1:
+            nxt = find(SEPARATOR, pos)
+            starts.append(pos)
+            if nxt == -1:
+                stops.append(size)
+                break
+            # The newline in front of 'From ' belongs to the separator
+            stops.append(nxt)
+            pos = nxt + 1
+
+    def set_boundaries(self, starts, stops):
+        """Reuses offsets from a previous scan (e.g. the sidecar index)."""
+        self.starts = starts
+        self.stops = stops
+
+    def message_range(self, key):
+        """(start, stop) of one message in the file, without its 'From ' line."""
+        start = self.starts[key]
+        stop = self.stops[key]
+        eol = self.mm.find(b"\n", start, stop)
+        return (eol + 1 if eol != -1 else stop), stop
+
+    def message(self, key):
+        """Zero-copy view of one message, without its 'From ' line."""
+        start, stop = self.message_range(key)
+        return self.view[start:stop]
+
+    def headers(self, key):
+        """Zero-copy view of the header block only (up to the first blank line)."""
+        start = self.starts[key]
+        stop = self.stops[key]
+        find = self.mm.find
+        eol = find(b"\n", start, stop)
+        header_start = eol + 1 if eol != -1 else stop
+
+        # Blank line is '\n\n', or '\r\n\r\n' for files written on Windows
+        end = find(b"\n\n", header_start, stop)
+        end = end + 1 if end != -1 else stop
+        crlf_end = find(b"\r\n\r\n", header_start, end)
+        if crlf_end != -1:
+            end = crlf_end + 2
+        return self.view[header_start:end]
+
+    def close(self):
+        try:
+            if self.view is not None:
+                self.view.release()
+            if self.mm is not None:
+                self.mm.close()
+        except BufferError:
+            # A caller still holds a slice, the mapping goes away with it
+            pass
+        self.view = None
+        self.mm = None
+        if self.file is not None:
+            self.file.close()
+
+
+class _BufferView:
+    """Slices of a MemberBuffer as memoryviews, standing in for the memoryview of a mapping."""
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def __getitem__(self, index):
+        return memoryview(self.buf[index])
+
+    def release(self):
+        # Nothing is mapped, the buffer is closed with the scanner
+        pass
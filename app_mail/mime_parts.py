@@ -0,0 +1,197 @@
+import re
+import binascii
+from typing import NamedTuple
+from email.parser import BytesHeaderParser
+
+_header_parser = BytesHeaderParser()
+_WHITESPACE = b" \t\r\n"
+
+# Bytes read per step when decoding a part
+DECODE_CHUNK = 1024 * 1024
+
+
+class MimePart:
+    """Location and metadata of one leaf MIME part inside a raw message."""
+    __slots__ = ("index", "content_type", "charset", "cid", "filename",
+                 "disposition", "encoding", "start", "end")
+
+    def __init__(self, index, msg, start, end):
+        self.index = index
+        self.content_type = msg.get_content_type()
+        self.charset = msg.get_content_charset()
+        cid = msg.get("Content-ID")
+        self.cid = str(cid).strip().strip("<>") if cid else None
+        try:
+            self.filename = msg.get_filename()
+        except Exception:
+            self.filename = None
+        self.disposition = (msg.get_content_disposition() or "").lower()
+        self.encoding = str(msg.get("Content-Transfer-Encoding", "")).strip().lower()
+        # Byte range of the encoded body in the buffer the part was found in
+        self.start = start
+        self.end = end
+
+    @property
+    def encoded_size(self):
+        return self.end - self.start
+
+    @property
+    def is_attachment(self):
+        return self.disposition == "attachment" or (
+            bool(self.filename) and not self.content_type.startswith("text/"))
+
+
+class AttachmentEntry(NamedTuple):
+    """Catalogue record of one attachment, offsets are absolute positions in the mbox."""
+    index: int
+    filename: str
+    content_type: str
+    encoding: str
+    size: int  # Encoded size in bytes
+    start: int
+    end: int
+
+
+def attachment_entries(parts):
+    return tuple(
+        AttachmentEntry(p.index, p.filename or f"part-{p.index}", p.content_type,
+                        p.encoding, p.encoded_size, p.start, p.end)
+        for p in parts if p.is_attachment
+    )
+
+
+def _split_header(buf, start, end):
+    """Returns (header_end, body_start) for the entity starting at `start`."""
+    # An entity may have no headers at all, the body then starts after one line break
+    if buf[start:start + 1] == b"\n":
+        return start, start + 1
+    if buf[start:start + 2] == b"\r\n":
+        return start, start + 2
+
+    blank = buf.find(b"\n\n", start, end)
+    crlf_blank = buf.find(b"\r\n\r\n", start, end)
+    if crlf_blank != -1 and (blank == -1 or crlf_blank < blank):
+        return crlf_blank + 2, crlf_blank + 4
+    if blank != -1:
+        return blank + 1, blank + 2
+    return end, end
+
+
+def _line_end(buf, pos, end):
+    eol = buf.find(b"\n", pos, end)
+    return end if eol == -1 else eol + 1
+
+
+def _iter_entity(buf, start, end, counter, depth=0):
+    header_end, body_start = _split_header(buf, start, end)
+    msg = _header_parser.parsebytes(bytes(buf[start:header_end]))
+
+    boundary = msg.get_boundary() if msg.get_content_maintype() == "multipart" else None
+    if not boundary or depth > 20:
+        counter[0] += 1
+        yield MimePart(counter[0] - 1, msg, body_start, end)
+        return
+
+    delimiter = b"--" + boundary.encode("ascii", "replace")
+    # First delimiter may sit right at the body start (empty preamble)
+    if buf[body_start:body_start + len(delimiter)] == delimiter:
+        pos = body_start
+    else:
+        pos = buf.find(b"\n" + delimiter, body_start, end)
+        if pos == -1:
+            return
+        pos += 1
+
+    while True:
+        after = pos + len(delimiter)
+        if buf[after:after + 2] == b"--":
+            return  # Close delimiter
+        part_start = _line_end(buf, after, end)
+
+        nxt = buf.find(b"\n" + delimiter, part_start, end)
+        if nxt == -1:
+            # Truncated message: the last part runs to the end
+            yield from _iter_entity(buf, part_start, end, counter, depth + 1)
+            return
+
+        # The line break in front of the delimiter belongs to the delimiter
+        part_end = nxt - 1 if nxt > part_start and buf[nxt - 1:nxt] == b"\r" else nxt
+        yield from _iter_entity(buf, part_start, max(part_start, part_end), counter, depth + 1)
+        pos = nxt + 1
+
+
+def list_parts(buf, start=0, end=None):
+    """
+    All leaf parts of the message stored in buf[start:end], in depth-first order.
+    Only headers are parsed; bodies are located by boundary search, not decoded.
+    `buf` can be bytes or an mmap (anything with find() and slicing).
+    """
+    if end is None:
+        end = len(buf)
+    try:
+        return list(_iter_entity(buf, start, end, [0]))
+    except Exception:
+        return []
+
+
+def iter_decoded(buf, part, chunk_size=DECODE_CHUNK):
+    """
+    Yields the transfer-decoded body of a part chunk by chunk (flat memory use).
+    `part` is a MimePart or an AttachmentEntry.
+    """
+    pos = part.start
+    end = part.end
+    carry = b""
+
+    if part.encoding == "base64":
+        while pos < end:
+            raw = carry + bytes(buf[pos:min(pos + chunk_size, end)]).translate(None, _WHITESPACE)
+            pos += chunk_size
+            if pos < end:
+                usable = len(raw) - (len(raw) % 4)
+            else:
+                # Last chunk: tolerate missing padding
+                raw += b"=" * (-len(raw) % 4)
+                usable = len(raw)
+            carry = raw[usable:]
+            if usable:
+                try:
+                    yield binascii.a2b_base64(raw[:usable])
+                except binascii.Error:
+                    return
+
+    elif part.encoding == "quoted-printable":
+        while pos < end:
+            raw = carry + bytes(buf[pos:min(pos + chunk_size, end)])
+            pos += chunk_size
+            # Only decode complete lines, soft line breaks may span chunks
+            cut = raw.rfind(b"\n") + 1 if pos < end else len(raw)
+            carry = raw[cut:]
+            if cut:
+                yield binascii.a2b_qp(raw[:cut])
+
+    else:
+        while pos < end:
+            yield bytes(buf[pos:min(pos + chunk_size, end)])
+            pos += chunk_size
+
+
+def decode_part(buf, part):
+    return b"".join(iter_decoded(buf, part))
+
+
+def find_part(parts, cid=None, index=None):
+    for part in parts:
+        if cid is not None and part.cid == cid:
+            return part
+        if index is not None and part.index == index:
+            return part
+    return None
+
+
+_CID_RE = re.compile(r"cid:([^\"'\s)>]+)", re.IGNORECASE)
+
+
+def rewrite_cid_urls(html, make_url):
+    """Replaces every cid: reference in the HTML with make_url(cid)."""
+    return _CID_RE.sub(lambda m: make_url(m.group(1)), html)
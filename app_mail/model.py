@@ -1,18 +1,52 @@
-from PyQt6.QtCore import QAbstractTableModel, Qt
+from array import array
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+import diagnostics
+
+try:
+    from store import MessageStore
+    from query import is_structured
+except ImportError:
+    from app_mail.store import MessageStore
+    from app_mail.query import is_structured
+
+
+# MessageStore sort field of each column
+SORT_FIELDS = ("sender", "subject", "date")
 
 
 class EmailTableModel(QAbstractTableModel):
     def __init__(self, data=None):
         super().__init__()
-        self._all_data = []  # Master list
-        self._display_data = []  # Filtered list shown in UI
+        self.store = MessageStore()  # Master data, column oriented
+        self._display_data = array('I')  # Row indices into the store shown in UI
+        self._matched = self._display_data  # All rows passing the filters (before thread collapsing)
         self._headers = ["Sender", "Subject", "Date"]
 
         # Filter States
         self.current_folder = "Inbox"
         self.search_text = ""
+        # Ranked keys from the full-text index (None = plain substring search)
+        self.body_hits = None
+        # Collapsed conversations: one row per thread, with the message count per shown row
+        self.thread_mode = False
+        self._thread_counts = None
+
+        # Column sort (None = file order). Filters walk the store's sort order, so
+        # changing the folder or search text never sorts again.
+        self.sort_field = None
+        self.sort_descending = False
+
+        # Background search bookkeeping: the filter the view currently reflects,
+        # how many store rows it accounts for, and whether a search is running
+        self._shown = ("Inbox", "")
+        self._display_limit = 0
+        self._pending = False
 
     def rowCount(self, parent=None):
+        # Flat table: items never have children
+        if parent is not None and parent.isValid():
+            return 0
         return len(self._display_data)
 
     def columnCount(self, parent=None):
@@ -22,69 +56,249 @@ class EmailTableModel(QAbstractTableModel):
         if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
             return None
 
-        # Tuple: (key, sender, subject, date, folder)
-        # Col 0->Sender(1), Col 1->Subject(2), Col 2->Date(3)
-        row_data = self._display_data[index.row()]
-        return row_data[index.column() + 1]
+        # Col 0->Sender, Col 1->Subject, Col 2->Date
+        row = self._display_data[index.row()]
+        column = index.column()
+        if column == 0:
+            return self.store.sender(row)
+        if column == 1:
+            subject = self.store.subject(row)
+            if self._thread_counts is not None and self._thread_counts[index.row()] > 1:
+                return f"{subject} ({self._thread_counts[index.row()]})"
+            return subject
+        return self.store.display_date(row)
 
     def headerData(self, section, orientation, role):
         if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
             return self._headers[section]
         return None
 
-    def add_rows(self, new_rows):
-        """Add rows to master list, then re-filter to see if they should show up."""
-        self.beginResetModel()
-        self._all_data.extend(new_rows)
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Called by the view when a header is clicked (column -1 restores file order)."""
+        self.sort_field = SORT_FIELDS[column] if 0 <= column < len(SORT_FIELDS) else None
+        self.sort_descending = order == Qt.SortOrder.DescendingOrder
+        if self._pending:
+            return  # The running search's result is put in order when it arrives
+
+        # Layout change instead of reset, so the selected message stays selected
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        selected_rows = [self._display_data[index.row()] for index in persistent]
+
         self._apply_filters()
-        self.endResetModel()
+
+        new_indexes = []
+        for index, row in zip(persistent, selected_rows):
+            try:
+                new_indexes.append(self.index(self._display_data.index(row), index.column()))
+            except ValueError:
+                new_indexes.append(QModelIndex())
+        self.changePersistentIndexList(persistent, new_indexes)
+        self.layoutChanged.emit()
+
+    def _sorted_rows(self):
+        """Rows in the current sort order for filter_rows (None = file order)."""
+        if self.sort_field is None:
+            return None
+        return self.store.sort_order(self.sort_field, self.sort_descending)
+
+    @diagnostics.timed("model.add_rows", items=lambda args, result: len(args[1]))
+    def add_rows(self, new_rows):
+        """Add rows to master list, only the new rows are filtered and appended to the view.
+        While sorted, new rows are appended as well; the view is put back in order by the
+        next set_filter (the folder refresh after loading)."""
+        new_range = self.store.append_rows(new_rows)
+
+        # The ranked full-text view is rebuilt on the next search, and a running
+        # background search picks these rows up when its result is applied
+        if self.body_hits is not None or self._pending:
+            return
+
+        visible = self.store.filter_rows(self.current_folder, self.search_text, new_range)
+        if not visible:
+            return
+
+        if self.thread_mode:
+            # New rows may join a conversation that is already shown; the collapsed
+            # view is rebuilt by the next set_filter (the folder refresh after loading)
+            self._matched.extend(visible)
+            self._display_limit = len(self.store)
+            return
+
+        # Insert instead of reset, so scroll position and selection survive loading
+        first = len(self._display_data)
+        self.beginInsertRows(QModelIndex(), first, first + len(visible) - 1)
+        self._display_data.extend(visible)
+        self._display_limit = len(self.store)
+        self.endInsertRows()
+
+    def merge_labels(self, key_labels):
+        """Adds labels to messages already loaded: (key, labels) pairs. Folder views
+        pick them up on the next set_filter (the folder refresh after loading)."""
+        row_for_key = self.store.row_for_key
+        self.store.merge_labels([(row_for_key(key), labels) for key, labels in key_labels
+                                 if row_for_key(key) is not None])
 
     def set_filter(self, folder=None, search=None):
         """Update filter criteria and refresh view."""
         if folder is not None: self.current_folder = folder
-        if search is not None: self.search_text = search.lower()
+        if search is not None: self.search_text = search
+
+        self.beginResetModel()
+        self._apply_filters()
+        self.endResetModel()
+
+    def set_thread_mode(self, enabled):
+        """Switches between one row per message and one row per conversation."""
+        self.thread_mode = enabled
+        if self._pending:
+            return  # Applied together with the running search's result
+
+        self.beginResetModel()
+        self._set_rows(self._matched)
+        self.endResetModel()
+
+    def set_body_hits(self, keys):
+        """Show only these message keys, in this (relevance) order. None clears it."""
+        self.body_hits = keys
 
         self.beginResetModel()
         self._apply_filters()
         self.endResetModel()
 
+    def prepare_search(self, search):
+        """
+        Switches to a new search text whose result is computed in the background.
+        Returns (folder, search, rows, row_limit) for MessageStore.filter_rows:
+        when the text only got longer, `rows` is the current result (narrowing),
+        otherwise all rows below row_limit (None, or the sort order when sorted).
+        A longer query is not necessarily narrower ("a" -> "a OR b"), queries never narrow.
+        """
+        shown_folder, shown_search = self._shown
+        narrowing = (self.body_hits is None and not self._pending
+                     and shown_folder == self.current_folder and shown_search.casefold() in search.casefold()
+                     and not is_structured(search) and not is_structured(shown_search))
+
+        self.body_hits = None
+        self.search_text = search
+        self._pending = True
+
+        if narrowing:
+            return self.current_folder, search, array('I', self._matched), self._display_limit
+        return self.current_folder, search, self._sorted_rows(), len(self.store)
+
+    @diagnostics.timed("model.apply_search_result")
+    def apply_search_result(self, folder, search, rows, row_limit):
+        """Installs a background search result. Stale results are ignored (returns False)."""
+        if not self._pending or (folder, search) != (self.current_folder, self.search_text):
+            return False
+
+        # Rows loaded while the search was running
+        rows.extend(self.store.filter_rows(folder, search, range(row_limit, len(self.store))))
+        if self.sort_field is not None:
+            # Rows loaded meanwhile, or the sort changed while searching
+            rows = self.store.sort_rows(rows, self.sort_field, self.sort_descending)
+
+        self.beginResetModel()
+        self._set_rows(rows)
+        self._display_limit = len(self.store)
+        self._shown = (folder, search)
+        self._pending = False
+        self.endResetModel()
+        return True
+
+    @diagnostics.timed("model.apply_filters")
     def _apply_filters(self):
         """Rebuilds _display_data based on folder and search text."""
-        self._display_data = []
+        self._pending = False
+        self._display_limit = len(self.store)
+        self._shown = (self.current_folder, self.search_text)
 
-        for row in self._all_data:
-            # Row structure: (key, sender, subject, date, folder)
-            r_sender = row[1].lower()
-            r_subject = row[2].lower()
-            r_folder = row[4]
+        if self.body_hits is not None:
+            self._apply_body_hits()
+            return
 
-            # 1. Folder Check
-            # If folder is "All", show everything, otherwise match folder name
-            if self.current_folder != "All" and r_folder != self.current_folder:
-                continue
+        self._set_rows(self.store.filter_rows(self.current_folder, self.search_text, self._sorted_rows()))
 
-            # 2. Search Check
-            if self.search_text:
-                if self.search_text not in r_sender and self.search_text not in r_subject:
-                    continue
+    def _apply_body_hits(self):
+        """Full-text mode: keep the ranking (unless a column is sorted), only the folder filter still applies."""
+        row_for_key = self.store.row_for_key
+        ranked_rows = [row for row in map(row_for_key, self.body_hits) if row is not None]
+        rows = self.store.filter_rows(self.current_folder, "", ranked_rows)
+        if self.sort_field is not None:
+            rows = self.store.sort_rows(rows, self.sort_field, self.sort_descending)
+        self._set_rows(rows)
 
-            self._display_data.append(row)
+    def _set_rows(self, rows):
+        """Installs the filtered rows, collapsed to conversations in thread mode."""
+        self._matched = rows
+        if self.thread_mode:
+            self._display_data, self._thread_counts = self.store.collapse_threads(rows)
+        else:
+            self._display_data = rows
+            self._thread_counts = None
 
     def get_key_at_row(self, row_index):
         if 0 <= row_index < len(self._display_data):
-            return self._display_data[row_index][0]
+            return self.store.keys[self._display_data[row_index]]
         return None
 
+    def get_attachments(self):
+        """(store row, AttachmentEntry) for every attachment of the messages in the current view."""
+        attachments = self.store.attachments
+        return [(row, entry) for row in self._matched if row in attachments
+                for entry in attachments[row]]
+
     def get_folder_counts(self):
         """Helper to update sidebar numbers (e.g. Inbox (5))"""
-        counts = {}
-        for row in self._all_data:
-            f = row[4]
-            counts[f] = counts.get(f, 0) + 1
-        return counts
+        return self.store.folder_counts()
 
     def clear(self):
         self.beginResetModel()
-        self._all_data = []
-        self._display_data = []
+        self.store = MessageStore()
+        self._set_rows(array('I'))
+        self.body_hits = None
+        self._display_limit = 0
+        self._pending = False
         self.endResetModel()
+
+
+class AttachmentTableModel(QAbstractTableModel):
+    """Catalogued attachments of a set of messages: list of (store row, AttachmentEntry)."""
+
+    def __init__(self, store, items):
+        super().__init__()
+        self.store = store
+        self.items = items
+        self._headers = ["File", "Type", "Size", "Sender", "Subject"]
+
+    def rowCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self.items)
+
+    def columnCount(self, parent=None):
+        return len(self._headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        row, entry = self.items[index.row()]
+        column = index.column()
+        if column == 0:
+            return entry.filename
+        if column == 1:
+            return entry.content_type
+        if column == 2:
+            # Base64 grows data by a third, good enough for display
+            size = entry.size * 3 // 4 if entry.encoding == "base64" else entry.size
+            return f"{max(1, size // 1024)} KB"
+        if column == 3:
+            return self.store.sender(row)
+        return self.store.subject(row)
+
+    def headerData(self, section, orientation, role):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self._headers[section]
+        return None
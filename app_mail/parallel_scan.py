@@ -0,0 +1,141 @@
+import os
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import takeout_archive
+
+try:
+    from parser import parse_header_row, catalogue_attachments
+    from mbox_scanner import MboxScanner
+except ImportError:
+    from app_mail.parser import parse_header_row, catalogue_attachments
+    from app_mail.mbox_scanner import MboxScanner
+
+# Work unit sent to a worker process: whichever limit is hit first
+CHUNK_BYTES = 16 * 1024 * 1024
+CHUNK_MESSAGES = 2000
+# Ranges parsed ahead of the consumer per worker; finished rows wait in memory until read
+RANGES_AHEAD_PER_WORKER = 2
+
+
+def default_worker_count():
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def split_key_ranges(starts, stops, chunk_bytes=CHUNK_BYTES, chunk_messages=CHUNK_MESSAGES):
+    """Splits the message list into (first_key, end_key) ranges of roughly equal byte size."""
+    ranges = []
+    count = len(starts)
+    first = 0
+    while first < count:
+        end = first
+        limit = starts[first] + chunk_bytes
+        max_end = min(count, first + chunk_messages)
+        # Messages are contiguous, so the byte limit can be checked on the start offsets
+        while end < max_end and starts[end] < limit:
+            end += 1
+        end = max(end, first + 1)
+        ranges.append((first, end))
+        first = end
+    return ranges
+
+
+def _parse_range(filepath, first_key, starts, stops, with_attachments=False):
+    """Worker process: parses the header rows of one byte range of the mbox."""
+    scanner = MboxScanner(filepath)
+    rows = []
+    try:
+        scanner.set_boundaries(starts, stops)
+        for i in range(len(starts)):
+            view = scanner.headers(i)
+            try:
+                header_bytes = bytes(view)
+            finally:
+                view.release()
+            try:
+                attachments = None
+                if with_attachments:
+                    attachments = catalogue_attachments(scanner.mm, *scanner.message_range(i))
+                rows.append(parse_header_row(first_key + i, header_bytes, attachments, stops[i] - starts[i]))
+            except Exception:
+                continue
+    finally:
+        scanner.close()
+    return rows
+
+
+def iter_header_batches(parser, workers):
+    """
+    Parses headers of the loaded mbox in a process pool.
+    Yields lists of rows in file order, one list per byte range.
+    """
+    for _, batch in iter_source_batches([parser], workers):
+        yield batch
+
+
+def iter_source_batches(parsers, workers):
+    """
+    Parses headers of several loaded mailboxes in one process pool, so small
+    files are worked on at the same time. Yields (source index, rows) in source
+    order and file order; keys are those of each source's own parser. Only a few
+    ranges per worker are handed out ahead of the consumer, so memory stays flat
+    however large the mailboxes are.
+    """
+    planned = []
+    for source, parser in enumerate(parsers):
+        with parser.lock:
+            if not parser.scanner: continue
+            filepath, starts, stops = parser.filepath, parser.scanner.starts, parser.scanner.stops
+            cached_rows, first_key = parser.cached_rows, parser.first_new_key
+            ranges = []
+            if takeout_archive.split_member_path(filepath)[1] is not None:
+                # A worker would have to inflate the archive member from its start,
+                # archive members are parsed here, through the parser's checkpoints
+                ranges = None
+            elif cached_rows is None:
+                # Only the messages appended since the index was written, if there is one
+                ranges = [(first + first_key, end + first_key)
+                          for first, end in split_key_ranges(starts[first_key:], stops[first_key:])]
+            planned.append((source, parser, filepath, starts, stops, parser.catalogue_attachments,
+                            parser.write_index, cached_rows, parser.prefix_rows, ranges))
+
+    # Worker arguments of every range of every file, in file order
+    tasks = ((filepath, first, starts[first:end], stops[first:end], with_attachments)
+             for _, _, filepath, starts, stops, with_attachments, _, _, _, ranges in planned
+             for first, end in ranges or ())
+    in_flight = deque()
+    ahead = RANGES_AHEAD_PER_WORKER * workers
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # Futures are consumed in submission order, which is file order; the next
+        # range is only submitted once the oldest one has been read
+        for source, parser, _, _, _, _, keep_rows, cached_rows, prefix_rows, ranges in planned:
+            for args in islice(tasks, ahead - len(in_flight)):
+                in_flight.append(executor.submit(_parse_range, *args))
+            if ranges is None:
+                rows = parser.get_headers_generator()
+                for batch in iter(lambda: list(islice(rows, CHUNK_MESSAGES)), []):
+                    yield source, batch
+                continue
+            if cached_rows is not None:
+                yield source, cached_rows
+                continue
+
+            all_rows = []
+            if prefix_rows is not None:
+                yield source, prefix_rows
+                if keep_rows:
+                    all_rows.extend(prefix_rows)
+            for _ in ranges:
+                batch = in_flight.popleft().result()
+                for args in islice(tasks, ahead - len(in_flight)):
+                    in_flight.append(executor.submit(_parse_range, *args))
+                if keep_rows:
+                    all_rows.extend(batch)
+                yield source, batch
+            parser.save_index(all_rows)
+    finally:
+        # Also runs when the consumer stops early, pending ranges are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
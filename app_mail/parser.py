@@ -1,109 +1,534 @@
-import mailbox
+import codecs
 import email
+import hashlib
 from email.header import decode_header
+from email.parser import BytesHeaderParser
 from email.utils import parsedate_to_datetime
-import base64
+from datetime import date
+from functools import lru_cache
+import html
+import re
 import threading
+from urllib.parse import quote
+
+import diagnostics
+
+try:
+    from index_cache import MboxIndexCache, prefix_fingerprint
+    from mbox_scanner import MboxScanner
+    from fulltext import html_to_text
+    from mime_parts import (list_parts, find_part, decode_part, iter_decoded, rewrite_cid_urls,
+                            attachment_entries, DECODE_CHUNK)
+    from conversations import thread_headers
+except ImportError:
+    from app_mail.index_cache import MboxIndexCache, prefix_fingerprint
+    from app_mail.mbox_scanner import MboxScanner
+    from app_mail.fulltext import html_to_text
+    from app_mail.mime_parts import (list_parts, find_part, decode_part, iter_decoded, rewrite_cid_urls,
+                                     attachment_entries, DECODE_CHUNK)
+    from app_mail.conversations import thread_headers
+
+
+# Module level so worker processes can use them without a MboxParser instance
+_header_parser = BytesHeaderParser()
+
+# Epoch value stored for messages without a usable Date header
+NO_DATE = -(1 << 62)
+
+# Inline images and attachments are served lazily to the web view through this URL scheme
+PART_SCHEME = "mbox-part"
+
+
+def message_host(key):
+    """Host of a message's URLs, each message is its own origin (a bare number would read as an IP)."""
+    return f"m{key}"
+
+
+def part_url(key, kind, ref):
+    """URL of a message part, kind is 'cid' (Content-ID) or 'part' (part index)."""
+    return f"{PART_SCHEME}://{message_host(key)}/{kind}/{quote(str(ref), safe='')}"
+
+
+def message_base_url(key):
+    return f"{PART_SCHEME}://{message_host(key)}/"
+
+
+# Gmail system labels that act as folders, by lower-case label name
+STANDARD_FOLDERS = ("Inbox", "Sent", "Drafts", "Spam", "Trash", "Archived")
+_FOLDER_LABELS = {
+    "inbox": "Inbox", "sent": "Sent", "draft": "Drafts", "drafts": "Drafts",
+    "spam": "Spam", "trash": "Trash", "bin": "Trash", "archived": "Archived",
+}
+
+# Distinct encoded header values kept decoded (senders and subjects of a mailbox repeat)
+# and distinct X-Gmail-Labels values kept parsed
+DECODE_CACHE_SIZE = 65536
+LABELS_CACHE_SIZE = 4096
+# Characters of To + Cc kept per message for to: searches
+MAX_RECIPIENTS_CHARS = 500
+
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"))}
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_DATE_RE = re.compile(r"\s*(?:[A-Za-z]{3},\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+"
+                      r"(\d{1,2}):(\d{2})(?::(\d{2}))?\s+([+-]\d{4}|GMT|UTC?)(?![\w:])", re.ASCII)
+
+# Labels are comma separated, a label containing a comma is quoted
+_LABEL_RE = re.compile(r'\s*(?:"([^"]*)"|([^,]+))\s*(?:,|$)')
+
+
+def parse_labels(value):
+    """
+    All labels of an X-Gmail-Labels value, standard folders under their canonical name.
+    A message without any standard folder label is in the Inbox.
+    """
+    if isinstance(value, str):
+        # A mailbox has few distinct label combinations
+        return _cached_labels(value)
+    return _parse_labels(value)
+
+
+def _parse_labels(value):
+    labels = []
+    for quoted, plain in _LABEL_RE.findall(decode_str(value) if value else ""):
+        label = (quoted or plain).strip()
+        if not label:
+            continue
+        label = _FOLDER_LABELS.get(label.lower(), label)
+        if label not in labels:
+            labels.append(label)
+
+    if not any(label in STANDARD_FOLDERS for label in labels):
+        labels.insert(0, "Inbox")
+    return tuple(labels)
+
+
+_cached_labels = lru_cache(maxsize=LABELS_CACHE_SIZE)(_parse_labels)
+
+
+@diagnostics.timed("mail.decode_header")
+def decode_str(header_value):
+    if not header_value: return ""
+    if isinstance(header_value, str):
+        # Senders and subjects repeat a lot, and most need no decoding at all
+        return _decode_encoded_words(header_value) if "=?" in header_value else header_value
+    return _decode_header(header_value)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def _decode_encoded_words(header_value):
+    return _decode_header(header_value)
+
+
+def _decode_header(header_value):
+    try:
+        parts = []
+        for bytes_content, encoding in decode_header(header_value):
+            if isinstance(bytes_content, bytes):
+                parts.append(bytes_content.decode(encoding or 'utf-8', errors='replace'))
+            else:
+                parts.append(str(bytes_content))
+        return "".join(parts)
+    except:
+        return str(header_value)
+
+
+def catalogue_attachments(buf, start, stop):
+    """Attachment catalogue of the message stored in buf[start:stop] (nothing is decoded)."""
+    return attachment_entries(list_parts(buf, start, stop))
+
+
+@diagnostics.timed("mail.parse_date")
+def parse_date(date_str):
+    """Epoch seconds of a Date header, NO_DATE if missing or unparsable."""
+    if not date_str:
+        return NO_DATE
+    epoch = _fast_date(date_str)
+    if epoch is not None:
+        return epoch
+    try:
+        return int(parsedate_to_datetime(date_str).timestamp())
+    except:
+        return NO_DATE
+
+
+def _fast_date(date_str):
+    """
+    Epoch of the usual RFC 2822 layout ('Tue, 1 Jul 2003 10:52:37 +0200', optional
+    weekday and seconds, numeric or GMT/UT zone) without building a datetime.
+    None for anything else, which then goes through parsedate_to_datetime.
+    """
+    match = _DATE_RE.match(date_str)
+    if not match:
+        return None
+    day, month, year, hour, minute, second, zone = match.groups()
+    month = _MONTHS.get(month.lower())
+    hour, minute, second = int(hour), int(minute), int(second or 0)
+    if month is None or hour > 23 or minute > 59 or second > 59:
+        return None
+    if zone[0] in "+-":
+        if zone == "-0000":
+            return None  # 'No zone information', parsedate_to_datetime treats it as local time
+        offset = int(zone[1:3]) * 3600 + int(zone[3:5]) * 60
+        if offset >= 86400:
+            return None
+        if zone[0] == "-":
+            offset = -offset
+    else:
+        offset = 0
+    try:
+        days = date(int(year), month, int(day)).toordinal() - _EPOCH_ORDINAL
+    except ValueError:
+        return None
+    return days * 86400 + hour * 3600 + minute * 60 + second - offset
+
+
+@diagnostics.timed("mail.parse_header", nbytes=lambda args, row: len(args[1]))
+def parse_header_row(key, header_bytes, attachments=None, size=0):
+    """Builds the (key, sender, subject, date, labels, attachments, thread, recipients, size)
+    table row from a raw header block.
+    The date is an epoch integer (NO_DATE if missing or unparsable), labels a tuple of
+    every X-Gmail-Labels entry (see parse_labels), attachments is
+    a tuple of AttachmentEntry or None if the catalogue was not recorded, thread is
+    (message_id, references) for conversation grouping, recipients the To and Cc
+    addresses in one string and size the bytes of the whole message."""
+    # Stops at the header block, MIME parts are never looked at
+    msg = _header_parser.parsebytes(header_bytes)
+
+    subject = decode_str(msg['subject'] or "(No Subject)")[:100]
+    sender = decode_str(msg['from'] or "Unknown")[:100]
+
+    epoch = parse_date(msg['date'])
+
+    # Categorization: every label is kept, a message can be in several folders
+    labels = parse_labels(msg.get('X-Gmail-Labels'))
+
+    # To and Cc, only used by to: searches
+    recipients = ", ".join(decode_str(value) for value in (msg.get_all('to') or []) + (msg.get_all('cc') or []))
+    recipients = recipients[:MAX_RECIPIENTS_CHARS]
+
+    return (key, sender, subject, epoch, labels, attachments, thread_headers(msg), recipients, size)
 
 
 class MboxParser:
     def __init__(self):
-        self.mbox = None
+        self.scanner = None
         self.filepath = None
-        # This lock ensures only one thread touches the file at a time
+        self.index_cache = None
+        # Header rows restored from the sidecar index (None if the file was scanned)
+        self.cached_rows = None
+        # Messages appended since the index was written are parsed from this key on;
+        # prefix_rows are the indexed rows of the messages before it
+        self.first_new_key = 0
+        self.prefix_rows = None
+        # Added to the keys in part URLs: the first key of this mailbox in a MailboxSet
+        self.key_base = 0
+        # Record filename/type/size/offset of every attachment during the header scan
+        self.catalogue_attachments = False
+        # Keep the scanned rows and write the sidecar index at the end of a scan.
+        # Off for one-shot streaming (headless export), so memory stays flat.
+        self.write_index = True
+        # This lock ensures the mapping is not closed while a thread reads from it
         self.lock = threading.RLock()
 
+    @diagnostics.timed("mail.open_mailbox", items=lambda args, count: count,
+                       nbytes=lambda args, count: args[0].scanner.size)
     def load_mbox(self, filepath):
         with self.lock:
+            self.close()
             self.filepath = filepath
-            # factory=None is faster/safer for just reading raw bytes later
-            self.mbox = mailbox.mbox(filepath, factory=None)
-            return len(self.mbox)
+            self.scanner = MboxScanner(filepath)
+            self.index_cache = MboxIndexCache(filepath)
 
-    def get_headers_generator(self):
-        keys = []
+            cached = self.index_cache.load(require_attachments=self.catalogue_attachments)
+            if cached and cached[3] is None:
+                # 1. Fast path: unchanged file with a valid sidecar index
+                starts, stops, self.cached_rows, _ = cached
+                self.scanner.set_boundaries(starts, stops)
+            elif cached and self.scanner.scan_appended(*cached[:2], cached[3]) is not None:
+                # 2. Messages were appended: only the bytes after the indexed ones are scanned
+                self.first_new_key = len(cached[0])
+                self.prefix_rows = cached[2]
+            else:
+                # 3. Slow path: one bulk pass over the mapped file for 'From ' separators
+                self.scanner.scan()
+
+            return len(self.scanner)
+
+    def refresh(self):
+        """
+        Picks up messages appended to the file since it was opened, without touching
+        the ones already loaded: get_headers_generator then yields only the new rows.
+        Returns the number of new messages, or None if the file changed in another
+        way (it has to be opened again).
+        """
+        with self.lock:
+            if not self.scanner: return None
+            old = self.scanner
+            scanner = MboxScanner(self.filepath)
+            if scanner.size == old.size:
+                scanner.close()
+                return 0
+
+            old_count = len(old)
+            same_prefix = (old.mm is not None and scanner.mm is not None and
+                           prefix_fingerprint(old.mm, old.size) == prefix_fingerprint(scanner.mm, old.size))
+            if not same_prefix or scanner.scan_appended(old.starts, old.stops, old.size) is None:
+                scanner.close()
+                return None
+
+            old.close()
+            self.scanner = scanner
+            self.cached_rows = None
+            self.prefix_rows = None
+            self.first_new_key = old_count
+            return len(scanner) - old_count
+
+    def close(self):
         with self.lock:
-            if not self.mbox: return
+            if self.scanner:
+                self.scanner.close()
+            self.scanner = None
+            self.cached_rows = None
+            self.prefix_rows = None
+            self.first_new_key = 0
+
+    def _read_message_bytes(self, key):
+        """Raw message bytes without the leading 'From ' separator line."""
+        with self.lock:
+            if not self.scanner: return b""
+            view = self.scanner.message(key)
             try:
-                keys = self.mbox.keys()
-            except Exception:
-                return
+                return bytes(view)
+            finally:
+                view.release()
 
-        for key in keys:
+    def _read_header_bytes(self, key):
+        """Only the header block of a message, attachments are never touched."""
+        with self.lock:
+            if not self.scanner: return b""
+            view = self.scanner.headers(key)
             try:
-                # 1. READ DATA (Thread Safe)
-                with self.lock:
-                    msg_proxy = self.mbox.get_message(key)
-                    # Convert to email object immediately to detach from file
-                    # so we don't hold the lock during parsing
-                    msg_bytes = msg_proxy.as_bytes()
+                return bytes(view)
+            finally:
+                view.release()
 
-                # 2. PARSE DATA (No Lock needed here, purely memory CPU work)
-                msg = email.message_from_bytes(msg_bytes)
+    def get_headers_generator(self):
+        with self.lock:
+            if not self.scanner: return
+            rows = self.cached_rows
+            prefix_rows = self.prefix_rows
+            first_key = self.first_new_key
+            key_count = len(self.scanner)
 
-                subject = self._decode_str(msg['subject'] or "(No Subject)")[:100]
-                sender = self._decode_str(msg['from'] or "Unknown")[:100]
+        if rows is not None:
+            yield from rows
+            return
 
-                date_str = msg['date']
-                display_date = str(date_str)[:20] if date_str else ""
-                try:
-                    if date_str:
-                        dt = parsedate_to_datetime(date_str)
-                        display_date = dt.strftime('%Y-%m-%d %H:%M')
-                except:
-                    pass
+        scanned_rows = []
+        if prefix_rows is not None:
+            yield from prefix_rows
+            if self.write_index:
+                scanned_rows.extend(prefix_rows)
 
-                # Categorization
-                labels = msg.get('X-Gmail-Labels', '').lower()
-                folder = "Inbox"
-                if 'sent' in labels:
-                    folder = "Sent"
-                elif 'trash' in labels or 'bin' in labels:
-                    folder = "Trash"
-                elif 'spam' in labels:
-                    folder = "Spam"
-                elif 'draft' in labels:
-                    folder = "Drafts"
-                elif 'archived' in labels:
-                    folder = "Archived"
-
-                yield (key, sender, subject, display_date, folder)
+        for key in range(first_key, key_count):
+            try:
+                # 1. READ HEADERS ONLY (Thread Safe)
+                header_bytes = self._read_header_bytes(key)
 
+                # 2. PARSE DATA (No Lock needed here, purely memory CPU work)
+                attachments = self._catalogue(key) if self.catalogue_attachments else None
+                row = parse_header_row(key, header_bytes, attachments, self.message_size(key))
             except Exception:
                 continue
 
+            if self.write_index:
+                scanned_rows.append(row)
+            yield row
+
+        # Only reached when the scan was not interrupted
+        self.save_index(scanned_rows)
+
+    def content_digest(self, key):
+        """
+        SHA-1 of the message body (everything below the header block). Copies of one
+        message in different Takeout mailboxes share it, although their headers differ.
+        """
+        with self.lock:
+            if not self.scanner: return None
+            header_view = self.scanner.headers(key)
+            view = self.scanner.message(key)
+            try:
+                return hashlib.sha1(view[len(header_view):]).digest()
+            finally:
+                header_view.release()
+                view.release()
+
+    def _catalogue(self, key):
+        with self.lock:
+            if not self.scanner: return None
+            mm = self.scanner.mm
+            start, stop = self.scanner.message_range(key)
+        return catalogue_attachments(mm, start, stop)
+
+    def save_index(self, rows):
+        """Stores the boundaries and header rows of a completed scan in the sidecar index."""
+        if not self.write_index: return
+        with self.lock:
+            if not (self.index_cache and self.scanner): return
+            if self.first_new_key and self.prefix_rows is None:
+                # After refresh() only the new rows were scanned, the others are in the old index
+                cached = self.index_cache.load(require_attachments=self.catalogue_attachments)
+                if not cached or len(cached[0]) != self.first_new_key:
+                    return
+                rows = cached[2] + rows
+            self.index_cache.save(self.scanner.starts, self.scanner.stops, rows,
+                                  attachments=self.catalogue_attachments, indexed_size=self.scanner.size)
+
+    def save_attachment(self, entry, target_path, cancelled=None):
+        """
+        Streams one catalogued attachment to disk, decoding chunk by chunk.
+        Returns the number of bytes written, or None if cancelled.
+        """
+        with self.lock:
+            if not self.scanner: return None
+            mm = self.scanner.mm
+
+        written = 0
+        with open(target_path, 'wb') as f:
+            for chunk in iter_decoded(mm, entry):
+                if cancelled and cancelled():
+                    return None
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+    @diagnostics.timed("mail.render_body")
     def get_email_body(self, key):
         try:
             with self.lock:
-                if not self.mbox: return ""
-                msg_proxy = self.mbox.get_message(key)
-                msg_bytes = msg_proxy.as_bytes()
+                if not self.scanner: return ""
+                msg_bytes = self._read_message_bytes(key)
 
             # Parsing happens after lock is released
             email_msg = email.message_from_bytes(msg_bytes)
-            return self._process_body_and_images(email_msg)
+            return self._process_body_and_images(email_msg, key)
         except Exception as e:
             return f"<h3>Error reading email</h3><p>{str(e)}</p>"
 
-    def _process_body_and_images(self, msg):
+    def message_size(self, key):
+        """Bytes of one message in the mailbox (attachments included)."""
+        with self.lock:
+            if not self.scanner: return 0
+            return self.scanner.stops[key] - self.scanner.starts[key]
+
+    def iter_body_html(self, key, chunk_size=DECODE_CHUNK):
+        """
+        The message as HTML in pieces of about chunk_size characters, for bodies too
+        large to render in one go. Only the body part is read, decoded chunk by
+        chunk straight from the mailbox; plain text is escaped piece by piece.
+        The attachment footer comes last.
+        """
+        buf, parts = self.get_message_parts(key)
+        # Like _extract_bodies: the HTML body if there is one, the last of each kind wins
+        bodies = {part.content_type: part for part in parts
+                  if part.content_type in ("text/html", "text/plain") and part.disposition != "attachment"}
+        part = bodies.get("text/html") or bodies.get("text/plain")
+
+        if part is not None:
+            try:
+                decoder = codecs.getincrementaldecoder(part.charset or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            pieces = (decoder.decode(chunk) for chunk in iter_decoded(buf, part, chunk_size))
+
+            if part.content_type == "text/plain":
+                opening = "<pre>"
+                for text in pieces:
+                    yield opening + html.escape(text, quote=False)
+                    opening = ""
+                yield opening + html.escape(decoder.decode(b"", final=True), quote=False) + "</pre>"
+            else:
+                def make_url(cid):
+                    return part_url(key + self.key_base, "cid", cid)
+
+                carry = ""
+                for text in pieces:
+                    text = carry + text
+                    # Cut after the last complete tag, so no cid: reference is split
+                    cut = text.rfind(">") + 1
+                    if not cut and len(text) < 4 * chunk_size:
+                        carry = text
+                        continue
+                    cut = cut or len(text)
+                    carry = text[cut:]
+                    yield rewrite_cid_urls(text[:cut], make_url)
+                yield rewrite_cid_urls(carry + decoder.decode(b"", final=True), make_url)
+
+        yield self._attachment_footer(key)
+
+    def get_message_parts(self, key):
+        """(buffer, parts): MIME leaf parts located in the mapped file, nothing is decoded."""
+        with self.lock:
+            if not self.scanner: return None, []
+            mm = self.scanner.mm
+            start, stop = self.scanner.message_range(key)
+        return mm, list_parts(mm, start, stop)
+
+    def get_part_data(self, key, cid=None, index=None):
+        """(content_type, decoded bytes) of one part of a message, or None."""
+        try:
+            buf, parts = self.get_message_parts(key)
+            part = find_part(parts, cid=cid, index=index)
+            if part is None:
+                return None
+            # Decodes only this part's byte range
+            return part.content_type, decode_part(buf, part)
+        except (ValueError, IndexError):
+            # Mailbox closed or replaced meanwhile
+            return None
+
+    def get_email_document(self, key):
+        """(sender, subject, plain text body) of one message, fed to the full-text index."""
+        msg_bytes = self._read_message_bytes(key)
+        msg = email.message_from_bytes(msg_bytes)
+        html_body, text_body = self._extract_bodies(msg)
+        body = text_body if text_body else html_to_text(html_body)
+        return decode_str(msg['from'] or ""), decode_str(msg['subject'] or ""), body
+
+    def _process_body_and_images(self, msg, key):
+        html_body, text_body = self._extract_bodies(msg)
+
+        final_html = html_body if html_body else f"<pre>{html.escape(text_body, quote=False)}</pre>"
+        # Inline images stay references, the web view fetches them on demand
+        final_html = rewrite_cid_urls(final_html, lambda cid: part_url(key + self.key_base, "cid", cid))
+        return final_html + self._attachment_footer(key)
+
+    def _attachment_footer(self, key):
+        _, parts = self.get_message_parts(key)
+        links = []
+        for part in parts:
+            if not part.is_attachment: continue
+            name = html.escape(part.filename or f"part-{part.index}")
+            size_kb = max(1, part.encoded_size * 3 // 4 // 1024)
+            links.append(f'<a href="{part_url(key + self.key_base, "part", part.index)}">{name}</a> '
+                         f'({html.escape(part.content_type)}, ~{size_kb} KB)')
+        if not links:
+            return ""
+        return ('<hr><div style="font-family: sans-serif; font-size: 12px;"><b>Attachments:</b><br>'
+                + "<br>".join(links) + "</div>")
+
+    def _extract_bodies(self, msg):
+        """Decodes the text/html and text/plain bodies, other parts are left alone."""
         html_body = ""
         text_body = ""
-        images = {}
 
         for part in msg.walk():
             content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition"))
-
-            if content_type.startswith("image/"):
-                cid = part.get("Content-ID")
-                if cid:
-                    cid = cid.strip('<>')
-                    img_data = part.get_payload(decode=True)
-                    if img_data:
-                        b64_img = base64.b64encode(img_data).decode('utf-8')
-                        images[cid] = f"data:{content_type};base64,{b64_img}"
+            if content_type not in ("text/html", "text/plain"):
                 continue
 
+            content_disposition = str(part.get("Content-Disposition"))
             if "attachment" not in content_disposition:
                 try:
                     payload = part.get_payload(decode=True)
@@ -118,20 +543,7 @@ class MboxParser:
                 except:
                     pass
 
-        final_html = html_body if html_body else f"<pre>{text_body}</pre>"
-        for cid, b64_src in images.items():
-            final_html = final_html.replace(f"cid:{cid}", b64_src)
-        return final_html
+        return html_body, text_body
 
     def _decode_str(self, header_value):
-        if not header_value: return ""
-        try:
-            parts = []
-            for bytes_content, encoding in decode_header(header_value):
-                if isinstance(bytes_content, bytes):
-                    parts.append(bytes_content.decode(encoding or 'utf-8', errors='replace'))
-                else:
-                    parts.append(str(bytes_content))
-            return "".join(parts)
-        except:
-            return str(header_value)
+        return decode_str(header_value)
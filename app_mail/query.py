@@ -0,0 +1,497 @@
+"""
+Structured mail search, Gmail style:
+
+    from:alice subject:"quarterly report" after:2023/01/01 -label:spam
+    (from:bob OR to:bob) has:attachment larger:5M
+
+Terms next to each other must all match (AND may be written out), OR matches
+either side and binds tighter than AND, as in Gmail; NOT or a leading '-' negates
+a term or a parenthesised group. A word without a field matches the sender or
+the subject, like the plain search box.
+
+A query is parsed into a tree of nodes and compiled against a MessageStore into
+plans. Every plan can
+  - estimate(stop): roughly how many rows below `stop` match,
+  - rows(stop): the matching rows below `stop` (ascending array), from an index,
+  - filter(rows): the matching rows of a row list, tested row by row.
+An AND plan reads the rows of its most selective child from its index and tests
+only those against the other children, cheapest test first: label postings,
+binary searches in the date and size sort orders, the string tables' flags and
+rows per distinct sender, subject or recipient list.
+"""
+import re
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date
+from itertools import chain, compress
+
+try:
+    from parser import NO_DATE
+except ImportError:
+    from app_mail.parser import NO_DATE
+
+# Field name -> what it searches
+TEXT_FIELDS = {"from": ("sender",), "to": ("recipients",), "subject": ("subject",)}
+LABEL_FIELDS = ("label", "in")
+DATE_FIELDS = ("before", "after")
+SIZE_FIELDS = ("larger", "smaller")
+FIELDS = set(TEXT_FIELDS) | set(LABEL_FIELDS) | set(DATE_FIELDS) | set(SIZE_FIELDS) | {"has"}
+# Searched by words without a field
+DEFAULT_TEXT_FIELDS = ("sender", "subject")
+OPERATORS = ("AND", "OR", "NOT")
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "kb": 1024, "m": 1024 ** 2, "mb": 1024 ** 2,
+              "g": 1024 ** 3, "gb": 1024 ** 3}
+# A text term matching more than 1/TEXT_SCAN_RATIO of the rows is answered by testing
+# every row instead of merging the rows of its strings
+TEXT_SCAN_RATIO = 2
+
+_TOKEN_RE = re.compile(r'''\s*(?:
+      (?P<paren>[()])
+    | (?P<negate>-)(?=[^\s)-])
+    | (?P<field>[A-Za-z_]+):(?P<value>"[^"]*"?|[^\s()"]*)
+    | (?P<phrase>"[^"]*"?)
+    | (?P<word>[^\s()"]+)
+    )''', re.VERBOSE)
+_DATE_RE = re.compile(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})$")
+_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]*)$")
+# bytes.translate table turning 0/1 membership flags into their complement
+_INVERT_FLAGS = bytes([1, 0]) + bytes(254)
+
+
+class QueryError(ValueError):
+    """The search text looks like a query but cannot be parsed."""
+
+
+# --- Parsing ---
+def tokenize(text):
+    """
+    Tokens of a search text: '(' and ')', 'NOT' (also for a leading '-'), 'AND',
+    'OR' and ('term', field, value) - field is None for plain words and phrases.
+    """
+    tokens = []
+    pos = 0
+    while True:
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        if match.group("paren"):
+            tokens.append(match.group("paren"))
+        elif match.group("negate"):
+            tokens.append("NOT")
+        elif match.group("field") and match.group("field").lower() in FIELDS:
+            tokens.append(("term", match.group("field").lower(), match.group("value").strip('"')))
+        elif match.group("phrase"):
+            tokens.append(("term", None, match.group("phrase").strip('"')))
+        else:
+            # Also unknown fields like "Re:" - searched as they are
+            word = match.group(0).strip()
+            tokens.append(word if word in OPERATORS else ("term", None, word))
+    return tokens
+
+
+def is_structured(text):
+    """True when a search text uses query syntax (a known field, an operator or a group)."""
+    if not text or not any(c in text for c in ':()-ANO'):
+        return False
+    return any(not isinstance(token, tuple) or token[1] is not None for token in tokenize(text))
+
+
+def parse_query(text):
+    """
+    Query tree of a search text: ('and', [nodes]), ('or', [nodes]), ('not', node),
+    ('term', field, value) or ('all',) for an empty query. Raises QueryError.
+    """
+    tokens = tokenize(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_and():
+        nonlocal pos
+        nodes = []
+        while peek() is not None and peek() != ")":
+            if peek() == "AND":
+                pos += 1
+                continue
+            nodes.append(parse_or())
+        nodes = [node for node in nodes if node != ("all",)]
+        if not nodes:
+            return ("all",)
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_or():
+        nonlocal pos
+        nodes = [parse_unary()]
+        while peek() == "OR":
+            pos += 1
+            nodes.append(parse_unary())
+        if ("all",) in nodes:
+            return ("all",)
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_unary():
+        nonlocal pos
+        token = peek()
+        if token is None or token in (")", "OR", "AND"):
+            raise QueryError("Search term expected" + (f" before {token}" if token else " at the end"))
+        pos += 1
+        if token == "NOT":
+            node = parse_unary()
+            return ("all",) if node == ("all",) else ("not", node)
+        if token == "(":
+            node = parse_and()
+            if peek() != ")":
+                raise QueryError("Missing )")
+            pos += 1
+            return node
+        _, field, value = token
+        if not value:
+            return ("all",)  # "from:" while it is being typed
+        _check_term(field, value)
+        return token
+
+    node = parse_and()
+    if pos < len(tokens):
+        raise QueryError("Unbalanced )")
+    return node
+
+
+def query_fields(node):
+    """Fields used anywhere in a query tree."""
+    if node[0] == "term":
+        return {node[1]}
+    if node[0] == "not":
+        return query_fields(node[1])
+    if node[0] in ("and", "or"):
+        return set().union(*map(query_fields, node[1]))
+    return set()
+
+
+def _check_term(field, value):
+    """Validates values whose syntax is fixed, so errors show while typing rather than match nothing."""
+    if field in DATE_FIELDS:
+        parse_day(value)
+    elif field in SIZE_FIELDS:
+        parse_size(value)
+    elif field == "has" and value.lower() not in ("attachment", "attachments"):
+        raise QueryError(f"Unknown has: value {value!r} (has:attachment)")
+
+
+def parse_day(value):
+    """Epoch of local midnight of a YYYY/MM/DD or YYYY-MM-DD date."""
+    match = _DATE_RE.match(value)
+    try:
+        day = date(*map(int, match.groups()))
+        return int(time.mktime((day.year, day.month, day.day, 0, 0, 0, 0, 0, -1)))
+    except (AttributeError, ValueError, OverflowError):
+        raise QueryError(f"Invalid date {value!r} (YYYY/MM/DD)") from None
+
+
+def parse_size(value):
+    """Bytes of a size like 500000, 200K, 10M or 1.5G."""
+    match = _SIZE_RE.match(value.lower())
+    if not match or match.group(2) not in SIZE_UNITS:
+        raise QueryError(f"Invalid size {value!r} (e.g. 10M)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def _label_key(name):
+    """Labels compare case-insensitively, with '-' standing for spaces and '/' as in Gmail."""
+    return re.sub(r"[\s/-]+", "-", name.casefold())
+
+
+# --- Plans ---
+class AllPlan:
+    cost = 0
+
+    def estimate(self, stop):
+        return stop
+
+    def rows(self, stop):
+        return array('I', range(stop))
+
+    def filter(self, rows):
+        return list(rows)
+
+
+class EmptyPlan:
+    cost = 0
+
+    def estimate(self, stop):
+        return 0
+
+    def rows(self, stop):
+        return array('I')
+
+    def filter(self, rows):
+        return []
+
+
+class LabelPlan:
+    """Rows carrying all of some labels: posting lists and membership flags."""
+    cost = 0
+
+    def __init__(self, store, codes):
+        self.store = store
+        self.codes = codes
+
+    def estimate(self, stop):
+        return min(len(self.store.label_rows[code]) for code in self.codes)
+
+    def rows(self, stop):
+        return self.store.rows_with_labels(self.codes, 0, stop)
+
+    def filter(self, rows):
+        for code in self.codes:
+            member = self.store.label_membership(code)
+            rows = [row for row in rows if member[row]]
+        return rows
+
+
+class RangePlan:
+    """Rows with lo <= value < hi of the dates or sizes, binary searches in the store's sort order."""
+    cost = 1
+
+    def __init__(self, store, field, lo, hi):
+        self.store = store
+        self.field = field
+        self.values = store.dates if field == "date" else store.sizes
+        self.lo = lo
+        self.hi = hi
+
+    def _bounds(self):
+        order = self.store.sort_order(self.field)
+        value = self.values.__getitem__
+        start = bisect_left(order, self.lo, key=value)
+        return order, start, bisect_left(order, self.hi, start, key=value)
+
+    def estimate(self, stop):
+        _, start, end = self._bounds()
+        return end - start
+
+    def rows(self, stop):
+        order, start, end = self._bounds()
+        rows = sorted(order[start:end])
+        return array('I', rows[:bisect_left(rows, stop)])
+
+    def filter(self, rows):
+        values, lo, hi = self.values, self.lo, self.hi
+        return [row for row in rows if lo <= values[row] < hi]
+
+
+class AttachmentPlan:
+    """Rows with catalogued attachments (the store's sparse attachment map)."""
+    cost = 1
+
+    def __init__(self, store):
+        self.store = store
+
+    def estimate(self, stop):
+        return len(self.store.attachments)
+
+    def rows(self, stop):
+        # Rows are added in ascending order; list() copies in one step while the loader adds more
+        rows = list(self.store.attachments)
+        return array('I', rows[:bisect_left(rows, stop)])
+
+    def filter(self, rows):
+        attachments = self.store.attachments
+        return [row for row in rows if row in attachments]
+
+
+class TextPlan:
+    """
+    Rows whose text fields contain a needle, with a few typos if `fuzzy`. The
+    distinct strings are matched once (StringTable.matching_ids / fuzzy_ids); when
+    few strings match, their rows are read from the id postings, otherwise every
+    row is tested through the flags.
+    """
+    cost = 2
+
+    def __init__(self, store, fields, needle, fuzzy=False, cancelled=None):
+        self.store = store
+        self.fields = fields
+        self.needle = needle
+        self.fuzzy = fuzzy
+        self.cancelled = cancelled
+        self._columns = None
+        self._estimate = None
+
+    def columns(self):
+        """(flags, id per row, rows per id) of every searched field."""
+        if self._columns is None:
+            columns = []
+            for field in self.fields:
+                table, ids = self.store.text_column(field)
+                match = table.fuzzy_ids if self.fuzzy else table.matching_ids
+                flags = match(self.needle, self.cancelled)
+                if flags is None:
+                    flags = bytearray(len(table))  # Cancelled, the caller drops the result
+                columns.append((flags, ids, self.store.id_postings(field)))
+            self._columns = columns
+        return self._columns
+
+    def _matched_postings(self):
+        """(flags, rows per id) of the fields where some string matches."""
+        return [(flags, postings) for flags, _, postings in self.columns() if 1 in flags]
+
+    def estimate(self, stop):
+        # The share of matching strings, as if every string had as many rows
+        if self._estimate is None:
+            self._estimate = sum(flags.count(1) / len(flags) for flags, _, _ in self.columns() if flags)
+        return min(stop, int(stop * self._estimate))
+
+    def rows(self, stop):
+        if self.estimate(stop) * TEXT_SCAN_RATIO > stop:
+            return array('I', self.filter(range(stop)))
+        matched = chain.from_iterable(chain.from_iterable(compress(postings, flags))
+                                      for flags, postings in self._matched_postings())
+        # Each row has one string per field, so only several fields can repeat a row
+        matched = sorted(set(matched) if len(self.fields) > 1 else matched)
+        # Rows added while the search runs are past `stop`
+        return array('I', matched[:bisect_left(matched, stop)])
+
+    def filter(self, rows):
+        columns = self.columns()
+        if len(columns) == 1:
+            flags, ids, _ = columns[0]
+            return [row for row in rows if flags[ids[row]]]
+        (flags_a, ids_a, _), (flags_b, ids_b, _) = columns[:2]
+        return [row for row in rows if flags_a[ids_a[row]] or flags_b[ids_b[row]]]
+
+
+class NotPlan:
+    cost = 3
+
+    def __init__(self, child):
+        self.child = child
+
+    def estimate(self, stop):
+        return max(0, stop - self.child.estimate(stop))
+
+    def rows(self, stop):
+        if isinstance(self.child, LabelPlan) and len(self.child.codes) == 1:
+            keep = self.child.store.label_membership(self.child.codes[0])[:stop].translate(_INVERT_FLAGS)
+        else:
+            keep = bytearray(b"\x01") * stop
+            for row in self.child.rows(stop):
+                keep[row] = 0
+        return array('I', compress(range(stop), keep))
+
+    def filter(self, rows):
+        if isinstance(self.child, LabelPlan) and len(self.child.codes) == 1:
+            member = self.child.store.label_membership(self.child.codes[0])
+            return [row for row in rows if not member[row]]
+        rows = list(rows)
+        excluded = set(self.child.filter(rows))
+        return [row for row in rows if row not in excluded]
+
+
+class AndPlan:
+    cost = 3
+
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, stop):
+        return min(child.estimate(stop) for child in self.children)
+
+    def rows(self, stop):
+        # Materialize the most selective child, the others only test its rows
+        estimates = sorted((child.estimate(stop), i) for i, child in enumerate(self.children))
+        rows = self.children[estimates[0][1]].rows(stop)
+        for _, i in estimates[1:]:
+            if not rows:
+                break
+            rows = self.children[i].filter(rows)
+        return array('I', rows)
+
+    def filter(self, rows):
+        for child in sorted(self.children, key=lambda child: child.cost):
+            rows = child.filter(rows)
+        return rows
+
+
+class OrPlan:
+    cost = 3
+
+    def __init__(self, children):
+        self.children = children
+
+    def estimate(self, stop):
+        return min(stop, sum(child.estimate(stop) for child in self.children))
+
+    def rows(self, stop):
+        return array('I', sorted(set().union(*(child.rows(stop) for child in self.children))))
+
+    def filter(self, rows):
+        rows = list(rows)
+        remaining = rows
+        matched = set()
+        for child in self.children:
+            matched.update(child.filter(remaining))
+            remaining = [row for row in remaining if row not in matched]
+        return [row for row in rows if row in matched]
+
+
+def compile_query(store, text, codes=None, cancelled=None):
+    """
+    Plan for a search text over a MessageStore, AND the label codes of the folder
+    filter (None = no folder, -1 for an unknown label). Raises QueryError.
+    Text terms stop matching once `cancelled()` reports true.
+    """
+    return _with_folder(store, _compile(store, parse_query(text), cancelled), codes)
+
+
+def compile_text(store, text, codes=None, cancelled=None):
+    """Plan for plain search text: one substring of the sender or the subject, in the folder."""
+    return _with_folder(store, TextPlan(store, DEFAULT_TEXT_FIELDS, text.casefold(), cancelled=cancelled), codes)
+
+
+def _with_folder(store, plan, codes):
+    if codes is None:
+        return plan
+    if -1 in codes:
+        return EmptyPlan()
+    folder = LabelPlan(store, codes)
+    if isinstance(plan, AllPlan):
+        return folder
+    return AndPlan([folder, plan])
+
+
+def _compile(store, node, cancelled=None):
+    kind = node[0]
+    if kind == "all":
+        return AllPlan()
+    if kind == "not":
+        return NotPlan(_compile(store, node[1], cancelled))
+    if kind in ("and", "or"):
+        children = [_compile(store, child, cancelled) for child in node[1]]
+        return AndPlan(children) if kind == "and" else OrPlan(children)
+
+    _, field, value = node
+    if field is None or field in TEXT_FIELDS:
+        fields = TEXT_FIELDS[field] if field else DEFAULT_TEXT_FIELDS
+        fuzzy = field is not None and value.startswith("~") and len(value) > 1
+        return TextPlan(store, fields, value[fuzzy:].casefold(), fuzzy, cancelled)
+    if field in LABEL_FIELDS:
+        if value.casefold() in ("all", "anywhere"):
+            return AllPlan()
+        wanted = _label_key(value)
+        codes = [code for code, name in enumerate(store.label_names) if _label_key(name) == wanted]
+        if not codes:
+            return EmptyPlan()
+        return LabelPlan(store, codes) if len(codes) == 1 else OrPlan([LabelPlan(store, [code]) for code in codes])
+    if field == "before":
+        return RangePlan(store, "date", NO_DATE + 1, parse_day(value))
+    if field == "after":
+        return RangePlan(store, "date", parse_day(value), 1 << 62)
+    if field == "larger":
+        return RangePlan(store, "size", parse_size(value), 1 << 62)
+    if field == "smaller":
+        return RangePlan(store, "size", 0, parse_size(value))
+    return AttachmentPlan(store)
@@ -0,0 +1,195 @@
+import os
+import threading
+from bisect import bisect_right
+
+import takeout_archive
+
+try:
+    from parser import MboxParser
+except ImportError:
+    from app_mail.parser import MboxParser
+
+MBOX_EXTENSIONS = (".mbox",)
+
+
+def find_mailboxes(folder):
+    """
+    Every .mbox file below a folder (e.g. an extracted Takeout export), in a stable
+    order. For a Takeout archive, the member paths of the .mbox files inside it.
+    """
+    if takeout_archive.is_archive(folder):
+        return takeout_archive.expand_paths([folder], MBOX_EXTENSIONS)
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files)
+                     if os.path.splitext(name)[1].lower() in MBOX_EXTENSIONS)
+    return paths
+
+
+class MailboxSet:
+    """
+    One or more mailboxes behind the MboxParser interface, each read by its own
+    MboxParser. A message key is the key within its source plus the number of
+    messages in the sources before it, so a single mailbox keeps its own keys.
+    """
+
+    def __init__(self):
+        self.sources = []  # MboxParser per file
+        self.bases = []  # First key of each source
+        self.total = 0
+        self.catalogue_attachments = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return self.total
+
+    @property
+    def paths(self):
+        return [source.filepath for source in self.sources]
+
+    @property
+    def size(self):
+        """Bytes of all mailboxes together."""
+        return sum(source.scanner.size for source in self.sources if source.scanner)
+
+    def load(self, paths):
+        """Opens every mailbox (boundary scan or sidecar index). Returns the total message count."""
+        with self.lock:
+            self.close()
+            sources, bases, total = [], [], 0
+            try:
+                for path in paths:
+                    parser = MboxParser()
+                    parser.catalogue_attachments = self.catalogue_attachments
+                    # Part URLs in rendered bodies then carry the key within the whole set
+                    parser.key_base = total
+                    sources.append(parser)
+                    bases.append(total)
+                    total += parser.load_mbox(path)
+            except Exception:
+                for parser in sources:
+                    parser.close()
+                raise
+            self.sources, self.bases, self.total = sources, bases, total
+            return total
+
+    def refresh(self):
+        """
+        Picks up messages appended to the last mailbox (MboxParser.refresh), keys of
+        loaded messages stay valid. Returns the number of new messages, or None if the
+        mailboxes changed in another way and have to be loaded again.
+        """
+        with self.lock:
+            if not self.sources:
+                return None
+            # Growth of an earlier file would shift the keys of every file after it
+            for source in self.sources[:-1]:
+                try:
+                    if takeout_archive.path_size(source.filepath) != source.scanner.size:
+                        return None
+                except (OSError, KeyError):
+                    return None
+            added = self.sources[-1].refresh()
+            if added:
+                self.total += added
+            return added
+
+    def close(self):
+        with self.lock:
+            for source in self.sources:
+                source.close()
+            self.sources, self.bases, self.total = [], [], 0
+
+    def locate(self, key):
+        """(MboxParser, key within that mailbox) of a key."""
+        with self.lock:
+            i = bisect_right(self.bases, key) - 1
+            if i < 0:
+                raise IndexError(key)
+            return self.sources[i], key - self.bases[i]
+
+    def scanned_bytes(self, key):
+        """Bytes of all mailboxes up to the end of this message (scan progress)."""
+        with self.lock:
+            parser, local_key = self.locate(key)
+            done = sum(source.scanner.size for source in self.sources[:self.sources.index(parser)]
+                       if source.scanner)
+            return done + (parser.scanner.stops[local_key] if parser.scanner else 0)
+
+    # --- MboxParser interface, forwarded to the message's mailbox ---
+    def get_email_body(self, key):
+        try:
+            parser, local_key = self.locate(key)
+        except IndexError:
+            return ""
+        return parser.get_email_body(local_key)
+
+    def message_size(self, key):
+        try:
+            parser, local_key = self.locate(key)
+        except IndexError:
+            return 0
+        return parser.message_size(local_key)
+
+    def iter_body_html(self, key, chunk_size):
+        parser, local_key = self.locate(key)
+        return parser.iter_body_html(local_key, chunk_size)
+
+    def get_email_document(self, key):
+        parser, local_key = self.locate(key)
+        return parser.get_email_document(local_key)
+
+    def get_part_data(self, key, cid=None, index=None):
+        try:
+            parser, local_key = self.locate(key)
+        except IndexError:
+            return None
+        return parser.get_part_data(local_key, cid=cid, index=index)
+
+    def content_digest(self, key):
+        parser, local_key = self.locate(key)
+        return parser.content_digest(local_key)
+
+    def save_attachment(self, key, entry, target_path, cancelled=None):
+        """Entry offsets are positions in the message's own mailbox."""
+        parser, _ = self.locate(key)
+        return parser.save_attachment(entry, target_path, cancelled)
+
+
+class DuplicateFilter:
+    """
+    Drops messages already loaded from another mailbox of the set. Takeout puts a
+    message into the file of every label it has, so copies are matched by
+    Message-ID, or by a hash of the body when there is none. The labels of a
+    dropped copy are reported for the kept message.
+    """
+
+    def __init__(self, mailboxes):
+        self.mailboxes = mailboxes
+        self.seen = {}  # Message-ID or body digest -> key of the kept message
+        self.dropped = 0
+
+    def filter(self, rows, merged):
+        """Returns the new rows; (kept key, labels) of every dropped copy is appended to `merged`."""
+        seen = self.seen
+        unique = []
+        for row in rows:
+            key = row[0]
+            identity = row[6][0]
+            if not identity:
+                try:
+                    # Sender, subject and date too, so empty bodies are not all one message
+                    identity = (self.mailboxes.content_digest(key), row[1], row[2], row[3])
+                except Exception:
+                    unique.append(row)
+                    continue
+
+            kept = seen.get(identity)
+            if kept is None:
+                seen[identity] = key
+                unique.append(row)
+            else:
+                merged.append((kept, row[4]))
+                self.dropped += 1
+        return unique
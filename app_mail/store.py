@@ -0,0 +1,674 @@
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import compress, islice
+
+import diagnostics
+
+try:
+    from parser import NO_DATE
+    from conversations import ConversationIndex
+    from query import QueryError, is_structured, compile_query, compile_text
+except ImportError:
+    from app_mail.parser import NO_DATE
+    from app_mail.conversations import ConversationIndex
+    from app_mail.query import QueryError, is_structured, compile_query, compile_text
+
+# Rows filtered between two checks of the cancel callback
+FILTER_BLOCK = 65536
+# Needles whose string flags are kept per table (terms of a query, text typed so far)
+MATCH_CACHE_SIZE = 8
+# A query tests row lists shorter than 1/QUERY_SCAN_RATIO of the store row by row,
+# longer ones are answered from the indexes and intersected
+QUERY_SCAN_RATIO = 16
+# Query matches fewer than 1/QUERY_SORT_RATIO of a sort order are sorted rather than
+# picked out by walking the whole order
+QUERY_SORT_RATIO = 4
+# Labels merged from copies in other mailboxes are collected until they reach
+# 1/MERGE_FLUSH_RATIO of the label's posting list, then merged in one pass
+MERGE_FLUSH_RATIO = 4
+# Text fields with a trigram index (plain search and from:/subject:); to: scans the
+# distinct recipient lists, nearly one per message, which would make the index huge
+INDEXED_FIELDS = ("sender", "subject")
+# Strings added to the trigram index between two checks of the cancel callback
+TRIGRAM_BLOCK = 4096
+# Typos allowed by a fuzzy search: (minimum needle length, edits), longest first
+FUZZY_EDITS = ((12, 2), (4, 1))
+
+
+def trigrams(text):
+    """Distinct 3-character substrings of a (case-folded) string."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def within_edits(needle, text, max_edits):
+    """
+    True if some substring of `text` is at most `max_edits` insertions, deletions,
+    substitutions or swaps of neighbouring characters away from `needle`.
+    Bit-parallel edit distance search (Myers, with Hyyro's swap extension): one
+    column of the distance table per character of `text`, held as bit vectors of
+    the differences between neighbouring cells, so a step costs a few int operations.
+    """
+    if needle in text:
+        return True
+    size = len(needle)
+    mask = (1 << size) - 1
+    last = 1 << (size - 1)
+    positions = {}  # character -> bits of its positions in the needle
+    for i, char in enumerate(needle):
+        positions[char] = positions.get(char, 0) | (1 << i)
+
+    vp, vn, d0, previous_eq = mask, 0, 0, 0
+    score = size  # Distance of the whole needle to the best substring ending here
+    for char in text:
+        eq = positions.get(char, 0)
+        d0 = (((~d0 & eq) << 1) & previous_eq) | (((eq & vp) + vp) ^ vp) | eq | vn
+        d0 &= mask
+        hp = vn | (~(d0 | vp) & mask)
+        hn = vp & d0
+        if hp & last:
+            score += 1
+        elif hn & last:
+            score -= 1
+        if score <= max_edits:
+            return True
+        # No carry into the first row: a match may start at any character
+        hp = (hp << 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(d0 | hp) & mask)
+        vn = hp & d0
+        previous_eq = eq
+    return False
+
+
+class StringTable:
+    """Interned strings: every distinct value is stored (and case-folded) once."""
+
+    def __init__(self):
+        self.values = []
+        self.folded = []
+        self._ids = {}
+        # Recent searches: needle -> flags, extended for new strings instead of rescanned
+        self._matches = {}
+        # id -> position of the string in case-folded order, rebuilt when strings are added
+        self._ranks = None
+        # trigram -> ascending ids of the strings containing it, for the first _indexed strings
+        self._trigrams = {}
+        self._indexed = 0
+        self._trigram_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        sid = self._ids.get(value)
+        if sid is None:
+            sid = len(self.values)
+            self._ids[value] = sid
+            self.values.append(value)
+            self.folded.append(value.casefold())
+        return sid
+
+    def index_trigrams(self, cancelled=None):
+        """
+        Adds the strings interned since the last call to the trigram index.
+        Returns False if `cancelled()` became true on the way (the index stays usable).
+        """
+        with self._trigram_lock:
+            postings = self._trigrams
+            folded = self.folded
+            count = len(folded)
+            for start in range(self._indexed, count, TRIGRAM_BLOCK):
+                if cancelled and cancelled():
+                    return False
+                stop = min(start + TRIGRAM_BLOCK, count)
+                for sid in range(start, stop):
+                    for gram in trigrams(folded[sid]):
+                        posting = postings.get(gram)
+                        if posting is None:
+                            postings[gram] = array('I', (sid,))
+                        else:
+                            posting.append(sid)
+                self._indexed = stop
+        return True
+
+    def _trigram_matches(self, needle):
+        """
+        Flags of the indexed strings containing a needle of 3+ characters: only the
+        strings on the shortest posting list of its trigrams are checked.
+        """
+        indexed = self._indexed
+        flags = bytearray(indexed)
+        postings = [self._trigrams.get(gram, ()) for gram in trigrams(needle)]
+        folded = self.folded
+        for sid in min(postings, key=len):
+            if sid < indexed and needle in folded[sid]:
+                flags[sid] = 1
+        return flags
+
+    def matching_ids(self, needle, cancelled=None):
+        """
+        Flags (bytearray indexed by id) of the strings containing the case-folded needle.
+        Strings covered by the trigram index are looked up, the others are scanned.
+        Returns None if `cancelled()` became true on the way.
+        """
+        # Copy, the search thread and the loader may extend this at the same time
+        flags = bytearray(self._matches.get(needle, b""))
+        if not flags and len(needle) >= 3 and self._indexed:
+            flags = self._trigram_matches(needle)
+
+        folded = self.folded
+        count = len(folded)
+        for start in range(len(flags), count, FILTER_BLOCK):
+            if cancelled and cancelled():
+                return None
+            flags.extend([needle in text for text in folded[start:min(start + FILTER_BLOCK, count)]])
+
+        matches = dict(self._matches)
+        matches.pop(needle, None)
+        if len(matches) >= MATCH_CACHE_SIZE:
+            del matches[next(iter(matches))]
+        matches[needle] = flags
+        self._matches = matches
+        return flags
+
+    def fuzzy_ids(self, needle, cancelled=None):
+        """
+        Flags of the strings containing the case-folded needle with a few typos
+        (FUZZY_EDITS, see within_edits). A string with k edits still has all but at
+        most 4k of the needle's trigrams, so it has one of the rarest 4k + 1: only
+        those posting lists are read, and strings with too few trigrams in common
+        are dropped before the edit distance is computed. Short needles are split
+        in two halves that are looked up exactly instead.
+        Returns None if `cancelled()` became true on the way.
+        """
+        edits = next((edits for length, edits in FUZZY_EDITS if len(needle) >= length), 0)
+        if not edits:
+            return self.matching_ids(needle, cancelled)
+
+        grams = trigrams(needle)
+        required = len(grams) - 4 * edits
+        folded = self.folded
+        if required < 1:
+            # Too short for the trigram count: one substituted or inserted character can
+            # touch every trigram. With one edit, either half of the needle is still in
+            # the string, or the needle with the two middle characters swapped is
+            candidates = set()
+            if edits == 1:
+                half = len(needle) // 2
+                pieces = (needle[:half], needle[half:],
+                          needle[:half - 1] + needle[half] + needle[half - 1] + needle[half + 1:])
+                for piece in pieces:
+                    flags = self.matching_ids(piece, cancelled)
+                    if flags is None:
+                        return None
+                    candidates.update(compress(range(len(flags)), flags))
+            else:
+                candidates.update(range(len(folded)))
+            candidates = sorted(candidates)
+            grams, required = (), 0
+        else:
+            postings = self._trigrams
+            indexed = self._indexed
+            rarest = sorted((postings.get(gram, ()) for gram in grams), key=len)[:len(grams) - required + 1]
+            candidates = [sid for sid in set().union(*rarest) if sid < indexed]
+            # Strings not indexed yet are all candidates
+            candidates.extend(range(indexed, len(folded)))
+
+        flags = bytearray(len(folded))
+        for start in range(0, len(candidates), FILTER_BLOCK):
+            if cancelled and cancelled():
+                return None
+            for sid in candidates[start:start + FILTER_BLOCK]:
+                text = folded[sid]
+                if sum(gram in text for gram in grams) >= required and within_edits(needle, text, edits):
+                    flags[sid] = 1
+        return flags
+
+    def ranks(self):
+        """Collation key per id (array): the rank of the case-folded string among all strings."""
+        if self._ranks is None or len(self._ranks) != len(self.folded):
+            order = sorted(range(len(self.folded)), key=self.folded.__getitem__)
+            ranks = array('I', bytes(4 * len(order)))
+            for rank, sid in enumerate(order):
+                ranks[sid] = rank
+            self._ranks = ranks
+        return self._ranks
+
+
+class IdPostings:
+    """
+    Rows per string id of one column (list of ascending arrays), so a query for a
+    few distinct senders reads their rows instead of testing every row.
+    Brought up to date incrementally as rows are added.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.rows = []
+        self._applied = 0
+        self._lock = threading.Lock()
+
+    def update(self):
+        """Adds the rows appended since the last call. Returns the id -> rows list."""
+        with self._lock:
+            ids, rows = self.ids, self.rows
+            count = len(ids)
+            for row in range(self._applied, count):
+                sid = ids[row]
+                if sid >= len(rows):
+                    rows.extend(array('I') for _ in range(sid + 1 - len(rows)))
+                rows[sid].append(row)
+            self._applied = count
+            return rows
+
+
+class MessageStore:
+    """
+    Column-oriented storage for the header rows of a mailbox.
+    One array per column instead of one tuple per message: keys and epoch
+    dates are 64-bit arrays, sender and subject are ids into string tables
+    that keep a case-folded copy for search. Labels (folders) are posting
+    lists: one ascending array of row indices per label, so folder views,
+    counts and label intersections never scan the whole mailbox.
+    Rows are addressed by their position (row index) in the store.
+    """
+
+    def __init__(self):
+        self.keys = array('q')
+        self.dates = array('q')
+        self.sizes = array('q')
+        self.sender_ids = array('I')
+        self.subject_ids = array('I')
+        self.recipient_ids = array('I')
+
+        # Sparse: row index -> tuple of AttachmentEntry, only for messages that have any
+        self.attachments = {}
+        self.attachments_catalogued = False
+
+        # Message-ID threading, one node per row
+        self.conversations = ConversationIndex()
+
+        self.senders = StringTable()
+        self.subjects = StringTable()
+        self.recipients = StringTable()
+        # Text field -> rows per string id, built by the first query on that field
+        self._id_postings = {}
+        self.label_names = []
+        self._label_codes = {}
+        self.label_rows = []  # label code -> array of row indices, ascending
+        # label code -> (row membership bytearray, postings applied, posting list), built on demand
+        self._label_flags = {}
+        # label code -> rows waiting to be merged into its posting list (merge_labels)
+        self._pending_labels = {}
+
+        # Keys arrive in file order, so key -> row is a binary search until proven otherwise
+        self._keys_sorted = True
+        self._row_by_key = None
+
+        # (field, descending) -> row permutation, and the inverse (row -> position)
+        self._sort_orders = {}
+        self._sort_positions = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def label_code(self, name):
+        code = self._label_codes.get(name)
+        if code is None:
+            code = len(self.label_names)
+            self._label_codes[name] = code
+            self.label_names.append(name)
+            self.label_rows.append(array('I'))
+        return code
+
+    @diagnostics.timed("store.append_rows", items=lambda args, new_range: len(new_range))
+    def append_rows(self, rows):
+        """Adds (key, sender, subject, date, labels, attachments, thread, recipients, size) tuples.
+        Returns the range of new row indices."""
+        first = len(self.keys)
+        keys = self.keys
+        sender_intern = self.senders.intern
+        subject_intern = self.subjects.intern
+        recipient_intern = self.recipients.intern
+        label_code = self.label_code
+        label_rows = self.label_rows
+        add_to_thread = self.conversations.add
+
+        for key, sender, subject, date, labels, attachments, thread, recipients, size in rows:
+            if self._keys_sorted and keys and key <= keys[-1]:
+                self._keys_sorted = False
+            row = len(keys)
+            if attachments is not None:
+                self.attachments_catalogued = True
+                if attachments:
+                    self.attachments[row] = attachments
+            self.sender_ids.append(sender_intern(sender))
+            self.subject_ids.append(subject_intern(subject))
+            self.recipient_ids.append(recipient_intern(recipients))
+            self.dates.append(date)
+            self.sizes.append(size)
+            # The key last: a row counted by len(keys) has all its columns, even for
+            # the search thread reading while rows are added
+            keys.append(key)
+            # After the key, so a posting never names a row the columns do not have yet
+            for label in labels:
+                label_rows[label_code(label)].append(row)
+            add_to_thread(*thread)
+
+        self._row_by_key = None
+        self._sort_orders.clear()
+        self._sort_positions.clear()
+        return range(first, len(self.keys))
+
+    def merge_labels(self, row_labels):
+        """
+        Adds labels to rows already stored: (row, labels) pairs, e.g. from copies of a
+        message found in other mailboxes. The rows are collected, and a posting list is
+        rebuilt once they reach 1/MERGE_FLUSH_RATIO of its length, so loading in many
+        batches costs linear time in total. flush_labels merges the rest.
+        """
+        pending = self._pending_labels
+        for row, labels in row_labels:
+            for label in labels:
+                pending.setdefault(self.label_code(label), set()).add(row)
+
+        for code in [code for code, rows in pending.items()
+                     if len(rows) * MERGE_FLUSH_RATIO >= len(self.label_rows[code])]:
+            self._merge_pending(code)
+
+    def flush_labels(self):
+        """Merges every label still collected by merge_labels (when loading has finished)."""
+        for code in list(self._pending_labels):
+            self._merge_pending(code)
+
+    def _merge_pending(self, code):
+        rows = self._pending_labels.pop(code)
+        posting = self.label_rows[code]
+        rows.difference_update(posting)
+        if rows:
+            # Replaced rather than changed in place, the search thread may be reading it
+            self.label_rows[code] = array('I', sorted(rows.union(posting)))
+
+    # --- Column access ---
+    def sender(self, row):
+        return self.senders.values[self.sender_ids[row]]
+
+    def subject(self, row):
+        return self.subjects.values[self.subject_ids[row]]
+
+    def recipient(self, row):
+        return self.recipients.values[self.recipient_ids[row]]
+
+    def text_column(self, field):
+        """(StringTable, id per row) of 'sender', 'subject' or 'recipients'."""
+        if field == "sender":
+            return self.senders, self.sender_ids
+        if field == "subject":
+            return self.subjects, self.subject_ids
+        if field == "recipients":
+            return self.recipients, self.recipient_ids
+        raise ValueError(f"Unknown text field: {field}")
+
+    def id_postings(self, field):
+        """Rows per string id of a text field (list of ascending arrays), see IdPostings."""
+        postings = self._id_postings.get(field)
+        if postings is None:
+            postings = self._id_postings.setdefault(field, IdPostings(self.text_column(field)[1]))
+        return postings.update()
+
+    @diagnostics.timed("store.build_search_index", items=lambda args, done: len(args[0]))
+    def build_search_index(self, cancelled=None):
+        """
+        Brings the trigram index and the rows per string of the sender and subject
+        up to date, so searches do not pay for it (run in the background after loading).
+        Returns False if `cancelled()` became true on the way.
+        """
+        for field in INDEXED_FIELDS:
+            table, _ = self.text_column(field)
+            if not table.index_trigrams(cancelled):
+                return False
+            if cancelled and cancelled():
+                return False
+            self.id_postings(field)
+        return True
+
+    def labels(self, row):
+        """Labels of one row, a binary search per label."""
+        names = []
+        for name, posting in zip(self.label_names, self.label_rows):
+            i = bisect_left(posting, row)
+            if i < len(posting) and posting[i] == row:
+                names.append(name)
+        return names
+
+    def display_date(self, row):
+        epoch = self.dates[row]
+        if epoch == NO_DATE:
+            return ""
+        try:
+            return time.strftime('%Y-%m-%d %H:%M', time.localtime(epoch))
+        except (OverflowError, OSError, ValueError):
+            return ""
+
+    def row_for_key(self, key):
+        """Row index of a message key, or None."""
+        if self._keys_sorted:
+            row = bisect_left(self.keys, key)
+            if row < len(self.keys) and self.keys[row] == key:
+                return row
+            return None
+        if self._row_by_key is None:
+            self._row_by_key = {k: row for row, k in enumerate(self.keys)}
+        return self._row_by_key.get(key)
+
+    # --- Sorting ---
+    @diagnostics.timed("store.sort_order")
+    def sort_order(self, field, descending=False):
+        """
+        All row indices ordered by 'sender', 'subject', 'date' or 'size' (array, cached
+        until rows are added). Rows are sorted once by a typed key per row: the epoch
+        integer for dates, the collation rank of the string for text. Equal keys keep file order.
+        """
+        order = self._sort_orders.get((field, descending))
+        # The length check also drops an order the search thread finished after rows were added
+        if order is not None and len(order) == len(self.keys):
+            return order
+
+        if descending:
+            order = array('I', reversed(self.sort_order(field)))
+        else:
+            if field == "date":
+                row_keys = self.dates
+            elif field == "size":
+                row_keys = self.sizes
+            elif field == "sender":
+                row_keys = array('I', map(self.senders.ranks().__getitem__, self.sender_ids))
+            elif field == "subject":
+                row_keys = array('I', map(self.subjects.ranks().__getitem__, self.subject_ids))
+            else:
+                raise ValueError(f"Unknown sort field: {field}")
+            order = array('I', sorted(range(len(self.keys)), key=row_keys.__getitem__))
+
+        self._sort_orders[(field, descending)] = order
+        return order
+
+    def sort_rows(self, rows, field, descending=False):
+        """`rows` (any subset) in sort order. Nearly sorted input costs about one pass."""
+        positions = self._sort_positions.get((field, descending))
+        if positions is None or len(positions) != len(self.keys):
+            order = self.sort_order(field, descending)
+            positions = array('I', bytes(4 * len(order)))
+            for position, row in enumerate(order):
+                positions[row] = position
+            self._sort_positions[(field, descending)] = positions
+        return array('I', sorted(rows, key=positions.__getitem__))
+
+    # --- Labels ---
+    def _folder_codes(self, folder):
+        """Label codes to AND together for a folder filter: "All", a label name or a tuple of names.
+        None means no restriction, -1 in the result marks an unknown label."""
+        if folder == "All":
+            return None
+        names = (folder,) if isinstance(folder, str) else folder
+        return [self._label_codes.get(name, -1) for name in names]
+
+    def rows_with_labels(self, codes, first=0, stop=None):
+        """Ascending rows carrying all the labels, limited to [first, stop): a posting intersection."""
+        if -1 in codes:
+            return array('I')
+        if stop is None:
+            stop = len(self.keys)
+
+        slices = []
+        for code in codes:
+            posting = self.label_rows[code]
+            lo = bisect_left(posting, first) if first else 0
+            hi = bisect_left(posting, stop, lo)
+            slices.append((hi - lo, code, lo, hi))
+        slices.sort()
+
+        # Walk the shortest list, test the others through their membership flags
+        _, code, lo, hi = slices[0]
+        result = self.label_rows[code][lo:hi]
+        for _, code, _, _ in slices[1:]:
+            member = self.label_membership(code)
+            result = array('I', [row for row in result if member[row]])
+        return result
+
+    def label_membership(self, code):
+        """bytearray indexed by row, 1 where the row has the label. Brought up to date incrementally."""
+        posting = self.label_rows[code]
+        count = len(posting)
+        row_count = len(self.keys)
+        flags, applied, built_from = self._label_flags.get(code, (b"", 0, None))
+        if built_from is not posting:
+            # Posting list replaced by merge_labels, rows were inserted in the middle
+            flags, applied = b"", 0
+        elif applied == count and len(flags) == row_count:
+            return flags
+
+        # Extend a copy, readers in other threads keep using the old one
+        flags = bytearray(flags)
+        flags.extend(bytes(row_count - len(flags)))
+        for row in islice(posting, applied, count):
+            flags[row] = 1
+        self._label_flags[code] = (flags, count, posting)
+        return flags
+
+    # --- Filtering ---
+    @diagnostics.timed("store.filter_rows", items=lambda args, rows: len(rows) if rows is not None else 0)
+    def filter_rows(self, folder="All", search="", rows=None, cancelled=None):
+        """
+        Row indices (array) matching the folder and search text, in the order of `rows`
+        (all rows by default). `folder` is "All", a label or a tuple of labels that must
+        all be present. For all rows or a range the folder is resolved by intersecting
+        label postings; other row lists are tested against per-label membership flags.
+        Search text is a substring of the sender or subject, or a query (from:, label:,
+        OR, ...; text that does not parse as one is searched as plain text). Either
+        way it is compiled to a plan (query.py): the distinct strings are looked up in
+        the trigram index, and the rows of the matching strings read from their
+        postings, so the cost follows the number of matches rather than of rows.
+        With a `cancelled` callback None is returned as soon as it reports true.
+        """
+        codes = self._folder_codes(folder)
+        if rows is None:
+            rows = range(len(self.keys))
+        if search:
+            plan = None
+            if is_structured(search):
+                try:
+                    plan = compile_query(self, search, codes, cancelled)
+                except QueryError:
+                    pass
+            if plan is None:
+                plan = compile_text(self, search, codes, cancelled)
+            return self._filter_query(plan, rows, cancelled)
+
+        if codes is not None and isinstance(rows, range):
+            return self.rows_with_labels(codes, rows.start, rows.stop)
+
+        select = self._row_selector(codes)
+        if select is None:
+            return None if cancelled and cancelled() else array('I')
+
+        if cancelled is None:
+            return array('I', select(rows))
+
+        result = array('I')
+        for start in range(0, len(rows), FILTER_BLOCK):
+            if cancelled():
+                return None
+            result.extend(select(rows[start:start + FILTER_BLOCK]))
+        return result
+
+    def _filter_query(self, plan, rows, cancelled=None):
+        """filter_rows for a compiled query: small row lists are tested row by row, for
+        larger ones the plan's matches are computed from the indexes and put in the order of `rows`."""
+        if cancelled and cancelled():
+            return None
+        row_count = rows.stop if isinstance(rows, range) else len(self.keys)
+
+        if len(rows) * QUERY_SCAN_RATIO < row_count:
+            result = array('I', plan.filter(rows))
+        elif isinstance(rows, range) and rows.step == 1:
+            result = plan.rows(rows.stop)
+            if rows.start:
+                result = result[bisect_left(result, rows.start):]
+        else:
+            matched = plan.rows(row_count)
+            if cancelled and cancelled():
+                return None
+            # A sort order of the store: sorting the matches is cheaper than walking every row
+            sort_key = next((key for key, order in list(self._sort_orders.items()) if order is rows), None)
+            if sort_key is not None and len(matched) * QUERY_SORT_RATIO < len(rows):
+                result = self.sort_rows(matched, *sort_key)
+            else:
+                member = bytearray(row_count)
+                for row in matched:
+                    member[row] = 1
+                result = array('I', [row for row in rows if member[row]])
+        return None if cancelled and cancelled() else result
+
+    def _row_selector(self, codes):
+        """Function mapping a block of row indices to those in the folder (None = nothing matches)."""
+        if codes is None:
+            return list
+        if -1 in codes:
+            return None
+        if len(codes) == 1:
+            member = self.label_membership(codes[0])
+        else:
+            member = bytearray(len(self.keys))
+            for row in self.rows_with_labels(codes):
+                member[row] = 1
+        return lambda block: [i for i in block if member[i]]
+
+    # --- Conversations ---
+    @diagnostics.timed("store.collapse_threads", items=lambda args, result: len(args[1]))
+    def collapse_threads(self, rows):
+        """
+        One row per conversation: the newest of its rows in `rows`, kept at the
+        position where it appears in `rows`. Returns (rows, counts), counts[i]
+        is the number of rows of that conversation in `rows`.
+        """
+        threads = self.conversations.row_threads()
+        dates = self.dates
+        newest = {}
+        counts = Counter()
+        for row in rows:
+            thread = threads[row]
+            best = newest.get(thread)
+            if best is None or dates[row] >= dates[best]:
+                newest[thread] = row
+            counts[thread] += 1
+
+        shown = set(newest.values())
+        collapsed = array('I', [row for row in rows if row in shown])
+        return collapsed, array('I', [counts[threads[row]] for row in collapsed])
+
+    def folder_counts(self):
+        """Messages per label: the length of each posting list."""
+        return {name: len(posting) for name, posting in zip(self.label_names, self.label_rows) if posting}
@@ -1,9 +1,16 @@
+import os
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableView,
                              QSplitter, QLabel, QLineEdit, QListWidget,
-                             QAbstractItemView, QProgressBar)  # Added QProgressBar
+                             QAbstractItemView, QProgressBar, QSpinBox, QCheckBox,
+                             QPushButton, QDialog, QHeaderView)  # Added QProgressBar
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtCore import Qt
 
+try:
+    from parallel_scan import default_worker_count
+except ImportError:
+    from app_mail.parallel_scan import default_worker_count
+
 
 class MailViewerUI(QWidget):
     def __init__(self):
@@ -18,19 +25,69 @@ class MailViewerUI(QWidget):
 
         # --- TOP BAR (Search) ---
         top_bar = QHBoxLayout()
+        self.btn_open = QPushButton("Open MBOX...")
+        top_bar.addWidget(self.btn_open)
+        # Every .mbox below a folder, merged into one view without duplicates
+        self.btn_open_folder = QPushButton("Open Folder...")
+        self.btn_open_folder.setToolTip("Load all .mbox files of a Takeout folder together")
+        top_bar.addWidget(self.btn_open_folder)
+        self.btn_refresh = QPushButton("Refresh")
+        self.btn_refresh.setToolTip("Add messages appended to the mailbox since it was opened")
+        top_bar.addWidget(self.btn_refresh)
+
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search sender or subject...")
         self.search_input.setClearButtonEnabled(True)
         top_bar.addWidget(QLabel("Search:"))
         top_bar.addWidget(self.search_input)
+
+        # Full-text search over message bodies (builds an on-disk index in the background)
+        self.chk_fulltext = QCheckBox("Search message bodies")
+        top_bar.addWidget(self.chk_fulltext)
+
+        # One row per conversation (Message-ID / References threading)
+        self.chk_threads = QCheckBox("Group conversations")
+        top_bar.addWidget(self.chk_threads)
+
+        self.btn_attachments = QPushButton("Attachments...")
+        top_bar.addWidget(self.btn_attachments)
         main_layout.addLayout(top_bar)
 
+        # --- OPTIONS BAR (used the next time a file is opened) ---
+        options_bar = QHBoxLayout()
+
+        # Number of processes used to scan headers (1 = single background thread)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, os.cpu_count() or 1)
+        self.workers_spin.setValue(default_worker_count())
+        self.workers_spin.setToolTip("Processes used to scan large mailboxes")
+        options_bar.addWidget(QLabel("Scan workers:"))
+        options_bar.addWidget(self.workers_spin)
+
+        # Reads message bodies during the scan (no decoding), so it is off by default
+        self.chk_catalogue = QCheckBox("Catalogue attachments while scanning")
+        options_bar.addWidget(self.chk_catalogue)
+
+        # Large bodies are shown up to this size, "Load Full Message" shows the rest
+        self.body_limit_spin = QSpinBox()
+        self.body_limit_spin.setRange(0, 1024)
+        self.body_limit_spin.setValue(4)
+        self.body_limit_spin.setSuffix(" MB")
+        self.body_limit_spin.setSpecialValueText("No limit")
+        self.body_limit_spin.setToolTip("Message text shown before asking to load the full message")
+        options_bar.addWidget(QLabel("Body limit:"))
+        options_bar.addWidget(self.body_limit_spin)
+        options_bar.addStretch()
+        main_layout.addLayout(options_bar)
+
         # --- MAIN SPLITTER ---
         main_splitter = QSplitter(Qt.Orientation.Horizontal)
 
         # 1. Folder List
         self.folder_list = QListWidget()
         self.folder_list.setMaximumWidth(200)
+        # Ctrl/Shift-click several labels to see messages that carry all of them
+        self.folder_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         main_splitter.addWidget(self.folder_list)
 
         # 2. Content Splitter
@@ -42,10 +99,31 @@ class MailViewerUI(QWidget):
         self.mail_table.setShowGrid(False)
         self.mail_table.setAlternatingRowColors(True)
         self.mail_table.verticalHeader().setVisible(False)
+        # Click a header to sort, a third click goes back to file order
+        self.mail_table.horizontalHeader().setSortIndicatorClearable(True)
+        self.mail_table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.mail_table.setSortingEnabled(True)
         content_splitter.addWidget(self.mail_table)
 
+        body_panel = QWidget()
+        body_layout = QVBoxLayout(body_panel)
+        body_layout.setContentsMargins(0, 0, 0, 0)
+
+        # Shown while a large message is cut at the body limit
+        self.body_notice_bar = QWidget()
+        notice_layout = QHBoxLayout(self.body_notice_bar)
+        notice_layout.setContentsMargins(4, 2, 4, 2)
+        self.lbl_body_notice = QLabel("")
+        notice_layout.addWidget(self.lbl_body_notice)
+        notice_layout.addStretch()
+        self.btn_load_full = QPushButton("Load Full Message")
+        notice_layout.addWidget(self.btn_load_full)
+        self.body_notice_bar.setVisible(False)
+        body_layout.addWidget(self.body_notice_bar)
+
         self.web_view = QWebEngineView()
-        content_splitter.addWidget(self.web_view)
+        body_layout.addWidget(self.web_view)
+        content_splitter.addWidget(body_panel)
 
         main_splitter.addWidget(content_splitter)
         main_splitter.setSizes([150, 350, 500])
@@ -64,3 +142,42 @@ class MailViewerUI(QWidget):
         bottom_layout.addWidget(self.progress_bar)
 
         main_layout.addLayout(bottom_layout)
+
+
+class AttachmentsDialogUI(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Attachments")
+        self.resize(900, 500)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.lbl_info = QLabel("")
+        self.lbl_info.setWordWrap(True)
+        layout.addWidget(self.lbl_info)
+
+        self.attachment_table = QTableView()
+        self.attachment_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.attachment_table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.attachment_table.setAlternatingRowColors(True)
+        self.attachment_table.verticalHeader().setVisible(False)
+        self.attachment_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.attachment_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.attachment_table)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+
+        buttons = QHBoxLayout()
+        self.btn_export_selected = QPushButton("Export Selected...")
+        self.btn_export_all = QPushButton("Export All...")
+        self.btn_close = QPushButton("Close")
+        buttons.addWidget(self.btn_export_selected)
+        buttons.addWidget(self.btn_export_all)
+        buttons.addStretch()
+        buttons.addWidget(self.btn_close)
+        layout.addLayout(buttons)
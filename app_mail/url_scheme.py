@@ -0,0 +1,72 @@
+from urllib.parse import unquote
+from PyQt6.QtCore import QBuffer, QIODevice, QUrl
+from PyQt6.QtWebEngineCore import QWebEngineUrlScheme, QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
+
+try:
+    from parser import PART_SCHEME, message_host
+except ImportError:
+    from app_mail.parser import PART_SCHEME, message_host
+
+
+def register_url_scheme():
+    """Declares the mbox-part:// scheme. Must run before the QApplication is created."""
+    if QWebEngineUrlScheme.schemeByName(PART_SCHEME.encode()).name():
+        return
+    scheme = QWebEngineUrlScheme(PART_SCHEME.encode())
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    scheme.setDefaultPort(QWebEngineUrlScheme.SpecialPort.PortUnspecified.value)
+    # No LocalAccessAllowed: a message page must not reach anything outside its own origin
+    scheme.setFlags(QWebEngineUrlScheme.Flag.SecureScheme)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class MessagePartSchemeHandler(QWebEngineUrlSchemeHandler):
+    """
+    Answers mbox-part://m<key>/cid/<content-id> and mbox-part://m<key>/part/<index>
+    by decoding just that part from the message's byte range in the mbox. Only the
+    page of the same message (same host) gets an answer, one email cannot read the
+    parts of another.
+    """
+
+    def __init__(self, parser, parent=None):
+        super().__init__(parent)
+        self.parser = parser
+
+    def install(self, profile):
+        # The default profile is shared by every viewer window, replace an older handler
+        scheme = PART_SCHEME.encode()
+        if profile.urlSchemeHandler(scheme):
+            profile.removeUrlScheme(scheme)
+        profile.installUrlSchemeHandler(scheme, self)
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        host = url.host()
+        try:
+            kind, ref = url.path(QUrl.ComponentFormattingOption.FullyEncoded).strip("/").split("/", 1)
+            key = int(host[1:])
+            ref = unquote(ref)
+        except ValueError:
+            job.fail(QWebEngineUrlRequestJob.Error.UrlInvalid)
+            return
+        if host != message_host(key) or job.initiator().host() != host:
+            job.fail(QWebEngineUrlRequestJob.Error.RequestDenied)
+            return
+
+        if kind == "cid":
+            result = self.parser.get_part_data(key, cid=ref)
+        elif kind == "part" and ref.isdigit():
+            result = self.parser.get_part_data(key, index=int(ref))
+        else:
+            result = None
+
+        if result is None:
+            job.fail(QWebEngineUrlRequestJob.Error.UrlNotFound)
+            return
+
+        content_type, data = result
+        # Owned by the job, so it is freed once the web view has read it
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.OpenModeFlag.ReadOnly)
+        job.reply(content_type.encode("ascii", "replace"), buffer)
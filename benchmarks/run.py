@@ -0,0 +1,363 @@
+"""
+Benchmark harness for the Takeout parsers and the mail model.
+
+    python -m benchmarks.run                          # 10k messages, default calendar/contacts
+    python -m benchmarks.run --messages 2000000       # large mailbox
+    python -m benchmarks.run --save-baseline          # store results as the new baseline
+    python -m benchmarks.run --stages mail_headers,store_sort
+
+Every stage runs in a fresh process, so the reported peak RSS belongs to
+that stage alone. Results are compared with benchmarks/baseline.json (or
+--baseline); a stage slower than the tolerance is reported as a regression.
+Generated input files are cached in the work folder and reused.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import multiprocessing
+from queue import Empty
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if __package__ in (None, ""):
+    # Allow "python benchmarks/run.py" as well as "python -m benchmarks.run"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generators import write_mbox, write_ics, write_vcf
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# --- Stages ---
+# Each stage gets the input paths and options and returns the number of items processed.
+# Imports happen inside the stages so they count towards the stage's own memory.
+
+def _fresh_parser(ctx, use_index=False):
+    from app_mail.parser import MboxParser
+    parser = MboxParser()
+    parser.write_index = use_index
+    if not use_index:
+        # Measure a cold scan, not the sidecar fast path
+        from app_mail.index_cache import MboxIndexCache
+        for path in MboxIndexCache(ctx["mbox"]).candidate_paths():
+            if os.path.exists(path):
+                os.remove(path)
+    return parser
+
+
+def stage_mail_scan(ctx):
+    """Message boundary scan (load_mbox)."""
+    parser = _fresh_parser(ctx)
+    count = parser.load_mbox(ctx["mbox"])
+    parser.close()
+    return count
+
+
+def stage_mail_headers(ctx):
+    """Serial header parsing (get_headers_generator)."""
+    parser = _fresh_parser(ctx)
+    parser.load_mbox(ctx["mbox"])
+    count = sum(1 for _ in parser.get_headers_generator())
+    parser.close()
+    return count
+
+
+def stage_mail_headers_parallel(ctx):
+    """Header parsing in a process pool (iter_header_batches)."""
+    from app_mail.parallel_scan import iter_header_batches
+    parser = _fresh_parser(ctx)
+    parser.load_mbox(ctx["mbox"])
+    count = sum(len(batch) for batch in iter_header_batches(parser, ctx["workers"]))
+    parser.close()
+    return count
+
+
+def stage_mail_attachments(ctx):
+    """Header parsing plus the attachment catalogue."""
+    parser = _fresh_parser(ctx)
+    parser.catalogue_attachments = True
+    parser.load_mbox(ctx["mbox"])
+    count = sum(1 for _ in parser.get_headers_generator())
+    parser.close()
+    return count
+
+
+def stage_mail_index_reload(ctx):
+    """Reopening an unchanged mailbox from the sidecar index (index written outside the timing)."""
+    parser = ctx.get("_reload_parser")
+    parser.load_mbox(ctx["mbox"])
+    count = len(parser.cached_rows or ())
+    parser.close()
+    return count
+
+
+def _prepare_index_reload(ctx):
+    parser = _fresh_parser(ctx, use_index=True)
+    parser.load_mbox(ctx["mbox"])
+    for _ in parser.get_headers_generator():
+        pass
+    parser.close()
+    ctx["_reload_parser"] = parser
+
+
+def _loaded_store(ctx):
+    from app_mail.parser import MboxParser
+    from app_mail.store import MessageStore
+    parser = MboxParser()
+    parser.write_index = False
+    parser.load_mbox(ctx["mbox"])
+    rows = list(parser.get_headers_generator())
+    parser.close()
+    return rows, MessageStore()
+
+
+def stage_store_append(ctx):
+    """Filling the columnar MessageStore behind the mail table."""
+    rows, store = ctx["_rows"], ctx["_store"]
+    store.append_rows(rows)
+    return len(store)
+
+
+def _prepare_store(ctx):
+    ctx["_rows"], ctx["_store"] = _loaded_store(ctx)
+
+
+def _prepare_filled_store(ctx):
+    rows, store = _loaded_store(ctx)
+    store.append_rows(rows)
+    ctx["_store"] = store
+
+
+def stage_store_search(ctx):
+    """Sender/subject search plus a folder switch."""
+    store = ctx["_store"]
+    store.filter_rows("All", "report")
+    store.filter_rows("Inbox", "")
+    store.filter_rows(("Inbox", "Important"), "")
+    return len(store)
+
+
+def stage_store_query(ctx):
+    """Structured queries: labels, date and size ranges and fields combined."""
+    store = ctx["_store"]
+    store.filter_rows("All", "from:alice subject:report after:2020/01/01")
+    store.filter_rows("Inbox", "label:important -label:spam larger:2K")
+    store.filter_rows("All", "(from:bob OR from:chen) before:2024/06/01 -invoice")
+    return len(store)
+
+
+def stage_store_sort(ctx):
+    """Sort orders for every column, then a filter walking one of them."""
+    store = ctx["_store"]
+    for field in ("date", "sender", "subject"):
+        store.sort_order(field)
+    store.filter_rows("Inbox", "", store.sort_order("date", True))
+    return len(store)
+
+
+def stage_store_threads(ctx):
+    """Collapsing all rows into conversations."""
+    store = ctx["_store"]
+    store.collapse_threads(range(len(store)))
+    return len(store)
+
+
+def stage_calendar(ctx):
+    """CalendarParser.parse_ics."""
+    from app_calendar.parser import CalendarParser
+    events = CalendarParser.parse_ics(ctx["ics"])
+    return sum(len(day) for day in events.values())
+
+
+def stage_contacts(ctx):
+    """ContactParser.parse_vcf."""
+    from app_contacts.parser import ContactParser
+    return len(ContactParser.parse_vcf(ctx["vcf"]))
+
+
+# name -> (function, input key whose size is used for throughput, setup run before timing)
+STAGES = {
+    "mail_scan": (stage_mail_scan, "mbox", None),
+    "mail_headers": (stage_mail_headers, "mbox", None),
+    "mail_headers_parallel": (stage_mail_headers_parallel, "mbox", None),
+    "mail_attachments": (stage_mail_attachments, "mbox", None),
+    "mail_index_reload": (stage_mail_index_reload, "mbox", _prepare_index_reload),
+    "store_append": (stage_store_append, None, _prepare_store),
+    "store_search": (stage_store_search, None, _prepare_filled_store),
+    "store_query": (stage_store_query, None, _prepare_filled_store),
+    "store_sort": (stage_store_sort, None, _prepare_filled_store),
+    "store_threads": (stage_store_threads, None, _prepare_filled_store),
+    "calendar": (stage_calendar, "ics", None),
+    "contacts": (stage_contacts, "vcf", None),
+}
+
+
+def _run_stage_in_child(name, ctx, queue):
+    func, size_key, setup = STAGES[name]
+    try:
+        if setup:
+            setup(ctx)
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        items = func(ctx)
+        seconds = time.perf_counter() - started
+        queue.put({
+            "seconds": round(seconds, 4),
+            "items": items,
+            "items_per_sec": round(items / seconds, 1) if seconds > 0 else None,
+            "mb_per_sec": (round(os.path.getsize(ctx[size_key]) / (1024 * 1024) / seconds, 1)
+                           if size_key and seconds > 0 else None),
+            "peak_rss_mb": peak_rss_mb(),
+            "setup_peak_rss_mb": rss_before,
+        })
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_stage(name, ctx):
+    """Runs one stage in a new process and returns its measurements."""
+    mp = multiprocessing.get_context("spawn")
+    queue = mp.Queue()
+    child = mp.Process(target=_run_stage_in_child, args=(name, ctx, queue))
+    child.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            # Killed (e.g. out of memory) without reporting back
+            if not child.is_alive():
+                result = {"error": f"stage process exited with code {child.exitcode}"}
+                break
+    child.join()
+    return result
+
+
+# --- Inputs ---
+def prepare_inputs(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    paths = {
+        "mbox": os.path.join(args.workdir, f"bench_{args.messages}_s{args.seed}.mbox"),
+        "ics": os.path.join(args.workdir, f"bench_{args.years}y_s{args.seed}.ics"),
+        "vcf": os.path.join(args.workdir, f"bench_{args.contacts}_s{args.seed}.vcf"),
+    }
+    generators = {
+        "mbox": lambda p: write_mbox(p, args.messages, seed=args.seed),
+        "ics": lambda p: write_ics(p, years=args.years, seed=args.seed),
+        "vcf": lambda p: write_vcf(p, args.contacts, seed=args.seed),
+    }
+    for key, path in paths.items():
+        if not os.path.exists(path):
+            print(f"Generating {path} ...", file=sys.stderr)
+            tmp = path + ".tmp"
+            generators[key](tmp)
+            os.replace(tmp, path)
+    return paths
+
+
+# --- Baseline ---
+def compare(results, baseline, tolerance):
+    """Prints a table against the baseline. Returns the names of regressed stages."""
+    regressions = []
+    print(f"{'stage':<24}{'seconds':>10}{'items/s':>12}{'MB/s':>8}{'peak MB':>9}{'baseline':>10}{'change':>9}")
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:<24} ERROR {result['error']}")
+            continue
+        base = baseline.get("stages", {}).get(name)
+        change = ""
+        base_seconds = ""
+        if base and base.get("seconds"):
+            ratio = result["seconds"] / base["seconds"]
+            base_seconds = f"{base['seconds']:.3f}"
+            change = f"{(ratio - 1) * 100:+.0f}%"
+            if ratio > 1 + tolerance:
+                change += " !"
+                regressions.append(name)
+        mb_per_sec = result["mb_per_sec"] if result["mb_per_sec"] is not None else "-"
+        peak = result["peak_rss_mb"] if result["peak_rss_mb"] is not None else "-"
+        print(f"{name:<24}{result['seconds']:>10.3f}{result['items_per_sec'] or 0:>12.0f}"
+              f"{mb_per_sec:>8}{peak:>9}{base_seconds:>10}{change:>9}")
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the Takeout parsers and mail model.")
+    arg_parser.add_argument("--messages", type=int, default=10000, help="messages in the mbox (10k - 2M)")
+    arg_parser.add_argument("--years", type=int, default=20, help="years covered by the calendar")
+    arg_parser.add_argument("--contacts", type=int, default=5000, help="vCards in the contacts file")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--workers", type=int,
+                            help="processes for mail_headers_parallel (default: the baseline's, else the CPU count)")
+    arg_parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stage names")
+    arg_parser.add_argument("--workdir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    arg_parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    arg_parser.add_argument("--save-baseline", action="store_true", help="write these results as the baseline")
+    arg_parser.add_argument("--tolerance", type=float, default=0.15,
+                            help="allowed slowdown against the baseline (0.15 = 15%%)")
+    arg_parser.add_argument("--json", help="also write the results to this file")
+    args = arg_parser.parse_args(argv)
+
+    names = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STAGES]
+    if unknown:
+        arg_parser.error(f"unknown stages: {', '.join(unknown)} (known: {', '.join(STAGES)})")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.workers is None:
+        # Same worker count as the baseline, so a default run is a like for like comparison
+        args.workers = baseline.get("params", {}).get("workers") or os.cpu_count() or 1
+
+    ctx = dict(prepare_inputs(args), workers=args.workers)
+    results = {}
+    for name in names:
+        print(f"Running {name} ...", file=sys.stderr)
+        results[name] = run_stage(name, ctx)
+
+    report = {
+        "params": {"messages": args.messages, "years": args.years, "contacts": args.contacts,
+                   "seed": args.seed, "workers": args.workers},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "stages": results,
+    }
+
+    if baseline and baseline.get("params") != report["params"]:
+        print("Note: baseline was recorded with different parameters "
+              f"({baseline.get('params')}), comparison is indicative only.", file=sys.stderr)
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+
+    if regressions and not args.save_baseline:
+        print(f"Slower than baseline: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Headless command line for Google Takeout files.
+
+Streams mail headers (.mbox), calendar events (.ics) and contacts (.vcf) to
+JSON Lines or CSV without starting Qt, e.g. on a server or from cron:
+
+    python cli.py mail "All mail.mbox" -o mail.jsonl
+    python cli.py calendar Calendar.ics --format csv
+    python cli.py batch Takeout/ --output-dir exported/
+    python cli.py batch takeout-001.tgz --output-dir exported/
+
+Takeout .zip / .tgz archives are read directly, nothing is extracted.
+
+Records are written as they are parsed and nothing is kept per message,
+so memory use stays flat no matter how large the input is.
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+import multiprocessing
+from datetime import datetime, date, timezone
+
+# Only the parsers are imported here, never PyQt6 or QtWebEngine
+from app_mail.parser import MboxParser, NO_DATE
+from app_mail.parallel_scan import iter_header_batches
+import takeout_archive
+
+MAIL_EXTENSIONS = (".mbox",)
+CALENDAR_EXTENSIONS = (".ics",)
+CONTACT_EXTENSIONS = (".vcf",)
+
+# Column order for CSV output
+FIELDS = {
+    "mail": ["file", "key", "date", "sender", "recipients", "subject", "size", "labels", "message_id",
+             "attachments"],
+    "calendar": ["file", "summary", "start", "end", "all_day", "location", "description"],
+    "contacts": ["file", "name", "email", "phone", "org"],
+}
+
+
+# --- Record producers (one generator per file type) ---
+def iter_mail_records(path, workers=1, bodies=False, attachments=False, write_index=False):
+    parser = MboxParser()
+    parser.catalogue_attachments = attachments
+    parser.write_index = write_index
+    try:
+        parser.load_mbox(path)
+        if workers > 1:
+            rows = (row for batch in iter_header_batches(parser, workers) for row in batch)
+        else:
+            rows = parser.get_headers_generator()
+
+        for key, sender, subject, epoch, labels, attachment_entries, thread, recipients, size in rows:
+            record = {
+                "file": path,
+                "key": key,
+                "date": None if epoch == NO_DATE else datetime.fromtimestamp(epoch, timezone.utc).isoformat(),
+                "sender": sender,
+                "recipients": recipients,
+                "subject": subject,
+                "size": size,
+                "labels": list(labels),
+                "message_id": thread[0],
+            }
+            if attachment_entries is not None:
+                record["attachments"] = [
+                    {"filename": a.filename, "content_type": a.content_type, "size": a.size}
+                    for a in attachment_entries
+                ]
+            if bodies:
+                record["body"] = parser.get_email_document(key)[2]
+            yield record
+    finally:
+        parser.close()
+
+
+def iter_calendar_records(path):
+    # Imported on demand, mail-only runs do not need vobject
+    from app_calendar.parser import CalendarParser
+
+    for event in CalendarParser.iter_events(path):
+        yield {
+            "file": path,
+            "summary": event["summary"],
+            "start": event["start_dt"],
+            "end": event["end_dt"],
+            "all_day": event["is_all_day"],
+            "location": event["location"],
+            "description": event["description"],
+        }
+
+
+def iter_contact_records(path):
+    from app_contacts.parser import ContactParser
+
+    for contact in ContactParser.iter_contacts(path):
+        record = dict(contact)
+        record["file"] = path
+        record["phone"] = [{"type": t_type, "number": number} for t_type, number in contact["phone"]]
+        yield record
+
+
+# --- Output ---
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    """Flattens lists and dicts into one cell."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return "; ".join(_csv_value(item) for item in value)
+    if isinstance(value, dict):
+        # Attachments and phone numbers
+        return " ".join(str(v) for v in value.values())
+    if value is None:
+        return ""
+    return value
+
+
+class RecordWriter:
+    """Writes records to a stream as JSON Lines or CSV."""
+
+    def __init__(self, stream, fmt, fields):
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        self.csv_writer = None
+        if fmt == "csv":
+            self.csv_writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+            self.csv_writer.writeheader()
+
+    def write(self, record):
+        if self.csv_writer:
+            self.csv_writer.writerow({k: _csv_value(v) for k, v in record.items()})
+        else:
+            self.stream.write(json.dumps(record, ensure_ascii=False, default=_json_default))
+            self.stream.write("\n")
+        self.count += 1
+
+
+def open_output(path):
+    if not path or path == "-":
+        return sys.stdout, False
+    # newline="" lets the csv module control line endings
+    return open(path, "w", encoding="utf-8", newline=""), True
+
+
+def kind_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in MAIL_EXTENSIONS: return "mail"
+    if ext in CALENDAR_EXTENSIONS: return "calendar"
+    if ext in CONTACT_EXTENSIONS: return "contacts"
+    return None
+
+
+def iter_records(kind, path, args):
+    if kind == "mail":
+        return iter_mail_records(path, args.workers, args.bodies, args.attachments, args.write_index)
+    if kind == "calendar":
+        return iter_calendar_records(path)
+    return iter_contact_records(path)
+
+
+def fields_for(kind, args):
+    fields = list(FIELDS[kind])
+    if kind == "mail" and getattr(args, "bodies", False):
+        fields.append("body")
+    return fields
+
+
+def export_files(kind, paths, writer, args):
+    """Streams every file into one writer. Returns the number of files that failed."""
+    failed = 0
+    for path in paths:
+        before = writer.count
+        try:
+            for record in iter_records(kind, path, args):
+                writer.write(record)
+        except BrokenPipeError:
+            raise  # Output closed (e.g. piped into head), stop everything
+        except Exception as e:
+            print(f"Error: {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        if not args.quiet:
+            print(f"{path}: {writer.count - before} records", file=sys.stderr)
+    return failed
+
+
+def find_inputs(inputs):
+    """Files given directly plus every known Takeout file below the given folders and inside archives."""
+    known = MAIL_EXTENSIONS + CALENDAR_EXTENSIONS + CONTACT_EXTENSIONS
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if kind_of(name):
+                        yield os.path.join(root, name)
+                    elif takeout_archive.is_archive(name):
+                        yield from takeout_archive.expand_paths([os.path.join(root, name)], known)
+        elif takeout_archive.is_archive(item):
+            yield from takeout_archive.expand_paths([item], known)
+        else:
+            yield item
+
+
+# --- Commands ---
+def run_single(args):
+    stream, close = open_output(args.output)
+    try:
+        writer = RecordWriter(stream, args.format, fields_for(args.command, args))
+        # An archive stands for its files of this command's type
+        extensions = {"mail": MAIL_EXTENSIONS, "calendar": CALENDAR_EXTENSIONS,
+                      "contacts": CONTACT_EXTENSIONS}[args.command]
+        failed = export_files(args.command, takeout_archive.expand_paths(args.files, extensions), writer, args)
+    finally:
+        if close:
+            stream.close()
+    return 1 if failed else 0
+
+
+def run_batch(args):
+    """One output file per input, files are processed one after another."""
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = 0
+    used_names = set()
+
+    for path in find_inputs(args.inputs):
+        kind = kind_of(path)
+        if kind is None:
+            print(f"Skipped (unknown type): {path}", file=sys.stderr)
+            continue
+
+        name = os.path.basename(path)
+        out_name = f"{name}.{args.format if args.format == 'csv' else 'jsonl'}"
+        counter = 1
+        while out_name in used_names:
+            out_name = f"{name}.{counter}.{args.format if args.format == 'csv' else 'jsonl'}"
+            counter += 1
+        used_names.add(out_name)
+
+        with open(os.path.join(args.output_dir, out_name), "w", encoding="utf-8", newline="") as stream:
+            writer = RecordWriter(stream, args.format, fields_for(kind, args))
+            failed += export_files(kind, [path], writer, args)
+
+    return 1 if failed else 0
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(
+        prog="cli.py", description="Export Google Takeout mail, calendar and contacts without a GUI.")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl")
+    common.add_argument("-q", "--quiet", action="store_true", help="no per-file summary on stderr")
+
+    mail_options = argparse.ArgumentParser(add_help=False)
+    mail_options.add_argument("--workers", type=int, default=1,
+                              help="processes for the mail header scan (default 1)")
+    mail_options.add_argument("--bodies", action="store_true", help="include the plain-text message body")
+    mail_options.add_argument("--attachments", action="store_true",
+                              help="list attachment names, types and sizes (nothing is decoded)")
+    mail_options.add_argument("--write-index", action="store_true",
+                              help="write the sidecar index used by the viewer (keeps all rows in memory)")
+
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    for kind, help_text, parents in (
+            ("mail", "headers of .mbox files", [common, mail_options]),
+            ("calendar", "events of .ics files", [common]),
+            ("contacts", "contacts of .vcf files", [common])):
+        command = commands.add_parser(kind, help=help_text, parents=parents)
+        command.add_argument("files", nargs="+", help="files or Takeout .zip / .tgz archives")
+        command.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+
+    batch = commands.add_parser("batch", help="many files or folders, one output file each",
+                                parents=[common, mail_options])
+    batch.add_argument("inputs", nargs="+", help="files, folders or archives (searched for .mbox, .ics, .vcf)")
+    batch.add_argument("--output-dir", required=True)
+    return arg_parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == "batch":
+        return run_batch(args)
+    return run_single(args)
+
+
+if __name__ == "__main__":
+    # Needed for the mail header scan process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    try:
+        sys.exit(main())
+    except BrokenPipeError:
+        # Keep Python from complaining again while flushing the closed stdout
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
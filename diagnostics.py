@@ -0,0 +1,227 @@
+"""
+Lightweight stage timing for the Takeout viewers.
+
+Off unless the environment variable GTA_DIAGNOSTICS is set (to anything but 0):
+
+    GTA_DIAGNOSTICS=1 python main.py
+
+When off, `timed` returns the function unchanged and `timer` a shared no-op
+context, so instrumented code runs at full speed. When on, every stage keeps
+a call count, total/min/max time, items and bytes processed (for messages/s
+and bytes/s) and a log2 histogram of call durations. Set GTA_DIAGNOSTICS_DUMP
+to a file path to write the JSON report when the process exits.
+
+No Qt imports here, the headless CLI and the worker processes use it too.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import platform
+import threading
+from contextlib import nullcontext
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENABLED = os.environ.get("GTA_DIAGNOSTICS", "") not in ("", "0")
+
+# Histogram bucket i counts calls that took less than 2**i microseconds
+HISTOGRAM_BUCKETS = 32
+
+_NULL_TIMER = nullcontext()
+
+
+class StageStats:
+    """Running totals of one instrumented stage."""
+    __slots__ = ("calls", "seconds", "min", "max", "items", "bytes", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.min = None
+        self.max = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds, items, nbytes):
+        """items / nbytes are None when they could not be measured, the call still counts."""
+        self.calls += 1
+        self.seconds += seconds
+        self.items += items or 0
+        self.bytes += nbytes or 0
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.histogram[bucket] += 1
+
+    def percentile(self, fraction):
+        """Upper bound (seconds) of the histogram bucket holding the given fraction of calls."""
+        if not self.calls:
+            return 0.0
+        wanted = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted:
+                return (1 << bucket) / 1e6
+        return self.max
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 6),
+            "mean_ms": round(self.seconds / self.calls * 1000, 4) if self.calls else 0.0,
+            "min_ms": round((self.min or 0.0) * 1000, 4),
+            "max_ms": round(self.max * 1000, 4),
+            "p50_ms": round(self.percentile(0.5) * 1000, 4),
+            "p95_ms": round(self.percentile(0.95) * 1000, 4),
+            "items": self.items,
+            "items_per_sec": round(self.items / self.seconds, 1) if self.seconds else None,
+            "bytes": self.bytes,
+            "bytes_per_sec": round(self.bytes / self.seconds, 1) if self.seconds else None,
+            # Trailing empty buckets are left out
+            "histogram_us_log2": self.histogram[:max((i + 1 for i, c in enumerate(self.histogram) if c), default=0)],
+        }
+
+
+_stages = {}
+_counters = {}
+_lock = threading.Lock()
+_started = time.time()
+
+
+def record(stage, seconds, items=1, nbytes=0):
+    """Adds one measured call of a stage."""
+    if not ENABLED: return
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats()
+        stats.add(seconds, items, nbytes)
+
+
+def count(name, n=1):
+    """Increments a plain counter (cache hits, dropped results, ...)."""
+    if not ENABLED: return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class _Timer:
+    __slots__ = ("stage", "items", "nbytes", "started")
+
+    def __init__(self, stage, items, nbytes):
+        self.stage = stage
+        self.items = items
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.started, self.items, self.nbytes)
+        return False
+
+
+def timer(stage, items=1, nbytes=0):
+    """Context manager timing a block. `items`/`nbytes` can be updated on the returned object."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage, items, nbytes)
+
+
+def _measure(amount, args, result):
+    """Value of an `items` / `nbytes` function, None if it fails: instrumentation never raises."""
+    try:
+        return amount(args, result)
+    except Exception:
+        return None
+
+
+def timed(stage, items=None, nbytes=None):
+    """
+    Decorator timing every call. `items` / `nbytes` are optional functions of the
+    call's (args, result) giving the amount of work done. Disabled: no wrapper at all.
+    """
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            record(stage, time.perf_counter() - started,
+                   _measure(items, args, result) if items else 1,
+                   _measure(nbytes, args, result) if nbytes else 0)
+            return result
+        return wrapper
+    return decorate
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def snapshot():
+    """All stages and counters as plain data (JSON serialisable)."""
+    with _lock:
+        stages = {name: stats.to_dict() for name, stats in sorted(_stages.items())}
+        counters = dict(sorted(_counters.items()))
+    return {
+        "enabled": ENABLED,
+        "uptime_seconds": round(time.time() - _started, 1),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pid": os.getpid(),
+        "stages": stages,
+        "counters": counters,
+    }
+
+
+def to_json():
+    return json.dumps(snapshot(), indent=2)
+
+
+def dump_json(path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(to_json())
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def _dump_at_exit():
+    path = os.environ.get("GTA_DIAGNOSTICS_DUMP")
+    # Worker processes inherit the variable, only the main process writes the report
+    if path and (_stages or _counters) and _is_main_process():
+        try:
+            dump_json(path)
+        except OSError as e:
+            print(f"Could not write diagnostics to {path}: {e}", file=sys.stderr)
+
+
+def _is_main_process():
+    import multiprocessing
+    return multiprocessing.parent_process() is None
+
+
+if ENABLED:
+    atexit.register(_dump_at_exit)
@@ -0,0 +1,118 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QApplication, QFileDialog)
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QShortcut, QKeySequence
+
+import diagnostics
+
+# Shortcut that opens the panel in every viewer (only when diagnostics are enabled)
+PANEL_SHORTCUT = "F12"
+
+_COLUMNS = [("Stage", None), ("Calls", "calls"), ("Total s", "seconds"), ("Mean ms", "mean_ms"),
+            ("p50 ms", "p50_ms"), ("p95 ms", "p95_ms"), ("Max ms", "max_ms"),
+            ("Items/s", "items_per_sec"), ("MB/s", "bytes_per_sec")]
+
+
+class DiagnosticsDialog(QDialog):
+    """Live view of the diagnostics counters, refreshed every second."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostics")
+        self.resize(900, 500)
+
+        layout = QVBoxLayout(self)
+        self.lbl_summary = QLabel("")
+        layout.addWidget(self.lbl_summary)
+
+        self.stage_table = QTableWidget(0, len(_COLUMNS))
+        self.stage_table.setHorizontalHeaderLabels([title for title, _ in _COLUMNS])
+        self.stage_table.verticalHeader().setVisible(False)
+        self.stage_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.stage_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.stage_table)
+
+        self.lbl_counters = QLabel("")
+        self.lbl_counters.setWordWrap(True)
+        layout.addWidget(self.lbl_counters)
+
+        buttons = QHBoxLayout()
+        self.btn_copy = QPushButton("Copy JSON")
+        self.btn_save = QPushButton("Save JSON...")
+        self.btn_reset = QPushButton("Reset")
+        self.btn_close = QPushButton("Close")
+        for button in (self.btn_copy, self.btn_save, self.btn_reset):
+            buttons.addWidget(button)
+        buttons.addStretch()
+        buttons.addWidget(self.btn_close)
+        layout.addLayout(buttons)
+
+        self.btn_copy.clicked.connect(lambda: QApplication.clipboard().setText(diagnostics.to_json()))
+        self.btn_save.clicked.connect(self.save_json)
+        self.btn_reset.clicked.connect(self.reset)
+        self.btn_close.clicked.connect(self.close)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        data = diagnostics.snapshot()
+        stages = data["stages"]
+
+        rss = data["peak_rss_bytes"]
+        rss_text = f"{rss / (1024 * 1024):.0f} MB" if rss else "n/a"
+        self.lbl_summary.setText(f"Uptime {data['uptime_seconds']:.0f} s  |  Peak RSS {rss_text}"
+                                 + ("" if data["enabled"] else "  |  Disabled (set GTA_DIAGNOSTICS=1)"))
+
+        self.stage_table.setRowCount(len(stages))
+        for row, (name, stats) in enumerate(stages.items()):
+            for column, (_, field) in enumerate(_COLUMNS):
+                if field is None:
+                    text = name
+                else:
+                    value = stats[field]
+                    if value is None:
+                        text = ""
+                    elif field == "bytes_per_sec":
+                        text = f"{value / (1024 * 1024):.1f}" if stats["bytes"] else ""
+                    elif isinstance(value, float):
+                        text = f"{value:,.3f}" if value < 1000 else f"{value:,.0f}"
+                    else:
+                        text = f"{value:,}"
+                item = QTableWidgetItem(text)
+                if field is not None:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.stage_table.setItem(row, column, item)
+
+        counters = data["counters"]
+        self.lbl_counters.setText("Counters: " + ", ".join(f"{k} = {v:,}" for k, v in counters.items())
+                                  if counters else "")
+
+    def save_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save diagnostics", "diagnostics.json", "JSON (*.json)")
+        if path:
+            diagnostics.dump_json(path)
+
+    def reset(self):
+        diagnostics.reset()
+        self.refresh()
+
+
+def install_diagnostics_shortcut(window):
+    """Adds the F12 shortcut opening the diagnostics panel to a viewer window."""
+    if not diagnostics.ENABLED:
+        return None
+
+    def show_panel():
+        # One panel per window, raised again if already open
+        panel = getattr(window, "_diagnostics_panel", None)
+        if panel is None:
+            panel = window._diagnostics_panel = DiagnosticsDialog(window)
+        panel.show()
+        panel.raise_()
+
+    shortcut = QShortcut(QKeySequence(PANEL_SHORTCUT), window)
+    shortcut.activated.connect(show_panel)
+    return shortcut
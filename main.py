@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QFrame, QSpacerItem,
                              QSizePolicy, QMessageBox)
@@ -10,6 +11,7 @@ try:
     from app_contacts.main import ContactApp  # Added dot
     from app_calendar.main import CalendarApp  # Added dot
     from app_mail.main import MailApp  # Added dot
+    from app_mail.url_scheme import register_url_scheme
 except ImportError as e:
     print(
         "Error importing sub-modules. Ensure folders 'app_contacts', 'app_calendar', and 'app_mail' exist with __init__.py files.")
@@ -126,6 +128,10 @@ class DashboardWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    # Needed for the mail header scan process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    # Custom URL schemes must be known before the QApplication exists
+    register_url_scheme()
     app = QApplication(sys.argv)
     font = QFont("Segoe UI", 10)
     app.setFont(font)
@@ -0,0 +1,431 @@
+"""
+Read Takeout exports straight from their .zip / .tgz archives, without extracting them.
+
+A file inside an archive is addressed as "<archive path>!/<member name>", e.g.
+
+    takeout-001.tgz!/Takeout/Mail/All mail Including Spam and Trash.mbox
+
+open_text() streams a member for the sequential parsers (calendar, contacts).
+open_buffer() gives the mail reader random access: a buffer that can be sliced
+and searched like the mmap of an extracted file. Stored zip members are read
+in place. Deflated data (zip members, the whole .tgz) is read through a
+checkpoint index: every few MB of output the inflate state is copied, so a
+later read resumes from the nearest checkpoint instead of the start of the
+stream. Checkpoints are taken by the first pass over the data (the boundary
+scan, or the listing of a .tgz) and kept for the rest of the session.
+
+No Qt imports here, the headless CLI uses it too.
+"""
+import io
+import os
+import bisect
+import struct
+import tarfile
+import zipfile
+import zlib
+import threading
+from collections import OrderedDict
+
+import diagnostics
+
+ARCHIVE_EXTENSIONS = (".zip", ".tgz", ".tar.gz")
+MEMBER_SEPARATOR = "!/"
+
+# Checkpoint spacing in output bytes; it doubles when a stream would need more
+# than MAX_CHECKPOINTS (each holds a copy of the 32 KB inflate window)
+CHECKPOINT_SPACING = 4 * 1024 * 1024
+MAX_CHECKPOINTS = 1024
+
+# Compressed bytes read per step, and the most output zlib produces per call
+INPUT_CHUNK = 256 * 1024
+OUTPUT_CHUNK = 1024 * 1024
+
+# Member buffers read and cache the decompressed data in blocks of this size
+BLOCK_SIZE = 256 * 1024
+CACHED_BLOCKS = 64
+
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def member_path(archive, member):
+    return archive + MEMBER_SEPARATOR + member
+
+
+def split_member_path(path):
+    """(archive path, member name) of a member path, (path, None) for a plain file."""
+    lowered = path.lower()
+    for extension in ARCHIVE_EXTENSIONS:
+        marker = extension + MEMBER_SEPARATOR
+        i = lowered.find(marker)
+        if i != -1:
+            end = i + len(extension)
+            return path[:end], path[end + len(MEMBER_SEPARATOR):]
+    return path, None
+
+
+def file_signature(path):
+    """(size, mtime in ns) of a file; for a member its own size and the archive's mtime."""
+    st = os.stat(split_member_path(path)[0])
+    return path_size(path), st.st_mtime_ns
+
+
+def path_size(path):
+    """Size of a file or of an archive member (uncompressed)."""
+    archive, member = split_member_path(path)
+    if member is None:
+        return os.path.getsize(path)
+    return open_archive(archive).member_size(member)
+
+
+def list_members(archive, extensions=None):
+    """Member names of an archive in archive order, optionally only those with these extensions."""
+    names = open_archive(archive).names()
+    if extensions:
+        names = [name for name in names if name.lower().endswith(tuple(extensions))]
+    return names
+
+
+def expand_paths(paths, extensions):
+    """Replaces every archive in a list of paths by the member paths of its files with these extensions."""
+    expanded = []
+    for path in paths:
+        if is_archive(path):
+            expanded.extend(member_path(path, name) for name in list_members(path, extensions))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def open_text(path, encoding="utf-8", errors="strict"):
+    """Text stream of a file or archive member."""
+    archive, member = split_member_path(path)
+    if member is None:
+        return open(path, "r", encoding=encoding, errors=errors)
+    return io.TextIOWrapper(open_archive(archive).open_stream(member), encoding=encoding, errors=errors)
+
+
+def open_buffer(path):
+    """Random-access MemberBuffer of an archive member path."""
+    archive, member = split_member_path(path)
+    return open_archive(archive).open_buffer(member)
+
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(path):
+    """
+    The ZipArchive or TarGzArchive of a path, shared by everything that reads it in this
+    process, so its member listing and checkpoints are made only once.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    signature = (st.st_size, st.st_mtime_ns)
+    with _archives_lock:
+        archive = _archives.get(path)
+        if archive is None or archive.signature != signature:
+            archive = _archives[path] = (ZipArchive if path.lower().endswith(".zip") else TarGzArchive)(path)
+            archive.signature = signature
+        return archive
+
+
+class InflateIndex:
+    """
+    Random access into deflated data: a gzip file (wbits=31) or the raw deflate
+    data of a zip member (wbits=-15) at [offset, end) of a file. Checkpoints are
+    (output position, input position, copy of the decompressor after it).
+    """
+
+    def __init__(self, path, offset, end, wbits):
+        self.path = path
+        self.end = end
+        self.wbits = wbits
+        self.spacing = CHECKPOINT_SPACING
+        self.checkpoints = [(0, offset, zlib.decompressobj(wbits))]
+        self.positions = [0]  # Output position of every checkpoint, for bisect
+        self.lock = threading.Lock()
+
+    def _restart_point(self, pos):
+        with self.lock:
+            out_pos, in_pos, decomp = self.checkpoints[bisect.bisect_right(self.positions, pos) - 1]
+            return out_pos, in_pos, decomp.copy()
+
+    def _add_checkpoint(self, out_pos, in_pos, decomp):
+        with self.lock:
+            if out_pos < self.positions[-1] + self.spacing:
+                return
+            self.checkpoints.append((out_pos, in_pos, decomp.copy()))
+            self.positions.append(out_pos)
+            if len(self.checkpoints) > MAX_CHECKPOINTS:
+                # Thin out to every other checkpoint and space the next ones further apart
+                self.checkpoints = self.checkpoints[::2]
+                self.positions = self.positions[::2]
+                self.spacing *= 2
+
+    def iter_from(self, pos):
+        """Yields the decompressed data from output position pos on, in chunks."""
+        out_pos, in_pos, decomp = self._restart_point(pos)
+        gzip_stream = self.wbits > 15
+        data = b""
+        with open(self.path, "rb") as f:
+            f.seek(in_pos)
+            while True:
+                if not data and in_pos < self.end:
+                    data = f.read(min(INPUT_CHUNK, self.end - in_pos))
+                    in_pos += len(data)
+                with diagnostics.timer("archive.inflate"):
+                    # Output is capped, so checkpoints stay close together on well compressed data
+                    out = decomp.decompress(data, OUTPUT_CHUNK)
+                data = decomp.unconsumed_tail
+                if gzip_stream and decomp.eof and decomp.unused_data:
+                    # A gzip file may consist of several members one after another
+                    data = decomp.unused_data
+                    decomp = zlib.decompressobj(self.wbits)
+
+                if out:
+                    if out_pos + len(out) > pos:
+                        yield out[max(0, pos - out_pos):]
+                        pos = out_pos + len(out)
+                    out_pos += len(out)
+                elif not data and (in_pos >= self.end or decomp.eof and not gzip_stream):
+                    break
+                # The decompressor has taken all input before in_pos - len(data): a restart point
+                self._add_checkpoint(out_pos, in_pos - len(data), decomp)
+
+
+class FileRange:
+    """Random access to stored (uncompressed) data at [offset, end) of a file."""
+
+    def __init__(self, path, offset, end):
+        self.path = path
+        self.offset = offset
+        self.end = end
+
+    def iter_from(self, pos):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset + pos)
+            remaining = self.end - self.offset - pos
+            while remaining > 0:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+
+class MemberBuffer:
+    """
+    Read-only view of one member: bytes [start, start + size) of a FileRange or
+    InflateIndex. Supports len(), slicing (returns bytes) and find(), which is
+    all the mail reader needs from an mmap. Decompressed blocks are cached, and
+    a sequential reader (the boundary scan) continues one inflate stream instead
+    of restarting at a checkpoint for every block.
+    """
+
+    def __init__(self, source, start, size):
+        self.source = source
+        self.start = start
+        self.size = size
+        self._blocks = OrderedDict()  # block number -> bytes, least recently used first
+        self._stream = None  # (next block number, chunk iterator, leftover bytes)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _block(self, number):
+        block = self._blocks.get(number)
+        if block is not None:
+            self._blocks.move_to_end(number)
+            return block
+
+        pos = number * BLOCK_SIZE
+        length = min(BLOCK_SIZE, self.size - pos)
+        if self._stream is not None and self._stream[0] == number:
+            _, chunks, pending = self._stream
+        else:
+            chunks, pending = self.source.iter_from(self.start + pos), b""
+
+        parts, have = [pending] if pending else [], len(pending)
+        while have < length:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            have += len(chunk)
+        data = b"".join(parts)
+        block, rest = data[:length], data[length:]
+        self._stream = (number + 1, chunks, rest)
+
+        self._blocks[number] = block
+        if len(self._blocks) > CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
+
+    def read(self, start, stop):
+        start = max(0, start)
+        stop = min(stop, self.size)
+        if start >= stop:
+            return b""
+        with self.lock:
+            first, last = start // BLOCK_SIZE, (stop - 1) // BLOCK_SIZE
+            if first == last:
+                offset = first * BLOCK_SIZE
+                return self._block(first)[start - offset:stop - offset]
+            data = b"".join(self._block(number) for number in range(first, last + 1))
+        offset = first * BLOCK_SIZE
+        return data[start - offset:stop - offset]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                raise ValueError("MemberBuffer slices must be contiguous")
+            return self.read(start, stop)
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return self.read(index, index + 1)[0]
+
+    def find(self, sub, start=0, end=None):
+        """bytes.find over the member, reading it block by block."""
+        end = self.size if end is None else min(end, self.size)
+        start = max(0, start)
+        overlap = len(sub) - 1
+        pos = start
+        while pos < end:
+            stop = min(end, (pos // BLOCK_SIZE + 1) * BLOCK_SIZE)
+            # Include the start of the next block, a match may span the boundary
+            window = self.read(pos, min(end, stop + overlap))
+            i = window.find(sub)
+            if i != -1:
+                return pos + i
+            pos = stop
+        return -1
+
+    def close(self):
+        with self.lock:
+            self._blocks.clear()
+            self._stream = None
+
+
+class _ChunkReader(io.RawIOBase):
+    """File object over a chunk iterator, limited to `size` bytes."""
+
+    def __init__(self, chunks, size):
+        self.chunks = chunks
+        self.remaining = size
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending and self.remaining > 0:
+            self.pending = next(self.chunks, b"")[:self.remaining]
+            self.remaining -= len(self.pending)
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+class ZipArchive:
+    """A .zip archive. Its central directory lists the members, no pass over the data is needed."""
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            self.infos = {info.filename: info for info in zf.infolist() if not info.is_dir()}
+        self._sources = {}
+        self.lock = threading.Lock()
+
+    def names(self):
+        return list(self.infos)
+
+    def member_size(self, member):
+        return self.infos[member].file_size
+
+    def open_stream(self, member):
+        archive = zipfile.ZipFile(self.path)
+        try:
+            # The member stream holds its own reference to the file: closing the
+            # ZipFile now releases the handle as soon as the stream is closed
+            return archive.open(member)
+        finally:
+            archive.close()
+
+    def _source(self, member):
+        """FileRange or InflateIndex of a member, shared by all its buffers."""
+        with self.lock:
+            source = self._sources.get(member)
+            if source is not None:
+                return source
+            info = self.infos[member]
+            with open(self.path, "rb") as f:
+                f.seek(info.header_offset)
+                header = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+            if header[0] != b"PK\x03\x04":
+                raise zipfile.BadZipFile(f"Bad local header of {member}")
+            data_offset = info.header_offset + _ZIP_LOCAL_HEADER.size + header[9] + header[10]
+            end = data_offset + info.compress_size
+            if info.flag_bits & 0x1:
+                raise zipfile.BadZipFile(f"{member} is encrypted")
+            if info.compress_type == zipfile.ZIP_STORED:
+                source = FileRange(self.path, data_offset, end)
+            elif info.compress_type == zipfile.ZIP_DEFLATED:
+                source = InflateIndex(self.path, data_offset, end, -zlib.MAX_WBITS)
+            else:
+                raise zipfile.BadZipFile(f"{member}: unsupported compression method {info.compress_type}")
+            self._sources[member] = source
+            return source
+
+    def open_buffer(self, member):
+        return MemberBuffer(self._source(member), 0, self.member_size(member))
+
+
+class TarGzArchive:
+    """
+    A .tgz archive: one gzip stream over the whole tar file. Listing the members
+    is a full pass over it (tar has no directory), which also takes the
+    checkpoints every member is then read through.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = InflateIndex(path, 0, os.path.getsize(path), 16 + zlib.MAX_WBITS)
+        self.members = None  # name -> (offset of the data in the tar stream, size)
+        self.lock = threading.Lock()
+
+    @diagnostics.timed("archive.list_tgz")
+    def _list(self):
+        with self.lock:
+            if self.members is None:
+                members = {}
+                stream = io.BufferedReader(_ChunkReader(self.index.iter_from(0), 1 << 62), INPUT_CHUNK)
+                with tarfile.open(fileobj=stream, mode="r|") as tar:
+                    for info in tar:
+                        if info.isfile():
+                            members[info.name] = (info.offset_data, info.size)
+                self.members = members
+            return self.members
+
+    def names(self):
+        return list(self._list())
+
+    def member_size(self, member):
+        return self._list()[member][1]
+
+    def open_stream(self, member):
+        offset, size = self._list()[member]
+        return io.BufferedReader(_ChunkReader(self.index.iter_from(offset), size), INPUT_CHUNK)
+
+    def open_buffer(self, member):
+        offset, size = self._list()[member]
+        return MemberBuffer(self.index, offset, size)
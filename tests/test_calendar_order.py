@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_calendar.parser import CalendarParser
+
+
+def event(uid, start, summary):
+    return f"BEGIN:VEVENT\r\nUID:{uid}\r\nDTSTART{start}\r\nSUMMARY:{summary}\r\nEND:VEVENT\r\n"
+
+
+class EventOrder(unittest.TestCase):
+    """Order of the events of one day returned by parse_ics."""
+
+    def parse(self, *events):
+        text = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n" + "".join(events) + "END:VCALENDAR\r\n"
+        with tempfile.NamedTemporaryFile("w", suffix=".ics", delete=False, encoding="utf-8") as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return {day: [e["summary"] for e in events] for day, events in CalendarParser.parse_ics(f.name).items()}
+
+    def test_timed_events_by_start(self):
+        days = self.parse(event(1, ":20240105T100000", "ten"), event(2, ":20240105T090000", "nine"),
+                          event(3, ":20240105T093000", "half past nine"))
+        self.assertEqual(days, {"2024-01-05": ["nine", "half past nine", "ten"]})
+
+    def test_all_day_events_keep_file_order(self):
+        days = self.parse(event(1, ";VALUE=DATE:20240105", "b"), event(2, ";VALUE=DATE:20240105", "a"))
+        self.assertEqual(days, {"2024-01-05": ["b", "a"]})
+
+    def test_mixed_all_day_and_zoned_events(self):
+        days = self.parse(event(1, ":20240105T100000Z", "ten utc"), event(2, ";VALUE=DATE:20240105", "all day"),
+                          event(3, ":20240105T080000Z", "eight utc"), event(4, ":20240106T080000Z", "next day"))
+        self.assertEqual(days, {"2024-01-05": ["all day", "eight utc", "ten utc"], "2024-01-06": ["next day"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
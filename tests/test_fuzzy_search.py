@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app_mail.store import StringTable, within_edits
+
+
+def matches(table, needle):
+    flags = table.fuzzy_ids(needle)
+    return [text for text, flag in zip(table.folded, flags) if flag]
+
+
+class ShortNeedleTypos(unittest.TestCase):
+    """One typo in a 4-6 character needle, which may touch every trigram of it."""
+
+    def setUp(self):
+        self.table = StringTable()
+        for name in ("Marco Polo", "Alice Smith", "Bob Jones"):
+            self.table.intern(name)
+        self.table.index_trigrams()
+
+    def check(self, needle, expected):
+        self.assertTrue(within_edits(needle, expected, 1))
+        self.assertEqual(matches(self.table, needle), [expected])
+
+    def test_substitution(self):
+        self.check("maxco", "marco polo")
+        self.check("alxce", "alice smith")
+        self.check("jomes", "bob jones")
+        self.check("smoth", "alice smith")
+
+    def test_deletion(self):
+        self.check("mrco", "marco polo")
+        self.check("jnes", "bob jones")
+
+    def test_insertion(self):
+        self.check("marcco", "marco polo")
+        self.check("joones", "bob jones")
+
+    def test_swap(self):
+        self.check("amrco", "marco polo")
+        self.check("jnoes", "bob jones")
+
+    def test_no_match(self):
+        self.assertEqual(matches(self.table, "xyzq"), [])
+
+    def test_strings_added_after_indexing(self):
+        self.table.intern("Carol White")
+        self.check("whxte", "carol white")
+
+
+if __name__ == "__main__":
+    unittest.main()